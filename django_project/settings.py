@@ -213,8 +213,7 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = env('STATIC_ROOT') if 'STATIC_ROOT' in os.environ else os.path.join(BASE_DIR, 'staticfiles')
 
-# WhiteNoise configuration for production static files
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# WhiteNoise configuration for production static files (see STORAGES below)
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'frontend', 'dist'),
 ]
@@ -260,6 +259,24 @@ CORS_ALLOW_CREDENTIALS = env.bool('CORS_ALLOW_CREDENTIALS') if 'CORS_ALLOW_CREDE
 MEDIA_URL = '/media/'
 MEDIA_ROOT = env('MEDIA_ROOT') if 'MEDIA_ROOT' in os.environ else os.path.join(BASE_DIR, 'media')
 
+# Keep uploaded media in Replit App Storage instead of MEDIA_ROOT, so app
+# servers share no disk. CLOUD_STORAGE_EMULATOR_ROOT points the storage
+# client at a local directory instead, for development and tests
+USE_CLOUD_STORAGE = env.bool('USE_CLOUD_STORAGE') if 'USE_CLOUD_STORAGE' in os.environ else False
+CLOUD_STORAGE_EMULATOR_ROOT = env('CLOUD_STORAGE_EMULATOR_ROOT') if 'CLOUD_STORAGE_EMULATOR_ROOT' in os.environ else ''
+
+STORAGES = {
+    'default': {
+        'BACKEND': (
+            'images.storage.ReplitAppStorage' if USE_CLOUD_STORAGE
+            else 'django.core.files.storage.FileSystemStorage'
+        ),
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Force HTTPS URLs in production
 USE_TLS = True
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
@@ -345,3 +362,116 @@ SERVER_EMAIL = env('SERVER_EMAIL') if 'SERVER_EMAIL' in os.environ else 'admin@l
 
 # Base URL for email links (verification and password reset)
 FRONTEND_URL = env('FRONTEND_URL') if 'FRONTEND_URL' in os.environ else 'http://localhost:5000'
+
+# Background image processing pool (face detection, thumbnails, Vimeo covers)
+# Keep this small: each worker holds a decoded original in memory while it runs
+IMAGE_PROCESSING_WORKERS = env.int('IMAGE_PROCESSING_WORKERS') if 'IMAGE_PROCESSING_WORKERS' in os.environ else 2
+
+# Face recognition: exemplar encodings kept per person, and how long a worker
+# may reuse its in-memory match index before reloading it from the database
+PERSON_MAX_PROTOTYPES = 4
+FACE_MATCH_INDEX_TTL = 300
+
+# Offline clustering of untagged faces (python manage.py cluster_faces)
+# Threshold uses the same 0-1 similarity scale as face matching
+FACE_CLUSTER_THRESHOLD = 0.92
+FACE_CLUSTER_BLOCK_SIZE = 1024
+FACE_CLUSTER_MIN_SIZE = 2
+
+# Face moderation: size of stored face crops (px) and padding around the box,
+# and how long the pending-queue count may be served from cache (seconds)
+FACE_CROP_SIZE = 96
+FACE_CROP_MARGIN = 0.2
+FACE_MODERATION_COUNT_TTL = 30
+
+# Face quality scoring: faces whose cheap quality score (sharpness, brightness,
+# size) lands within FACE_QUALITY_EYE_MARGIN of FACE_QUALITY_THRESHOLD also run
+# the eye cascade; everything else skips that second Haar pass
+FACE_QUALITY_THRESHOLD = 0.5
+FACE_QUALITY_EYE_MARGIN = 0.1
+
+# Face detector backend: 'haar' (default), 'lbp' (faster, lower recall) or
+# 'dnn' (needs a local model file). Unavailable backends fall back to 'haar'.
+# Compare them with: python manage.py benchmark_face_detectors <fixture_dir>
+FACE_DETECTOR_BACKEND = env('FACE_DETECTOR_BACKEND') if 'FACE_DETECTOR_BACKEND' in os.environ else 'haar'
+FACE_DETECTOR_LBP_CASCADE = env('FACE_DETECTOR_LBP_CASCADE') if 'FACE_DETECTOR_LBP_CASCADE' in os.environ else ''
+FACE_DETECTOR_DNN_MODEL = env('FACE_DETECTOR_DNN_MODEL') if 'FACE_DETECTOR_DNN_MODEL' in os.environ else ''
+FACE_DETECTOR_DNN_CONFIG = env('FACE_DETECTOR_DNN_CONFIG') if 'FACE_DETECTOR_DNN_CONFIG' in os.environ else ''
+FACE_DETECTOR_DNN_CONFIDENCE = 0.6
+
+# Photos-of-a-person pages (/api/people/{id}/images/) are cached for these
+# person ids, typically the couple and their parents; comma-separated in env
+PERSON_IMAGES_CACHED_PEOPLE = env.list('PERSON_IMAGES_CACHED_PEOPLE', cast=int) if 'PERSON_IMAGES_CACHED_PEOPLE' in os.environ else []
+PERSON_IMAGES_CACHE_TTL = 300
+
+# Face pipeline benchmarks (python manage.py benchmark_faces); the baseline
+# is machine-specific and is not committed
+FACE_BENCHMARK_BASELINE = env('FACE_BENCHMARK_BASELINE') if 'FACE_BENCHMARK_BASELINE' in os.environ else str(BASE_DIR / 'benchmarks' / 'face_baseline.json')
+FACE_BENCHMARK_REGRESSION_THRESHOLD = 0.25
+
+# Stored face encodings: 'float32' (default) or 'float16' (half the size,
+# ample precision for cosine matching); both formats are always readable
+FACE_ENCODING_DTYPE = 'float32'
+
+# Approximate nearest-neighbour face index for very large events
+# (python manage.py build_face_index). Used only once it holds at least
+# FACE_ANN_MIN_FACES encodings; raise FACE_ANN_NPROBE for better recall
+FACE_ANN_ENABLED = env.bool('FACE_ANN_ENABLED') if 'FACE_ANN_ENABLED' in os.environ else False
+FACE_ANN_INDEX_DIR = env('FACE_ANN_INDEX_DIR') if 'FACE_ANN_INDEX_DIR' in os.environ else str(BASE_DIR / 'face_index')
+FACE_ANN_MIN_FACES = 20000
+FACE_ANN_NPROBE = 8
+FACE_ANN_CANDIDATES = 200
+
+# Worker processes used by python manage.py reencode_faces
+FACE_REENCODE_WORKERS = env.int('FACE_REENCODE_WORKERS') if 'FACE_REENCODE_WORKERS' in os.environ else 2
+
+# Bytes fetched per ranged read when streaming files from cloud storage
+# (/api/files/...); bounds per-request worker memory
+FILE_STREAM_CHUNK_SIZE = env.int('FILE_STREAM_CHUNK_SIZE') if 'FILE_STREAM_CHUNK_SIZE' in os.environ else 256 * 1024
+
+# Hand authorized /api/files/ downloads to the front-end proxy instead of
+# streaming them through a worker: '' (off), 'x-accel-redirect' (nginx, see
+# deployment/nginx.conf) or 'x-sendfile' (local files only). Remote objects
+# are fetched by nginx through presigned URLs valid for the TTL below.
+# Local files are only offloaded from under PROTECTED_FILE_OFFLOAD_ROOT, which
+# must be the directory nginx's /_protected/local/ location aliases
+# (/var/www/wedding-gallery/protected/ in deployment/nginx.conf); change both together.
+PROTECTED_FILE_OFFLOAD = env('PROTECTED_FILE_OFFLOAD') if 'PROTECTED_FILE_OFFLOAD' in os.environ else ''
+PROTECTED_FILE_OFFLOAD_LOCATION = '/_protected/'
+PROTECTED_FILE_OFFLOAD_ROOT = env('PROTECTED_FILE_OFFLOAD_ROOT') if 'PROTECTED_FILE_OFFLOAD_ROOT' in os.environ else ''
+PROTECTED_FILE_SIGNED_URL_TTL = 300
+
+# Seconds cloud object metadata (size, etag, ACL policy) is cached for
+# /api/files/; ACL changes made through this app invalidate it immediately
+FILE_METADATA_CACHE_TTL = 60
+
+# Look objects missing from the StoredObject index up in storage. Turn off
+# once `python manage.py reconcile_stored_objects` has backfilled it, so
+# unknown paths are answered without a storage round trip
+STORED_OBJECT_METADATA_FALLBACK = env.bool('STORED_OBJECT_METADATA_FALLBACK') if 'STORED_OBJECT_METADATA_FALLBACK' in os.environ else True
+
+# Uploads to cloud storage: files larger than the chunk size use a resumable
+# session; spooled uploads from the parallel threshold up are sent as a
+# multipart upload on several threads
+CLOUD_STORAGE_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+CLOUD_STORAGE_PARALLEL_UPLOAD_THRESHOLD = 64 * 1024 * 1024
+CLOUD_STORAGE_PARALLEL_CHUNK_SIZE = 32 * 1024 * 1024
+CLOUD_STORAGE_UPLOAD_WORKERS = env.int('CLOUD_STORAGE_UPLOAD_WORKERS') if 'CLOUD_STORAGE_UPLOAD_WORKERS' in os.environ else 4
+
+# Read-through cache of cloud objects on local disk (off while
+# OBJECT_CACHE_DIR is empty). Least recently used files are evicted beyond
+# OBJECT_CACHE_MAX_BYTES; objects matching the pinned patterns (gallery
+# thumbnails and face crops) go last. Set PROTECTED_FILE_OFFLOAD_ROOT to the
+# same directory to let nginx send cached files
+OBJECT_CACHE_DIR = env('OBJECT_CACHE_DIR') if 'OBJECT_CACHE_DIR' in os.environ else ''
+OBJECT_CACHE_MAX_BYTES = env.int('OBJECT_CACHE_MAX_BYTES') if 'OBJECT_CACHE_MAX_BYTES' in os.environ else 10 * 1024 ** 3
+OBJECT_CACHE_MAX_OBJECT_SIZE = 100 * 1024 ** 2
+OBJECT_CACHE_PINNED_PATTERNS = ['*/thumbnails/*', '*/faces/*']
+
+# Direct-to-storage uploads (/api/uploads/): presigned PUT URLs are valid for
+# DIRECT_UPLOAD_URL_TTL seconds and the upload must be completed within
+# DIRECT_UPLOAD_SESSION_TTL; abandoned uploads are removed by
+# `python manage.py expire_upload_sessions`
+DIRECT_UPLOAD_URL_TTL = 900
+DIRECT_UPLOAD_SESSION_TTL = 3600
+DIRECT_UPLOAD_MAX_SIZE = env.int('DIRECT_UPLOAD_MAX_SIZE') if 'DIRECT_UPLOAD_MAX_SIZE' in os.environ else 200 * 1024 * 1024
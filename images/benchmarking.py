@@ -0,0 +1,238 @@
+"""
+Helpers shared by the benchmark management commands
+"""
+
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .face_recognition_utils import box_iou
+
+# Synthetic face-pipeline cases: (name, width, height, face count)
+FACE_BENCHMARK_CASES = [
+    ('640x480_1face', 640, 480, 1),
+    ('1280x720_3faces', 1280, 720, 3),
+    ('1920x1080_8faces', 1920, 1080, 8),
+    ('4032x3024_2faces', 4032, 3024, 2),
+]
+
+
+def summarize_latencies(seconds: Sequence[float]) -> Dict[str, float]:
+    """
+    Summarize per-call latencies
+
+    Returns:
+        Dict with count, mean and p50/p95/p99 in milliseconds
+    """
+    if not len(seconds):
+        return {'count': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0}
+
+    millis = np.asarray(seconds, dtype=np.float64) * 1000.0
+    p50, p95, p99 = np.percentile(millis, [50, 95, 99])
+    return {
+        'count': int(len(millis)),
+        'mean_ms': float(millis.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+    }
+
+
+def match_detections(truth: List[Sequence[float]], detections: List[Sequence[float]],
+                     iou_threshold: float = 0.5) -> int:
+    """
+    Greedily match detections to ground-truth boxes, best IoU first
+
+    Returns:
+        Number of ground-truth boxes matched by a detection at iou_threshold or above
+    """
+    pairs = sorted(
+        (
+            (box_iou(t, d), ti, di)
+            for ti, t in enumerate(truth)
+            for di, d in enumerate(detections)
+        ),
+        reverse=True
+    )
+
+    used_truth, used_detections = set(), set()
+    for iou, ti, di in pairs:
+        if iou < iou_threshold:
+            break
+        if ti in used_truth or di in used_detections:
+            continue
+        used_truth.add(ti)
+        used_detections.add(di)
+
+    return len(used_truth)
+
+
+def synthesize_face_image(width: int, height: int, face_count: int,
+                          seed: int = 0) -> Tuple[np.ndarray, List[List[int]]]:
+    """
+    Draw a reproducible test image with simple face-like figures
+
+    Faces are shaded ovals with eyes and a mouth on a noisy background. They
+    give the detector realistic work at a given resolution; whether the
+    cascade actually fires on them does not matter for timing.
+
+    Returns:
+        Tuple of (BGR image, list of [x, y, width, height] face boxes)
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    image = rng.integers(60, 200, size=(height, width, 3), dtype=np.uint8)
+    image = cv2.GaussianBlur(image, (0, 0), 3)
+
+    boxes = []
+    columns = max(1, int(np.ceil(np.sqrt(face_count))))
+    rows = max(1, int(np.ceil(face_count / columns)))
+    cell_w, cell_h = width // columns, height // rows
+    side = int(min(cell_w, cell_h) * 0.6)
+
+    for i in range(face_count):
+        cx = (i % columns) * cell_w + cell_w // 2
+        cy = (i // columns) * cell_h + cell_h // 2
+        skin = tuple(int(c) for c in rng.integers(120, 220, size=3))
+
+        cv2.ellipse(image, (cx, cy), (side // 2, int(side * 0.6)), 0, 0, 360, skin, -1)
+        for dx in (-side // 5, side // 5):
+            cv2.circle(image, (cx + dx, cy - side // 8), max(2, side // 14), (30, 30, 30), -1)
+        cv2.ellipse(image, (cx, cy + side // 4), (side // 5, max(2, side // 16)), 0, 0, 180, (40, 40, 120), -1)
+
+        boxes.append([cx - side // 2, cy - int(side * 0.6), side, int(side * 1.2)])
+
+    return image, boxes
+
+
+def run_face_benchmarks(repeat: int = 5, cases: Optional[Sequence] = None,
+                        fixture_dir: Optional[str] = None, candidates: int = 1000,
+                        seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """
+    Time the face pipeline on synthetic (and optionally fixture) images
+
+    Covers detect_faces_in_image per stage, _generate_face_encoding,
+    compare_faces and find_similar_faces.
+
+    Args:
+        repeat: Timed runs of each benchmark
+        cases: (name, width, height, face count) tuples, default FACE_BENCHMARK_CASES
+        fixture_dir: Optional directory of real photos to run through detection too
+        candidates: Candidate encodings for find_similar_faces
+        seed: Seed for the synthetic images and encodings
+
+    Returns:
+        Dict of benchmark name -> summarize_latencies() result
+    """
+    import cv2
+    from .face_recognition_utils import FaceRecognitionService, ENCODING_SIZE
+
+    service = FaceRecognitionService()
+    results = {}
+
+    def time_calls(name, func):
+        func()  # warm-up
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - started)
+        results[name] = summarize_latencies(latencies)
+
+    # Full detection pipeline, broken down per stage
+    images = []
+    for name, width, height, face_count in (cases or FACE_BENCHMARK_CASES):
+        image, _ = synthesize_face_image(width, height, face_count, seed=seed)
+        images.append((f'synthetic/{name}', image))
+
+    if fixture_dir:
+        for filename in sorted(os.listdir(fixture_dir)):
+            image = cv2.imread(os.path.join(fixture_dir, filename))
+            if image is not None:
+                images.append((f'fixture/{filename}', image))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, image in images:
+            path = os.path.join(tmp, 'bench.jpg')
+            cv2.imwrite(path, image)
+
+            service.detect_faces_in_image(path)  # warm-up
+            stages = {}
+            for _ in range(repeat):
+                timings = {}
+                started = time.perf_counter()
+                service.detect_faces_in_image(path, timings=timings)
+                stages.setdefault('total', []).append(time.perf_counter() - started)
+                for stage, value in timings.items():
+                    if isinstance(value, float):
+                        stages.setdefault(stage, []).append(value)
+
+            for stage, latencies in stages.items():
+                results[f'detect/{name}/{stage}'] = summarize_latencies(latencies)
+
+    # Encoding cost by face size
+    rng = np.random.default_rng(seed)
+    for size in (64, 128, 256):
+        face_roi = rng.integers(0, 256, size=(size, size), dtype=np.uint8)
+        time_calls(f'encode/{size}px', lambda roi=face_roi: service._generate_face_encoding(roi))
+
+    # Matching
+    target = rng.random(ENCODING_SIZE).tolist()
+    other = rng.random(ENCODING_SIZE).tolist()
+    pool = [(i, rng.random(ENCODING_SIZE).tolist()) for i in range(candidates)]
+
+    time_calls('compare_faces', lambda: service.compare_faces(target, other))
+    time_calls(f'find_similar_faces/{candidates}', lambda: service.find_similar_faces(target, pool))
+
+    return results
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Dict[str, float]]]:
+    """Load saved benchmark results, or None if there is no baseline yet"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results: Dict[str, Dict[str, float]], path: str):
+    """Write benchmark results as the new baseline"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def find_regressions(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                     threshold: float = 0.25, metric: str = 'p50_ms',
+                     min_ms: float = 0.05) -> List[Dict]:
+    """
+    Compare results to a baseline
+
+    A benchmark regresses when its metric grows by more than threshold
+    (0.25 = 25%). Timings where both values are under min_ms are treated as
+    noise. Benchmarks missing from either side are ignored.
+
+    Returns:
+        List of {'name', 'baseline', 'current', 'change'} dicts, worst first
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or metric not in previous or metric not in current:
+            continue
+
+        before, after = previous[metric], current[metric]
+        if max(before, after) < min_ms:
+            continue
+
+        change = (after - before) / before if before > 0 else float('inf')
+        if change > threshold:
+            regressions.append({'name': name, 'baseline': before, 'current': after, 'change': change})
+
+    regressions.sort(key=lambda r: r['change'], reverse=True)
+    return regressions
@@ -0,0 +1,111 @@
+"""
+Verification of direct-to-storage uploads
+Checking a completed upload against its declared SHA-256 means reading the
+whole object back from storage, which can outlast a web worker's timeout for
+large originals. The completion endpoint therefore only checks the size and
+queues a 'verify_upload' ProcessingJob; the session stays 'verifying' until
+the job has hashed the object and created the Image.
+"""
+
+import hashlib
+import logging
+import os
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import ContentBlob, Image, StoredObject, UploadSession
+from .storage import ReplitAppStorage, get_blob_metadata, iter_blob_chunks
+
+logger = logging.getLogger(__name__)
+
+
+class UploadRejected(Exception):
+    """The stored object does not match what the client declared"""
+
+
+def verify_direct_upload(session):
+    """
+    Hash a session's stored object and create its Image
+
+    The hash is computed from ranged reads of the object, one
+    FILE_STREAM_CHUNK_SIZE chunk in memory at a time. A mismatching upload
+    is deleted and the session marked failed; a photo that is already
+    stored is linked to the existing copy and the new object dropped.
+
+    Returns:
+        The created Image
+
+    Raises:
+        UploadRejected: if the object does not match the declaration
+    """
+    storage = ReplitAppStorage()
+    bucket_name, object_name = storage._get_bucket_and_object_name(storage._object_path(session.file_name))
+
+    def reject(error):
+        storage.delete(session.file_name)
+        session.fail(error)
+        raise UploadRejected(error)
+
+    metadata = get_blob_metadata(bucket_name, object_name)
+    if metadata is None:
+        reject('The uploaded file is gone')
+    if metadata['size'] != session.expected_size:
+        reject(f"Uploaded {metadata['size']} bytes, expected {session.expected_size}")
+
+    blob = storage.storage_client.bucket(bucket_name).blob(object_name, generation=metadata['generation'])
+    digest = hashlib.sha256()
+    for chunk in iter_blob_chunks(blob, end=metadata['size'] - 1):
+        digest.update(chunk)
+    if digest.hexdigest() != session.expected_sha256:
+        reject('Uploaded file does not match the declared SHA-256')
+
+    image = Image(
+        title=session.title or os.path.splitext(session.original_filename)[0][:200],
+        description=session.description,
+        uploader=session.user,
+        image_file=session.file_name
+    )
+    image.attach_content(ContentBlob.acquire(session.expected_sha256, metadata['size']))
+    image.save()
+
+    if image.image_file.name != session.file_name:
+        # The same photo was already stored; keep that copy only
+        storage.delete(session.file_name)
+    else:
+        # Served to signed-in guests like originals saved through Django
+        metadata = storage._set_object_acl_policy(bucket_name, object_name, '')
+        StoredObject.record(bucket_name, object_name, metadata)
+
+    session.status = 'completed'
+    session.image = image
+    session.completed_at = timezone.now()
+    session.save(update_fields=['status', 'image', 'completed_at'])
+
+    # Invalidate cache when new image is created
+    cache.clear()
+    return image
+
+
+def run_upload_verification_job(job):
+    """
+    Processing-pool handler for 'verify_upload' jobs
+
+    A rejected upload fails the job with the reason. Any other error puts
+    the session back to 'pending', so the client can complete it again.
+    """
+    session = UploadSession.objects.select_related('user').get(pk=job.options['upload_id'])
+    try:
+        image = verify_direct_upload(session)
+    except UploadRejected:
+        raise
+    except Exception as e:
+        logger.error(f'Failed to verify direct upload {session.pk}: {str(e)}')
+        UploadSession.objects.filter(pk=session.pk, status='verifying').update(status='pending')
+        raise
+
+    return {
+        'upload_id': str(session.id),
+        'image_id': image.pk,
+        'image_url': image.image_file.url
+    }
@@ -0,0 +1,218 @@
+"""
+Offline clustering of untagged face encodings
+Groups unknown faces across the gallery into proposed people so admins can
+name a whole cluster at once instead of tagging faces one by one.
+"""
+
+import logging
+from typing import Dict, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def cluster_encodings(encodings: np.ndarray, threshold: float = 0.92,
+                      block_size: int = 1024, min_cluster_size: int = 2,
+                      refine_passes: int = 1) -> np.ndarray:
+    """
+    Cluster L2-normalizable encodings with blocked leader clustering
+
+    Faces are streamed in blocks of block_size. Each block is scored against
+    the current cluster centroids in one matrix product; faces above the
+    threshold join their best cluster, the rest seed new clusters greedily
+    within the block. Refinement passes then reassign every face to its best
+    final centroid. Peak memory is O(block_size * clusters), never O(n^2).
+
+    Args:
+        encodings: (n, d) array of face encodings
+        threshold: Similarity on the compare_faces 0-1 scale needed to join a cluster
+        block_size: Number of faces scored per matrix product
+        min_cluster_size: Clusters smaller than this are discarded as noise
+        refine_passes: Number of reassignment passes over the data
+
+    Returns:
+        (n,) int array of cluster labels, -1 for faces left unclustered
+    """
+    n = len(encodings)
+    labels = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return labels
+
+    data = _normalize(np.asarray(encodings, dtype=np.float32))
+    dim = data.shape[1]
+
+    # compare_faces maps cosine from [-1, 1] onto [0, 1]
+    cosine_threshold = threshold * 2.0 - 1.0
+
+    sums = np.zeros((max(64, n // 16), dim), dtype=np.float32)
+    k = 0
+
+    def new_cluster():
+        nonlocal sums, k
+        if k == len(sums):
+            sums = np.concatenate([sums, np.zeros_like(sums)])
+        k += 1
+        return k - 1
+
+    for start in range(0, n, block_size):
+        block = data[start:start + block_size]
+        block_labels = np.full(len(block), -1, dtype=np.int64)
+
+        if k:
+            centroids = _normalize(sums[:k].copy())
+            similarity = block @ centroids.T
+            best = similarity.argmax(axis=1)
+            best_score = similarity[np.arange(len(block)), best]
+            joined = best_score >= cosine_threshold
+            block_labels[joined] = best[joined]
+
+        # Greedily seed new clusters from faces that matched nothing
+        remaining = np.flatnonzero(block_labels == -1)
+        if len(remaining):
+            local = block[remaining] @ block[remaining].T
+            unassigned = np.ones(len(remaining), dtype=bool)
+            for i in range(len(remaining)):
+                if not unassigned[i]:
+                    continue
+                members = unassigned & (local[i] >= cosine_threshold)
+                members[i] = True
+                block_labels[remaining[members]] = new_cluster()
+                unassigned &= ~members
+
+        np.add.at(sums, block_labels, block)
+        labels[start:start + len(block)] = block_labels
+
+    for _ in range(refine_passes):
+        centroids = _normalize(sums[:k].copy())
+        for start in range(0, n, block_size):
+            block = data[start:start + block_size]
+            similarity = block @ centroids.T
+            best = similarity.argmax(axis=1)
+            best_score = similarity[np.arange(len(block)), best]
+            labels[start:start + len(block)] = np.where(best_score >= cosine_threshold, best, -1)
+
+        assigned = labels >= 0
+        sums[:k] = 0
+        np.add.at(sums, labels[assigned], data[assigned])
+
+    # Drop noise clusters and renumber densely
+    sizes = np.bincount(labels[labels >= 0], minlength=k)
+    keep = sizes >= min_cluster_size
+    remap = np.full(k, -1, dtype=np.int64)
+    remap[keep] = np.arange(keep.sum())
+    return np.where(labels >= 0, remap[np.maximum(labels, 0)], -1)
+
+
+def load_untagged_encodings() -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load every untagged face encoding into a preallocated float32 matrix
+
+    Faces in clusters a reviewer dismissed are left out, so they are not
+    proposed again.
+
+    Returns:
+        Tuple of (face_tag_ids, encodings)
+    """
+    from .models import FaceTag
+    from .face_recognition_utils import ENCODING_SIZE, ENCODING_ALGORITHM_VERSION, unpack_encoding
+
+    queryset = FaceTag.objects.filter(
+        person__isnull=True,
+        face_encoding__isnull=False,
+        encoding_version=ENCODING_ALGORITHM_VERSION
+    ).exclude(status='rejected').exclude(cluster__status='dismissed').order_by('id')
+
+    total = queryset.count()
+    ids = np.empty(total, dtype=np.int64)
+    encodings = np.empty((total, ENCODING_SIZE), dtype=np.float32)
+
+    n = 0
+    for face_tag_id, blob in queryset.values_list('id', 'face_encoding').iterator(chunk_size=2000):
+        encoding = unpack_encoding(blob)
+        if n == total or encoding is None or len(encoding) != ENCODING_SIZE:
+            continue
+        ids[n] = face_tag_id
+        encodings[n] = encoding
+        n += 1
+
+    return ids[:n], encodings[:n]
+
+
+def cluster_untagged_faces(threshold=None, block_size=None, min_cluster_size=None) -> Dict:
+    """
+    Cluster all untagged faces and store the result as proposed FaceClusters
+
+    Previously proposed (unnamed) clusters are replaced; clusters an admin
+    has already named or dismissed are left alone, with their faces.
+
+    Returns:
+        Summary dict with face and cluster counts
+    """
+    from .models import FaceTag, FaceCluster
+
+    if threshold is None:
+        threshold = getattr(settings, 'FACE_CLUSTER_THRESHOLD', 0.92)
+    if block_size is None:
+        block_size = getattr(settings, 'FACE_CLUSTER_BLOCK_SIZE', 1024)
+    if min_cluster_size is None:
+        min_cluster_size = getattr(settings, 'FACE_CLUSTER_MIN_SIZE', 2)
+
+    ids, encodings = load_untagged_encodings()
+    labels = cluster_encodings(
+        encodings,
+        threshold=threshold,
+        block_size=block_size,
+        min_cluster_size=min_cluster_size
+    )
+
+    cluster_count = int(labels.max()) + 1 if len(labels) else 0
+
+    # Sort once so each cluster's members are a contiguous slice
+    order = np.argsort(labels, kind='stable')
+    bounds = np.searchsorted(labels[order], np.arange(cluster_count + 1))
+    members = [order[bounds[label]:bounds[label + 1]] for label in range(cluster_count)]
+
+    with transaction.atomic():
+        FaceCluster.objects.filter(status='proposed').delete()
+
+        clusters = FaceCluster.objects.bulk_create([
+            FaceCluster(
+                size=len(member_rows),
+                centroid=_normalize(encodings[member_rows].mean(axis=0, keepdims=True))[0].tolist(),
+            )
+            for member_rows in members
+        ])
+
+        FaceTag.objects.bulk_update(
+            [
+                FaceTag(id=face_tag_id, cluster=cluster)
+                for cluster, member_rows in zip(clusters, members)
+                for face_tag_id in ids[member_rows].tolist()
+            ],
+            ['cluster'],
+            batch_size=1000
+        )
+
+    clustered = int((labels >= 0).sum())
+    logger.info(f"Clustered {clustered} of {len(ids)} untagged faces into {cluster_count} proposed people")
+
+    return {
+        'face_count': len(ids),
+        'clustered_face_count': clustered,
+        'cluster_count': cluster_count,
+        'threshold': threshold,
+    }
+
+
+def run_face_clustering_job(job):
+    """Processing-pool handler for 'cluster_faces' jobs"""
+    return cluster_untagged_faces()
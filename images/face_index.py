@@ -0,0 +1,402 @@
+"""
+Approximate nearest-neighbour index over face encodings
+An IVF-style (inverted file) index in pure NumPy: encodings are bucketed by
+their nearest k-means centroid, and a query only scans the nprobe closest
+buckets. Vectors live in memory-mapped .npy files so large indexes load
+instantly and share pages between worker processes.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10,
+                    sample_size: int = 65536, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means on (a sample of) L2-normalized vectors
+
+    Returns:
+        (nlist, d) float32 array of unit-length centroids; (0, d) when
+        there are no vectors to train on
+    """
+    if not len(vectors):
+        return np.empty((0, vectors.shape[-1]), dtype=np.float32)
+
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+    nlist = max(1, min(nlist, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = (vectors @ centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+
+        # Re-seed empty buckets from random points so every list gets used
+        empty = np.flatnonzero(np.bincount(assignments, minlength=nlist) == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty))]
+        centroids = _normalize(sums)
+
+    return centroids
+
+
+def _default_nlist(count: int) -> int:
+    return int(np.clip(4 * np.sqrt(count), 1, 4096))
+
+
+class IVFFaceIndex:
+    """
+    Inverted-file index of face encodings, persisted under a directory
+
+    Files:
+        meta.json       count, capacity, dim and format version
+        centroids.npy   (nlist, d) coarse quantizer
+        vectors.npy     (capacity, d) unit-length float32 encodings (memory-mapped)
+        ids.npy         (capacity,) FaceTag ids (memory-mapped)
+        lists.npy       (capacity,) bucket of each row (memory-mapped)
+
+    Rows are appended, so inserts never rewrite existing data; capacity
+    doubles when full. Writers in different processes are serialized with a
+    file lock, and every file is written to a temporary name and renamed
+    into place under it. Deleted faces are filtered out by the caller and
+    dropped at the next rebuild. An index built from no encodings has no
+    centroids until the first add trains them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.centroids = None
+        self.vectors = None
+        self.ids = None
+        self.lists = None
+        self.count = 0
+        self._meta_mtime = None
+        self._order = None
+        self._offsets = None
+        self._lock = threading.Lock()
+
+    # Construction and persistence
+
+    @classmethod
+    def build(cls, path: str, ids: np.ndarray, vectors: np.ndarray, nlist: Optional[int] = None,
+              iterations: int = 10, seed: int = 0) -> 'IVFFaceIndex':
+        """Train a new index on the given encodings and write it to path"""
+        vectors = _normalize(vectors)
+        nlist = min(nlist or _default_nlist(len(vectors)), max(1, len(vectors)))
+
+        index = cls(path)
+        os.makedirs(path, exist_ok=True)
+        centroids = train_centroids(vectors, nlist, iterations=iterations, seed=seed)
+
+        with index._write_lock():
+            index._save_centroids(centroids)
+            index._allocate(max(1024, len(vectors)), vectors.shape[1])
+            if len(vectors):
+                index._append(
+                    np.asarray(ids, dtype=np.int64),
+                    vectors,
+                    (vectors @ centroids.T).argmax(axis=1).astype(np.int32)
+                )
+        return index
+
+    @classmethod
+    def load(cls, path: str) -> Optional['IVFFaceIndex']:
+        """Open a persisted index (memory-mapped), or None if there is none"""
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_FORMAT_VERSION:
+            logger.warning(f"Ignoring face index at {path} with unsupported version {meta.get('version')}")
+            return None
+
+        index = cls(path)
+        index._open_arrays(meta)
+        return index
+
+    def _open_arrays(self, meta):
+        # Centroids are reloaded too, in case the index was rebuilt meanwhile
+        self.centroids = np.load(os.path.join(self.path, 'centroids.npy'))
+        self.vectors = np.load(os.path.join(self.path, 'vectors.npy'), mmap_mode='r+')
+        self.ids = np.load(os.path.join(self.path, 'ids.npy'), mmap_mode='r+')
+        self.lists = np.load(os.path.join(self.path, 'lists.npy'), mmap_mode='r+')
+        self.count = meta['count']
+        self._meta_mtime = os.stat(os.path.join(self.path, 'meta.json')).st_mtime_ns
+        self._order = None
+
+    def refresh(self):
+        """Pick up rows appended by other processes since this index was opened"""
+        meta_path = os.path.join(self.path, 'meta.json')
+        try:
+            mtime = os.stat(meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._meta_mtime:
+            return
+
+        with self._lock:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['count'] != self.count or meta['capacity'] != len(self.ids):
+                self._open_arrays(meta)
+            else:
+                self._meta_mtime = mtime
+
+    @contextmanager
+    def _write_lock(self):
+        """Exclusive lock shared by every process writing to this index"""
+        with open(os.path.join(self.path, 'write.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save_centroids(self, centroids: np.ndarray):
+        """Replace the coarse quantizer; callers hold the write lock"""
+        final_path = os.path.join(self.path, 'centroids.npy')
+        with open(final_path + '.tmp', 'wb') as f:
+            np.save(f, centroids)
+        os.replace(final_path + '.tmp', final_path)
+        self.centroids = centroids
+        self._order = None
+
+    def _allocate(self, capacity: int, dim: int):
+        """Create (or grow into) memory-mapped arrays of the given capacity"""
+        new_arrays = {}
+        for name, shape, dtype in (
+            ('vectors', (capacity, dim), np.float32),
+            ('ids', (capacity,), np.int64),
+            ('lists', (capacity,), np.int32),
+        ):
+            tmp_path = os.path.join(self.path, f'{name}.npy.tmp')
+            array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+            old = getattr(self, name)
+            if old is not None and self.count:
+                array[:self.count] = old[:self.count]
+            array.flush()
+            new_arrays[name] = (tmp_path, array)
+
+        for name, (tmp_path, _) in new_arrays.items():
+            final_path = os.path.join(self.path, f'{name}.npy')
+            os.replace(tmp_path, final_path)
+            setattr(self, name, np.load(final_path, mmap_mode='r+'))
+        new_arrays.clear()
+
+        self._write_meta()
+
+    def _write_meta(self):
+        meta_path = os.path.join(self.path, 'meta.json')
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({
+                'version': INDEX_FORMAT_VERSION,
+                'count': self.count,
+                'capacity': len(self.ids),
+                'dim': self.vectors.shape[1],
+                'nlist': len(self.centroids),
+            }, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        self._meta_mtime = os.stat(meta_path).st_mtime_ns
+
+    # Inserts and search
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def dim(self) -> int:
+        return self.centroids.shape[1]
+
+    def add(self, ids, vectors):
+        """Append encodings to the index and persist them"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+
+        vectors = _normalize(vectors)
+
+        with self._write_lock():
+            # Another process may have appended (or rebuilt) since we opened the files
+            self.refresh()
+            if not len(self.centroids):
+                self._save_centroids(train_centroids(vectors, _default_nlist(len(vectors))))
+            buckets = (vectors @ self.centroids.T).argmax(axis=1).astype(np.int32)
+            self._append(ids, vectors, buckets)
+
+    def _append(self, ids, vectors, buckets):
+        with self._lock:
+            needed = self.count + len(ids)
+            if needed > len(self.ids):
+                self._allocate(max(needed, len(self.ids) * 2), self.dim)
+
+            rows = slice(self.count, needed)
+            self.vectors[rows] = vectors
+            self.ids[rows] = ids
+            self.lists[rows] = buckets
+            for array in (self.vectors, self.ids, self.lists):
+                array.flush()
+
+            self.count = needed
+            self._order = None
+            self._write_meta()
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Row numbers grouped by bucket, plus each bucket's start offset"""
+        with self._lock:
+            if self._order is None:
+                lists = np.asarray(self.lists[:self.count])
+                self._order = np.argsort(lists, kind='stable')
+                self._offsets = np.searchsorted(lists[self._order], np.arange(len(self.centroids) + 1))
+            return self._order, self._offsets
+
+    def search(self, queries, k: int = 10, nprobe: int = 8) -> List[List[Tuple[int, float]]]:
+        """
+        Approximate top-k search
+
+        Args:
+            queries: (q, d) array of encodings
+            k: Results per query
+            nprobe: Buckets scanned per query; higher means better recall and slower search
+
+        Returns:
+            One list of (face_tag_id, similarity) per query, best first, with
+            similarity on the compare_faces 0-1 scale
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        if not self.count or not len(self.centroids):
+            return [[] for _ in queries]
+
+        order, offsets = self._inverted_lists()
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+
+        results = []
+        for query, buckets in zip(queries, probes):
+            rows = np.concatenate([order[offsets[b]:offsets[b + 1]] for b in buckets])
+            if not len(rows):
+                results.append([])
+                continue
+
+            rows.sort()  # sequential reads from the memory map
+            scores = self.vectors[rows] @ query
+            top = np.argsort(-scores)[:k]
+            results.append([
+                (int(self.ids[rows[i]]), float((scores[i] + 1.0) / 2.0))
+                for i in top
+            ])
+
+        return results
+
+
+def exact_search(ids: np.ndarray, vectors: np.ndarray, queries, k: int = 10) -> List[List[Tuple[int, float]]]:
+    """Brute-force top-k cosine search, the ground truth for recall measurements"""
+    vectors = _normalize(vectors)
+    queries = _normalize(np.atleast_2d(queries))
+    similarity = queries @ vectors.T
+
+    results = []
+    for scores in similarity:
+        top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+        top = top[np.argsort(-scores[top])]
+        results.append([(int(ids[i]), float((scores[i] + 1.0) / 2.0)) for i in top])
+    return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_face_index_path() -> str:
+    return getattr(settings, 'FACE_ANN_INDEX_DIR', os.path.join(settings.BASE_DIR, 'face_index'))
+
+
+def get_face_index() -> Optional[IVFFaceIndex]:
+    """
+    Return the shared ANN index if it is enabled and has been built
+
+    Returns None (callers fall back to exact search) when FACE_ANN_ENABLED
+    is off, no index exists yet, or it holds fewer than FACE_ANN_MIN_FACES.
+    """
+    global _index
+
+    if not getattr(settings, 'FACE_ANN_ENABLED', False):
+        return None
+
+    with _index_lock:
+        if _index is None:
+            _index = IVFFaceIndex.load(get_face_index_path())
+
+    if _index is None:
+        return None
+
+    _index.refresh()
+    if len(_index) < getattr(settings, 'FACE_ANN_MIN_FACES', 20000):
+        return None
+    return _index
+
+
+def build_face_index(nlist: Optional[int] = None) -> IVFFaceIndex:
+    """Rebuild the ANN index from every stored face encoding"""
+    from .models import FaceTag
+    from .face_recognition_utils import unpack_encodings, ENCODING_ALGORITHM_VERSION
+
+    global _index
+
+    rows = list(FaceTag.objects.filter(
+        face_encoding__isnull=False,
+        encoding_version=ENCODING_ALGORITHM_VERSION
+    ).exclude(
+        status='rejected'
+    ).order_by('id').values_list('id', 'face_encoding').iterator(chunk_size=2000))
+
+    vectors, kept = unpack_encodings([blob for _, blob in rows])
+    ids = np.asarray([rows[i][0] for i in kept], dtype=np.int64)
+
+    index = IVFFaceIndex.build(get_face_index_path(), ids, vectors, nlist=nlist)
+    with _index_lock:
+        _index = index
+    return index
+
+
+def add_faces_to_index(face_tag_ids, blobs):
+    """Incrementally insert newly stored encodings, if an index exists"""
+    from .face_recognition_utils import unpack_encodings
+
+    if not getattr(settings, 'FACE_ANN_ENABLED', False):
+        return
+
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = IVFFaceIndex.load(get_face_index_path())
+    if _index is None:
+        return
+
+    face_tag_ids = list(face_tag_ids)
+    vectors, kept = unpack_encodings(blobs, _index.dim)
+    if len(kept):
+        _index.add([face_tag_ids[i] for i in kept], vectors)
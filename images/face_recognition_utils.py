@@ -7,36 +7,132 @@ import cv2
 import numpy as np
 import json
 import os
+import threading
+import time
 from PIL import Image as PILImage
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
 from typing import List, Tuple, Optional, Dict
 import logging
 
+from .face_detectors import get_face_detector
+from .face_index import add_faces_to_index, get_face_index
+
 logger = logging.getLogger(__name__)
 
+# Length of the vector produced by _generate_face_encoding (64 + 10 + 64)
+ENCODING_SIZE = 138
+
+# Bump whenever _generate_face_encoding changes, then run
+# python manage.py reencode_faces. Only encodings of this version are matched.
+ENCODING_ALGORITHM_VERSION = 1
+
+# Stored encodings are a version byte followed by little-endian floats.
+# One blob may hold several encodings back to back (Person prototypes).
+ENCODING_FORMATS = {
+    1: np.dtype('<f4'),
+    2: np.dtype('<f2'),
+}
+ENCODING_FORMAT_FOR_DTYPE = {'float32': 1, 'float16': 2}
+
+
+def pack_encoding(encoding, dtype: Optional[str] = None) -> Optional[bytes]:
+    """
+    Serialize one encoding (or an (n, d) stack of them) to a binary blob
+    
+    Args:
+        encoding: Sequence or array of floats
+        dtype: 'float32' or 'float16' (default: FACE_ENCODING_DTYPE)
+    """
+    if encoding is None:
+        return None
+    
+    version = ENCODING_FORMAT_FOR_DTYPE[dtype or getattr(settings, 'FACE_ENCODING_DTYPE', 'float32')]
+    values = np.asarray(encoding, dtype=ENCODING_FORMATS[version])
+    return bytes([version]) + values.tobytes()
+
+
+def unpack_encoding(blob, dim: Optional[int] = None) -> Optional[np.ndarray]:
+    """
+    Read a stored encoding without copying
+    
+    Returns a read-only view onto the blob: 1-D for a single encoding or,
+    when dim is given, reshaped to (n, dim). None for empty values.
+    """
+    if blob is None or len(blob) == 0:
+        return None
+    
+    dtype = ENCODING_FORMATS.get(blob[0])
+    if dtype is None:
+        raise ValueError(f"Unknown face encoding format version {blob[0]}")
+    
+    values = np.frombuffer(blob, dtype=dtype, offset=1)
+    return values.reshape(-1, dim) if dim else values
+
+
+def coerce_encoding(value) -> Optional[np.ndarray]:
+    """Accept a stored blob or a plain sequence of floats and return an array (None if empty)"""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return unpack_encoding(value)
+    value = np.asarray(value, dtype=np.float32)
+    return value if value.size else None
+
+
+def unpack_encodings(blobs, dim: int = ENCODING_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load many stored encodings into one preallocated float32 matrix
+    
+    Returns:
+        Tuple of (matrix, kept) where kept indexes the blobs that held an
+        encoding of length dim
+    """
+    blobs = list(blobs)
+    matrix = np.empty((len(blobs), dim), dtype=np.float32)
+    kept = np.empty(len(blobs), dtype=np.int64)
+    
+    n = 0
+    for i, blob in enumerate(blobs):
+        values = unpack_encoding(blob)
+        if values is None or len(values) != dim:
+            continue
+        matrix[n] = values
+        kept[n] = i
+        n += 1
+    
+    return matrix[:n], kept[:n]
+
 class FaceRecognitionService:
     """Service for face detection, recognition and encoding using OpenCV"""
     
     def __init__(self):
-        # Load OpenCV face detection models
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        # Face detection uses the backend selected by FACE_DETECTOR_BACKEND
+        # (see face_detectors.py); the eye cascade is only used for quality scoring
         self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
         
         # Initialize face recognizer for face encoding/comparison (simplified approach)
         # Using HOG + SVM approach instead of LBPH due to cv2.face module unavailability
         self.feature_extractor = None  # Will implement HOG-based features
         
-        # Detection parameters
-        self.min_face_size = (30, 30)  # Minimum face size to detect
-        self.scale_factor = 1.1        # How much image size is reduced at each scale
-        self.min_neighbors = 5         # How many neighbors each face should retain
+        # Quality scoring: the eye cascade only runs for faces whose cheap score
+        # lands within eye_check_margin of quality_threshold
+        self.quality_threshold = getattr(settings, 'FACE_QUALITY_THRESHOLD', 0.5)
+        self.eye_check_margin = getattr(settings, 'FACE_QUALITY_EYE_MARGIN', 0.1)
         
-    def detect_faces_in_image(self, image_path: str) -> List[Dict]:
+    def detect_faces_in_image(self, image_path: str, detailed_quality: bool = False,
+                              timings: Optional[Dict] = None) -> List[Dict]:
         """
         Detect faces in an image and return face locations and encodings
         
         Args:
             image_path: Path to the image file
+            detailed_quality: Run the eye cascade on every face, not just borderline ones
+            timings: Optional dict filled with a per-stage breakdown, in seconds:
+                     decode, detect, encode, quality_cheap, quality_eyes,
+                     plus eye_checks (number of faces that ran the eye cascade)
             
         Returns:
             List of dictionaries with face data:
@@ -46,11 +142,19 @@ class FaceRecognitionService:
                 'width': float,  # Relative width (0-1)
                 'height': float, # Relative height (0-1)
                 'encoding': list, # Face encoding for recognition
-                'confidence': float # Detection confidence (0-1)
+                'confidence': float, # Detection confidence (0-1)
+                'quality_tier': str  # 'cheap' or 'eyes'
             }
         """
+        if timings is None:
+            timings = {}
+        for stage in ('decode', 'detect', 'encode', 'quality_cheap', 'quality_eyes'):
+            timings.setdefault(stage, 0.0)
+        timings.setdefault('eye_checks', 0)
+        
         try:
             # Read image
+            started = time.perf_counter()
             img = cv2.imread(image_path)
             if img is None:
                 logger.error(f"Could not read image: {image_path}")
@@ -58,30 +162,31 @@ class FaceRecognitionService:
             
             gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
             img_height, img_width = gray.shape
+            timings['decode'] += time.perf_counter() - started
             
             # Detect faces
-            faces = self.face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=self.scale_factor,
-                minNeighbors=self.min_neighbors,
-                minSize=self.min_face_size,
-                flags=cv2.CASCADE_SCALE_IMAGE
-            )
+            started = time.perf_counter()
+            detector = get_face_detector()
+            faces = detector.detect(img, gray)
+            timings['detect'] += time.perf_counter() - started
             
             detected_faces = []
             
-            for i, (x, y, w, h) in enumerate(faces):
+            for i, (x, y, w, h, _score) in enumerate(faces):
                 # Extract face ROI for encoding
                 face_roi = gray[y:y+h, x:x+w]
                 
-                # Resize face for consistent encoding
-                face_resized = cv2.resize(face_roi, (100, 100))
-                
                 # Generate face encoding using LBP features
-                face_encoding = self._generate_face_encoding(face_resized)
+                started = time.perf_counter()
+                face_encoding = self.encode_face_region(face_roi)
+                timings['encode'] += time.perf_counter() - started
                 
                 # Calculate confidence based on face quality metrics
-                confidence = self._calculate_face_quality(face_roi)
+                confidence, quality_tier = self._calculate_face_quality(
+                    face_roi,
+                    eye_check=True if detailed_quality else None,
+                    timings=timings
+                )
                 
                 # Convert to relative coordinates (0-1)
                 face_data = {
@@ -91,19 +196,31 @@ class FaceRecognitionService:
                     'height': h / img_height,       # Relative height
                     'encoding': face_encoding.tolist(),  # Convert numpy to list
                     'confidence': confidence,
-                    'detection_method': 'opencv_haar'
+                    'quality_tier': quality_tier,
+                    'detection_method': detector.name
                 }
                 
                 detected_faces.append(face_data)
                 logger.info(f"Detected face {i+1} at ({face_data['x']:.2f}, {face_data['y']:.2f}) "
                            f"with confidence {confidence:.2f}")
             
+            logger.debug(
+                f"Face pipeline timings for {image_path}: " +
+                ", ".join(f"{stage}={value:.4f}" if isinstance(value, float) else f"{stage}={value}"
+                          for stage, value in timings.items())
+            )
+            
             return detected_faces
             
         except Exception as e:
             logger.error(f"Error detecting faces in {image_path}: {str(e)}")
             return []
     
+    def encode_face_region(self, face_roi: np.ndarray) -> np.ndarray:
+        """Encode a grayscale face crop exactly as detection does"""
+        # Resize face for consistent encoding
+        return self._generate_face_encoding(cv2.resize(face_roi, (100, 100)))
+    
     def _generate_face_encoding(self, face_roi: np.ndarray) -> np.ndarray:
         """Generate face encoding using simplified image features"""
         try:
@@ -163,11 +280,27 @@ class FaceRecognitionService:
         except Exception as e:
             logger.error(f"Error generating face encoding: {str(e)}")
             # Return a default encoding if calculation fails
-            return np.zeros(138)  # 64 + 10 + 64 = 138 features
+            return np.zeros(ENCODING_SIZE)
     
-    def _calculate_face_quality(self, face_roi: np.ndarray) -> float:
-        """Calculate face quality score based on various metrics"""
+    def _calculate_face_quality(self, face_roi: np.ndarray, eye_check: Optional[bool] = None,
+                                timings: Optional[Dict] = None) -> Tuple[float, str]:
+        """
+        Calculate face quality score in tiers
+        
+        The cheap tier (sharpness, brightness, size) always runs. The eye
+        cascade is a second Haar pass per face and roughly doubles detection
+        cost, so it only runs when the cheap score is within eye_check_margin
+        of quality_threshold, or when eye_check=True. eye_check=False skips it.
+        
+        Returns:
+            Tuple of (quality_score, tier) where tier is 'cheap' or 'eyes'
+        """
+        if timings is None:
+            timings = {}
+        
         try:
+            started = time.perf_counter()
+            
             # Calculate sharpness using Laplacian variance
             laplacian_var = cv2.Laplacian(face_roi, cv2.CV_64F).var()
             sharpness_score = min(laplacian_var / 500.0, 1.0)  # Normalize to 0-1
@@ -179,23 +312,35 @@ class FaceRecognitionService:
             # Calculate size score (larger faces generally better)
             size_score = min(max(face_roi.shape[0] - 30, 0) / 100.0, 1.0)
             
+            cheap_score = (
+                sharpness_score * 0.3 +
+                brightness_score * 0.2 +
+                size_score * 0.3
+            )
+            timings['quality_cheap'] = timings.get('quality_cheap', 0.0) + time.perf_counter() - started
+            
+            if eye_check is None:
+                # Same 0-1 scale as the full score, with the eye weight spread over the rest
+                eye_check = abs(cheap_score / 0.8 - self.quality_threshold) <= self.eye_check_margin
+            
+            if not eye_check:
+                return float(max(0.1, min(cheap_score / 0.8, 1.0))), 'cheap'
+            
             # Detect eyes in face for better quality assessment
+            started = time.perf_counter()
             eyes = self.eye_cascade.detectMultiScale(face_roi, 1.1, 5)
             eye_score = min(len(eyes) / 2.0, 1.0)  # Prefer faces with 2 eyes detected
+            timings['quality_eyes'] = timings.get('quality_eyes', 0.0) + time.perf_counter() - started
+            timings['eye_checks'] = timings.get('eye_checks', 0) + 1
             
             # Weighted average of quality metrics
-            quality_score = (
-                sharpness_score * 0.3 +
-                brightness_score * 0.2 +
-                size_score * 0.3 +
-                eye_score * 0.2
-            )
+            quality_score = cheap_score + eye_score * 0.2
             
-            return max(0.1, min(quality_score, 1.0))  # Clamp between 0.1 and 1.0
+            return float(max(0.1, min(quality_score, 1.0))), 'eyes'  # Clamp between 0.1 and 1.0
             
         except Exception as e:
             logger.error(f"Error calculating face quality: {str(e)}")
-            return 0.5  # Default medium quality
+            return 0.5, 'cheap'  # Default medium quality
     
     def compare_faces(self, encoding1: List[float], encoding2: List[float], 
                      threshold: float = 0.6) -> Tuple[bool, float]:
@@ -211,12 +356,13 @@ class FaceRecognitionService:
             Tuple of (is_match: bool, similarity_score: float)
         """
         try:
-            if not encoding1 or not encoding2:
+            # len() rather than truthiness so numpy arrays work too
+            if encoding1 is None or encoding2 is None or not len(encoding1) or not len(encoding2):
                 return False, 0.0
             
             # Convert to numpy arrays
-            enc1 = np.array(encoding1)
-            enc2 = np.array(encoding2)
+            enc1 = np.asarray(encoding1, dtype=np.float64)
+            enc2 = np.asarray(encoding2, dtype=np.float64)
             
             if enc1.shape != enc2.shape:
                 logger.warning(f"Face encoding shape mismatch: {enc1.shape} vs {enc2.shape}")
@@ -335,19 +481,28 @@ class FaceRecognitionService:
 face_recognition_service = FaceRecognitionService()
 
 
-def detect_faces_in_uploaded_image(image_instance):
+def detect_faces_in_uploaded_image(image_instance, detailed_quality=False, timings=None):
     """
     Detect faces in a newly uploaded image
     
     Args:
         image_instance: Image model instance
+        detailed_quality: Run the eye cascade on every face
+        timings: Optional dict filled with the per-stage timing breakdown
         
     Returns:
         List of detected face data
     """
+    from .storage import local_file_path
+    
     try:
-        image_path = image_instance.image_file.path
-        faces = face_recognition_service.detect_faces_in_image(image_path)
+        image_file = image_instance.image_file
+        with local_file_path(image_file.name, image_file.storage) as image_path:
+            faces = face_recognition_service.detect_faces_in_image(
+                image_path,
+                detailed_quality=detailed_quality,
+                timings=timings
+            )
         
         logger.info(f"Detected {len(faces)} faces in image {image_instance.title}")
         return faces
@@ -357,6 +512,284 @@ def detect_faces_in_uploaded_image(image_instance):
         return []
 
 
+def box_iou(a, b) -> float:
+    """Intersection over union of two (x, y, width, height) boxes"""
+    ax, ay, aw, ah = a[:4]
+    bx, by, bw, bh = b[:4]
+    
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    
+    intersection = inter_w * inter_h
+    union = aw * ah + bw * bh - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def store_detected_faces(image_instance, faces, overlap_threshold=0.5):
+    """
+    Persist detections as unassigned FaceTag candidates in one bulk insert
+    
+    Earlier unassigned detections for the image are replaced, and faces that
+    overlap an existing tag (manual or reviewed) are skipped, so running
+    detection again is safe.
+    
+    Args:
+        image_instance: Image model instance the faces were detected in
+        faces: Face dicts as returned by detect_faces_in_image
+        overlap_threshold: IoU above which a detection duplicates an existing tag
+        
+    Returns:
+        List of created FaceTag instances
+    """
+    from .models import FaceTag, Image
+    
+    with transaction.atomic():
+        FaceTag.objects.filter(image=image_instance, status='unassigned', person__isnull=True).delete()
+        
+        existing = list(
+            FaceTag.objects.filter(image=image_instance)
+            .values_list('face_x', 'face_y', 'face_width', 'face_height')
+        )
+        
+        face_tags = []
+        for face in faces:
+            box = (face['x'], face['y'], face['width'], face['height'])
+            if any(box_iou(box, other) >= overlap_threshold for other in existing):
+                continue
+            
+            face_tag = FaceTag(
+                image=image_instance,
+                face_x=face['x'],
+                face_y=face['y'],
+                face_width=face['width'],
+                face_height=face['height'],
+                confidence_score=face.get('confidence'),
+                is_auto_generated=True,
+                status='unassigned'
+            )
+            face_tag.set_encoding(face['encoding'])
+            face_tags.append(face_tag)
+        
+        created = FaceTag.objects.bulk_create(face_tags)
+        Image.objects.filter(id=image_instance.id).update(faces_detected_at=timezone.now())
+        
+        transaction.on_commit(lambda: add_faces_to_index(
+            [face_tag.id for face_tag in created],
+            [face_tag.face_encoding for face_tag in created]
+        ))
+    
+    # Small avatars for the tagging and moderation UIs, rendered once here
+    FaceTag.generate_face_crops(created)
+    
+    logger.info(f"Stored {len(created)} unassigned faces for image {image_instance.id}")
+    return created
+
+
+def _unit_rows(encodings, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stack encodings of the given dimension into an L2-normalized float32 matrix
+    
+    Returns:
+        Tuple of (matrix, kept) where kept indexes the encodings that were used
+    """
+    kept = [i for i, enc in enumerate(encodings) if enc is not None and len(enc) == dim]
+    if not kept:
+        return np.zeros((0, dim), dtype=np.float32), np.array([], dtype=np.int64)
+    
+    matrix = np.asarray([encodings[i] for i in kept], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms, np.asarray(kept, dtype=np.int64)
+
+
+def update_prototypes(mean, prototypes, count, new_encodings, max_prototypes=4):
+    """
+    Incrementally fold new encodings into a person's running mean and exemplars
+    
+    The mean is updated with the usual streaming formula. Exemplars are kept
+    diverse: each new encoding joins the set, and when the set overflows the
+    most redundant member of the most similar pair is dropped. Only the stored
+    prototypes and the new encodings are touched, never the full tag history.
+    
+    Args:
+        mean: Current running mean (array) or None
+        prototypes: Current exemplar encodings ((n, d) array or list of arrays)
+        count: Number of encodings already folded into the mean
+        new_encodings: Newly approved encodings to add
+        max_prototypes: Maximum number of exemplars to keep
+        
+    Returns:
+        Tuple of (mean, prototypes, count) with mean a (d,) array and
+        prototypes an (n, d) array, ready to store on the Person
+    """
+    new_encodings = [enc for enc in new_encodings if enc is not None and len(enc)]
+    if not new_encodings:
+        return mean, prototypes, count
+    
+    dim = len(new_encodings[0])
+    vectors = np.asarray([enc for enc in new_encodings if len(enc) == dim], dtype=np.float64)
+    
+    # Encodings of a different shape (older algorithm) cannot be averaged in; start over
+    if mean is not None and len(mean) == dim and count:
+        mean_vec = np.asarray(mean, dtype=np.float64)
+        total = count
+    else:
+        mean_vec = np.zeros(dim, dtype=np.float64)
+        total = 0
+    
+    exemplars = [np.asarray(p, dtype=np.float64) for p in (prototypes if prototypes is not None else []) if len(p) == dim]
+    
+    for vector in vectors:
+        total += 1
+        mean_vec += (vector - mean_vec) / total
+        
+        exemplars.append(vector)
+        if len(exemplars) > max_prototypes:
+            unit, _ = _unit_rows(exemplars, dim)
+            similarity = unit @ unit.T
+            np.fill_diagonal(similarity, -np.inf)
+            i, j = np.unravel_index(np.argmax(similarity), similarity.shape)
+            
+            # Drop whichever of the pair is closer to everything else
+            np.fill_diagonal(similarity, 0.0)
+            redundancy = similarity.sum(axis=1)
+            exemplars.pop(i if redundancy[i] >= redundancy[j] else j)
+    
+    return mean_vec, np.asarray(exemplars).reshape(-1, dim), total
+
+
+class PersonMatchIndex:
+    """
+    Vectorized matcher over every person's mean and prototype encodings
+    
+    Scores use the same 0-1 scale as FaceRecognitionService.compare_faces;
+    a person's score is the best score over their prototypes.
+    """
+    
+    def __init__(self, people):
+        """
+        Args:
+            people: Iterable of (person_id, name, mean, prototypes) tuples, with
+                    mean a (d,) array and prototypes an (n, d) array
+        """
+        self.names = {}
+        self.person_ids = []
+        group_starts = []
+        vectors = []
+        
+        for person_id, name, mean, prototypes in people:
+            person_vectors = ([mean] if mean is not None else []) + list(prototypes if prototypes is not None else [])
+            if not person_vectors:
+                continue
+            self.names[person_id] = name
+            self.person_ids.append(person_id)
+            group_starts.append(len(vectors))
+            vectors.extend(person_vectors)
+        
+        self.dim = len(vectors[0]) if vectors else 0
+        self.matrix, kept = _unit_rows(vectors, self.dim)
+        
+        # Drop people whose prototypes were all the wrong shape
+        owners = np.searchsorted(np.asarray(group_starts), kept, side='right') - 1
+        present = np.unique(owners)
+        self.person_ids = [self.person_ids[i] for i in present]
+        self._group_starts = np.searchsorted(owners, present) if len(owners) else owners
+    
+    def __len__(self):
+        return len(self.person_ids)
+    
+    def match_many(self, encodings, threshold=0.6, top_k=3) -> List[List[Tuple[int, float]]]:
+        """
+        Find the best matching people for each encoding
+        
+        Returns:
+            One list of (person_id, similarity_score) per input encoding,
+            best first, limited to top_k entries at or above threshold
+        """
+        results = [[] for _ in encodings]
+        if not len(self) or not len(encodings):
+            return results
+        
+        queries, kept = _unit_rows(encodings, self.dim)
+        if not len(kept):
+            return results
+        
+        # Cosine similarity against every prototype, then best prototype per person
+        similarity = (queries @ self.matrix.T + 1.0) / 2.0
+        per_person = np.maximum.reduceat(similarity, self._group_starts, axis=1)
+        
+        for row, query_index in enumerate(kept):
+            scores = per_person[row]
+            best = np.argsort(-scores)[:top_k]
+            results[query_index] = [
+                (self.person_ids[i], float(scores[i]))
+                for i in best if scores[i] >= threshold
+            ]
+        
+        return results
+
+
+MATCH_INDEX_VERSION_KEY = 'face_match_index_version'
+
+_match_index = None
+_match_index_version = None
+_match_index_built_at = 0.0
+_match_index_lock = threading.Lock()
+
+
+def get_person_match_index() -> PersonMatchIndex:
+    """
+    Return the shared person match index, rebuilding it when stale
+    
+    The index is rebuilt when the cached version key changes (bumped on
+    every prototype update) or after FACE_MATCH_INDEX_TTL seconds, so
+    workers that do not share a cache still converge.
+    """
+    from .models import Person
+    
+    global _match_index, _match_index_version, _match_index_built_at
+    
+    version = cache.get(MATCH_INDEX_VERSION_KEY, 0)
+    ttl = getattr(settings, 'FACE_MATCH_INDEX_TTL', 300)
+    
+    with _match_index_lock:
+        is_stale = (
+            _match_index is None or
+            _match_index_version != version or
+            time.monotonic() - _match_index_built_at > ttl
+        )
+        if is_stale:
+            # Only people whose prototypes come from the current encoder
+            people = Person.objects.filter(
+                encoding_version=ENCODING_ALGORITHM_VERSION
+            ).exclude(face_encoding__isnull=True).values_list(
+                'id', 'name', 'face_encoding', 'prototype_encodings'
+            )
+            _match_index = PersonMatchIndex(
+                (person_id, name, unpack_encoding(mean), unpack_encoding(prototypes, ENCODING_SIZE))
+                for person_id, name, mean, prototypes in people
+            )
+            _match_index_version = version
+            _match_index_built_at = time.monotonic()
+        
+        return _match_index
+
+
+def invalidate_person_match_index():
+    """Mark the person match index stale in this and (via the cache) other workers"""
+    global _match_index
+    
+    with _match_index_lock:
+        _match_index = None
+    
+    try:
+        cache.incr(MATCH_INDEX_VERSION_KEY)
+    except ValueError:
+        cache.set(MATCH_INDEX_VERSION_KEY, 1, None)
+
+
 def find_matching_faces_for_person(person, confidence_threshold=0.7):
     """
     Find all untagged faces that match a given person
@@ -368,39 +801,105 @@ def find_matching_faces_for_person(person, confidence_threshold=0.7):
     Returns:
         List of potential matches (FaceTag instances)
     """
-    from .models import FaceTag, Image
+    from .models import FaceTag
     
-    if not person.face_encoding:
-        logger.warning(f"Person {person.name} has no face encoding")
+    mean = person.encoding
+    if mean is None or person.encoding_version != ENCODING_ALGORITHM_VERSION:
+        logger.warning(f"Person {person.name} has no current face encoding")
         return []
     
+    prototypes = person.prototypes
+    targets = [mean] + list(prototypes if prototypes is not None else [])
+    target_matrix, _ = _unit_rows(targets, len(mean))
+    
     # Get all untagged face detections
-    untagged_faces = FaceTag.objects.filter(
+    untagged = FaceTag.objects.filter(
         person__isnull=True,  # No person assigned yet
-        face_encoding__isnull=False  # Has face encoding
+        face_encoding__isnull=False,  # Has face encoding
+        encoding_version=ENCODING_ALGORITHM_VERSION  # Comparable with the person's
     )
     
-    candidate_encodings = [
-        (face.id, face.face_encoding) 
-        for face in untagged_faces 
-        if face.face_encoding
-    ]
-    
-    # Find similar faces
-    matches = face_recognition_service.find_similar_faces(
-        person.face_encoding,
-        candidate_encodings,
-        confidence_threshold
+    # On large installs, only score the approximate neighbours of each prototype
+    ann_index = get_face_index()
+    if ann_index is not None:
+        wanted = getattr(settings, 'FACE_ANN_CANDIDATES', 200)
+        k = wanted
+        while True:
+            neighbours = ann_index.search(target_matrix, k=k, nprobe=getattr(settings, 'FACE_ANN_NPROBE', 8))
+            candidate_ids = set(untagged.filter(
+                id__in={face_tag_id for row in neighbours for face_tag_id, _ in row}
+            ).values_list('id', flat=True))
+            
+            # The index also holds tagged faces, usually this person's own, which
+            # crowd the nearest neighbours; widen the search until every prototype
+            # has enough untagged ones or its probed buckets are exhausted
+            if k >= len(ann_index) or all(
+                len(row) < k or sum(face_tag_id in candidate_ids for face_tag_id, _ in row) >= wanted
+                for row in neighbours
+            ):
+                break
+            k *= 2
+        untagged = untagged.filter(id__in=candidate_ids)
+    
+    candidates = list(untagged.values_list('id', 'face_encoding'))
+    
+    candidate_matrix, kept = unpack_encodings([blob for _, blob in candidates], target_matrix.shape[1])
+    if not len(kept):
+        return []
+    norms = np.linalg.norm(candidate_matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    candidate_matrix /= norms
+    
+    # Best score over the person's prototypes, on the compare_faces 0-1 scale
+    similarity = ((candidate_matrix @ target_matrix.T + 1.0) / 2.0).max(axis=1)
+    matches = sorted(
+        ((candidates[i][0], float(score)) for i, score in zip(kept, similarity)
+         if score >= confidence_threshold),
+        key=lambda match: match[1],
+        reverse=True
     )
     
     # Return FaceTag instances for matches
+    face_tags = FaceTag.objects.in_bulk([face_tag_id for face_tag_id, _ in matches])
     matching_face_tags = []
-    for face_tag_id, similarity in matches:
-        try:
-            face_tag = FaceTag.objects.get(id=face_tag_id)
-            face_tag.confidence_score = similarity  # Temporary attribute
-            matching_face_tags.append(face_tag)
-        except FaceTag.DoesNotExist:
+    for face_tag_id, similarity_score in matches:
+        face_tag = face_tags.get(face_tag_id)
+        if face_tag is None:
             continue
+        face_tag.confidence_score = similarity_score  # Temporary attribute
+        matching_face_tags.append(face_tag)
+    
+    return matching_face_tags
+
+
+def run_face_detection_job(job):
+    """
+    Processing-pool handler for 'detect_faces' jobs
+    
+    Args:
+        job: ProcessingJob instance with an image attached
+        
+    Returns:
+        JSON-serializable detection result stored on the job
+    """
+    if job.image is None or not job.image.image_file:
+        raise ValueError("Job has no image file to run face detection on")
+    
+    timings = {}
+    faces = detect_faces_in_uploaded_image(
+        job.image,
+        detailed_quality=bool(job.options.get('detailed_quality')),
+        timings=timings
+    )
+    
+    # Images uploaded before ingest-time detection get their candidates stored now
+    if job.image.faces_detected_at is None:
+        store_detected_faces(job.image, faces)
     
-    return matching_face_tags
\ No newline at end of file
+    # Encodings are stored on the FaceTags; keep them out of the job row and API
+    return {
+        'faces': [{key: value for key, value in face.items() if key != 'encoding'} for face in faces],
+        'image_id': job.image.id,
+        'face_count': len(faces),
+        'timings': timings,
+    }
@@ -0,0 +1,269 @@
+"""
+Re-encode stored faces after the encoding algorithm changes
+New encodings are computed from the stored detection boxes (on a process pool
+when run from the reencode_faces command, in the calling thread for queued
+jobs) and written to a staging column, with a checkpoint after every batch so an
+interrupted run resumes where it stopped. When every face is done the staged
+encodings are swapped in, and people's prototypes rebuilt, in one transaction,
+so matching never mixes encodings from two algorithm versions.
+"""
+
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+_service = None
+
+
+def _init_worker():
+    """Make Django usable in spawned worker processes"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _reencode_batch(tasks, dtype) -> List[Tuple[int, Optional[bytes]]]:
+    """
+    Worker: re-encode one batch of faces (no database access)
+
+    Args:
+        tasks: List of (image file name, [(face_tag_id, x, y, width, height), ...])
+               with boxes in normalized top-left coordinates
+        dtype: Storage dtype for pack_encoding
+
+    Returns:
+        List of (face_tag_id, packed encoding or None if the face could not be read)
+    """
+    import cv2
+    from .face_recognition_utils import FaceRecognitionService, pack_encoding
+    from .storage import local_file_path
+
+    global _service
+    if _service is None:
+        _service = FaceRecognitionService()
+
+    results = []
+    for image_name, faces in tasks:
+        gray = None
+        if image_name:
+            with local_file_path(image_name) as image_path:
+                gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            results.extend((face_tag_id, None) for face_tag_id, *_ in faces)
+            continue
+
+        img_height, img_width = gray.shape
+        for face_tag_id, x, y, w, h in faces:
+            left = max(0, int(x * img_width))
+            top = max(0, int(y * img_height))
+            right = min(img_width, int((x + w) * img_width))
+            bottom = min(img_height, int((y + h) * img_height))
+            if right - left < 2 or bottom - top < 2:
+                results.append((face_tag_id, None))
+                continue
+
+            encoding = _service.encode_face_region(gray[top:bottom, left:right])
+            results.append((face_tag_id, pack_encoding(encoding, dtype)))
+
+    return results
+
+
+def _iter_batches(version: int, after_id: int, batch_size: int):
+    """Yield (last_id, tasks) batches of faces still needing the target version"""
+    from .models import FaceTag
+
+    last_id = after_id
+
+    while True:
+        rows = list(
+            FaceTag.objects.filter(id__gt=last_id)
+            .exclude(encoding_version=version)
+            .order_by('id')
+            .values_list('id', 'image__image_file', 'face_x', 'face_y', 'face_width', 'face_height')
+            [:batch_size]
+        )
+        if not rows:
+            return
+
+        # Group by photo so each one is decoded once per batch
+        by_image: Dict[str, list] = {}
+        for face_tag_id, image_file, x, y, w, h in rows:
+            by_image.setdefault(image_file or '', []).append((face_tag_id, x, y, w, h))
+
+        last_id = rows[-1][0]
+        yield last_id, list(by_image.items())
+
+
+def reencode_faces(job, batch_size: int = 200, workers: Optional[int] = None, swap: bool = True,
+                   progress=None) -> Dict:
+    """
+    Re-encode every face to job.options['version'], resuming from job.result
+
+    Args:
+        job: 'reencode_faces' ProcessingJob; its result holds the checkpoint
+        batch_size: Faces per worker task and per checkpoint
+        workers: Worker processes (default: FACE_REENCODE_WORKERS); 0 encodes
+                 in the calling thread without starting a process pool
+        swap: Swap the staged encodings in once every face is done
+        progress: Optional callable receiving the checkpoint dict after each batch
+
+    Returns:
+        The final checkpoint/summary dict
+    """
+    from .models import FaceTag
+    from .face_recognition_utils import ENCODING_ALGORITHM_VERSION
+
+    version = job.options.get('version', ENCODING_ALGORITHM_VERSION)
+    dtype = getattr(settings, 'FACE_ENCODING_DTYPE', 'float32')
+    if workers is None:
+        workers = getattr(settings, 'FACE_REENCODE_WORKERS', 2)
+
+    state = {'version': version, 'last_id': 0, 'encoded': 0, 'failed': 0, 'swapped': None}
+    state.update(job.result or {})
+
+    def checkpoint():
+        job.result = dict(state)
+        job.save(update_fields=['result'])
+        if progress:
+            progress(job.result)
+
+    def stage(last_id, results):
+        staged = [
+            FaceTag(id=face_tag_id, staged_encoding=blob, staged_encoding_version=version)
+            for face_tag_id, blob in results if blob is not None
+        ]
+        FaceTag.objects.bulk_update(staged, ['staged_encoding', 'staged_encoding_version'])
+
+        state['last_id'] = last_id
+        state['encoded'] += len(staged)
+        state['failed'] += len(results) - len(staged)
+        checkpoint()
+
+    batches = _iter_batches(version, state['last_id'], batch_size)
+
+    if not workers:
+        for last_id, tasks in batches:
+            stage(last_id, _reencode_batch(tasks, dtype))
+    else:
+        # Worker processes must not inherit open database connections
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            in_flight = deque()
+
+            def submit_next():
+                batch = next(batches, None)
+                if batch is not None:
+                    last_id, tasks = batch
+                    in_flight.append((last_id, executor.submit(_reencode_batch, tasks, dtype)))
+
+            for _ in range(workers * 2):
+                submit_next()
+
+            # Results are consumed in submission order so the checkpoint only
+            # ever advances past fully written batches
+            while in_flight:
+                last_id, future = in_flight.popleft()
+                stage(last_id, future.result())
+                submit_next()
+
+    if swap:
+        state['swapped'] = swap_staged_encodings(version)
+        checkpoint()
+
+    return state
+
+
+def swap_staged_encodings(version: int) -> int:
+    """
+    Atomically promote staged encodings and rebuild every person's prototypes
+
+    Returns:
+        Number of face encodings swapped in
+    """
+    from .models import FaceTag, Person
+    from .face_recognition_utils import invalidate_person_match_index
+
+    with transaction.atomic():
+        swapped = FaceTag.objects.filter(staged_encoding_version=version).update(
+            face_encoding=F('staged_encoding'),
+            encoding_version=version,
+            staged_encoding=None,
+            staged_encoding_version=None
+        )
+        if not swapped:
+            return 0
+
+        # Prototypes are rebuilt from scratch from approved tags under the new encoder
+        encodings_by_person: Dict[int, list] = {}
+        approved = FaceTag.objects.filter(
+            status='approved',
+            person__isnull=False,
+            face_encoding__isnull=False,
+            encoding_version=version
+        ).order_by('id').values_list('person_id', 'face_encoding')
+        for person_id, blob in approved.iterator(chunk_size=2000):
+            encodings_by_person.setdefault(person_id, []).append(blob)
+
+        people = list(Person.objects.select_for_update())
+        for person in people:
+            person.face_encoding = None
+            person.prototype_encodings = None
+            person.encoding_count = 0
+            person.encoding_version = None
+            if person.id in encodings_by_person:
+                person._fold_face_encodings(encodings_by_person[person.id])
+                person.encoding_version = version
+
+        Person.objects.bulk_update(
+            people, ['face_encoding', 'prototype_encodings', 'encoding_count', 'encoding_version']
+        )
+
+        transaction.on_commit(invalidate_person_match_index)
+
+    if getattr(settings, 'FACE_ANN_ENABLED', False):
+        from .face_index import build_face_index
+        build_face_index()
+
+    logger.info(f"Swapped in {swapped} version {version} face encodings and rebuilt {len(people)} people")
+    return swapped
+
+
+def get_or_create_reencode_job(version: int, restart: bool = False, requested_by=None):
+    """Return the unfinished re-encoding job for version (to resume), or start a new one"""
+    from .models import ProcessingJob
+
+    if not restart:
+        job = ProcessingJob.objects.filter(
+            kind='reencode_faces',
+            options__version=version,
+            status__in=['queued', 'running', 'failed']
+        ).order_by('-created_at').first()
+        if job is not None:
+            return job
+
+    return ProcessingJob.objects.create(
+        kind='reencode_faces',
+        options={'version': version},
+        requested_by=requested_by
+    )
+
+
+def run_reencode_job(job):
+    """
+    Processing-pool handler for 'reencode_faces' jobs
+
+    Runs on a web process's task thread, so faces are encoded in that thread;
+    forking a process pool from a threaded server is unsafe. Use the
+    reencode_faces management command for a parallel backfill.
+    """
+    return reencode_faces(job, batch_size=job.options.get('batch_size', 200), workers=0)
@@ -7,62 +7,143 @@ from rest_framework import generics, status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.http import Http404
+from django.urls import reverse
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
+from django.db.models import Count, Q
 from django.utils import timezone
+from datetime import datetime
+import base64
+import binascii
 import logging
 
-from .models import Image, Person, FaceTag
+from .models import (
+    Image, Like, Person, FaceTag, FaceCluster, ProcessingJob,
+    PENDING_TAG_COUNT_CACHE_KEY, invalidate_person_images, person_images_cache_version
+)
 from .serializers import (
-    PersonSerializer, FaceTagSerializer, FaceDetectionResultSerializer, 
-    AutoTagSuggestionSerializer
+    ImageSerializer, PersonSerializer, FaceTagSerializer, AutoTagSuggestionSerializer,
+    ProcessingJobSerializer, FaceClusterSerializer
+)
+from .face_recognition_utils import (
+    box_iou, detect_faces_in_uploaded_image, get_person_match_index, ENCODING_ALGORITHM_VERSION
 )
-from .face_recognition_utils import face_recognition_service, detect_faces_in_uploaded_image
+from .face_index import add_faces_to_index
+from .processing import enqueue_processing_job, submit_task
 
 logger = logging.getLogger(__name__)
 
 
+class IsOwnerOrStaff(permissions.BasePermission):
+    """
+    Anyone signed in may read; only the object's owner or staff may change it
+    The view names the owning user field in owner_field.
+    """
+    
+    def has_object_permission(self, request, view, obj):
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        return self.is_owner_or_staff(request.user, obj, view.owner_field)
+    
+    @staticmethod
+    def is_owner_or_staff(user, obj, owner_field):
+        return user.is_staff or getattr(obj, f'{owner_field}_id') == user.pk
+
+
+def _approval_withdrawn(person_id):
+    """
+    An approved face left this person: once the change commits, rebuild
+    their prototypes without it and pick a new avatar
+    """
+    def rebuild():
+        Person.rebuild_face_encodings([person_id])
+        Person.refresh_avatars([person_id])
+    
+    cache.delete(PENDING_TAG_COUNT_CACHE_KEY)
+    transaction.on_commit(rebuild)
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def detect_faces_in_image(request, image_id):
     """
-    Detect faces in a specific image
+    Queue face detection for a specific image
     POST /api/images/{image_id}/detect-faces/
+    
+    Detection runs in the image-processing pool; poll the returned
+    status_url (GET /api/jobs/{job_id}/) for the result.
+    Body (optional): { "detailed_quality": true } to run the eye check on every face
     """
     try:
         image = get_object_or_404(Image, id=image_id)
+        options = {'detailed_quality': bool(request.data.get('detailed_quality', False))}
         
-        # Detect faces using our face recognition service
-        faces = detect_faces_in_uploaded_image(image)
-        
-        if not faces:
-            return Response({
-                'faces': [],
-                'image_id': image_id,
-                'face_count': 0,
-                'message': 'No faces detected in this image'
-            })
+        if not image.image_file:
+            return Response(
+                {'error': 'This entry has no image file to scan for faces'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Return face detection results only (don't persist FaceTag records yet)
-        # FaceTag records will be created when user actually tags a face
+        # Reuse an in-flight job for the same image instead of queueing duplicates.
+        # The image row lock serializes concurrent requests, so only one creates it.
+        with transaction.atomic():
+            Image.objects.select_for_update().filter(id=image.id).first()
+            job = ProcessingJob.objects.filter(
+                kind='detect_faces',
+                image=image,
+                options=options,
+                status__in=['queued', 'running']
+            ).first()
+            
+            if job is None:
+                job = ProcessingJob.objects.create(
+                    kind='detect_faces',
+                    image=image,
+                    options=options,
+                    requested_by=request.user
+                )
+                enqueue_processing_job(job)
         
-        response_data = {
-            'faces': faces,
+        return Response({
+            'job_id': str(job.id),
+            'status': job.status,
             'image_id': image_id,
-            'face_count': len(faces)
-        }
-        
-        serializer = FaceDetectionResultSerializer(response_data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+            'status_url': reverse('processing-job-detail', args=[job.id])
+        }, status=status.HTTP_202_ACCEPTED)
         
+    except Http404:
+        raise
     except Exception as e:
-        logger.error(f"Error detecting faces in image {image_id}: {str(e)}")
+        logger.error(f"Error queueing face detection for image {image_id}: {str(e)}")
         return Response(
             {'error': 'Face detection failed', 'details': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def processing_job_detail(request, job_id):
+    """
+    Get status and result of a background processing job
+    GET /api/jobs/{job_id}/
+    """
+    job = get_object_or_404(ProcessingJob, id=job_id)
+    
+    # Jobs are visible to whoever requested them and to admins
+    if not (request.user.is_staff or job.requested_by_id == request.user.id):
+        return Response(
+            {'error': 'You do not have access to this job'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    serializer = ProcessingJobSerializer(job)
+    return Response(serializer.data)
+
+
 class PersonListCreateView(generics.ListCreateAPIView):
     """
     List all people or create a new person
@@ -73,7 +154,9 @@ class PersonListCreateView(generics.ListCreateAPIView):
     
     def get_queryset(self):
         # Show all people created by any user (for tagging purposes)
-        return Person.objects.all()
+        return Person.objects.select_related('avatar_tag').annotate(
+            approved_tag_count=Count('face_tags', filter=Q(face_tags__status='approved'))
+        )
     
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
@@ -84,17 +167,92 @@ class PersonDetailView(generics.RetrieveUpdateDestroyAPIView):
     Retrieve, update or delete a person
     GET/PUT/DELETE /api/people/{id}/
     """
-    queryset = Person.objects.all()
+    queryset = Person.objects.select_related('avatar_tag')
     serializer_class = PersonSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrStaff]
+    owner_field = 'created_by'
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def person_images(request, person_id):
+    """
+    Page through every photo a person has an approved tag in, newest first
+    GET /api/people/{id}/images/?cursor=<next_cursor>&page_size=12
     
-    def get_permissions(self):
-        """Only allow modifications by person creator or admin"""
-        if self.request.method in ['PUT', 'PATCH', 'DELETE']:
-            if not (self.request.user.is_staff or 
-                   self.get_object().created_by == self.request.user):
-                return [permissions.IsAdminUser()]
-        return super().get_permissions()
+    Keyset pagination on image id, served from the (person, status, image)
+    index. Returns the gallery's image payload. Pages for the people listed
+    in PERSON_IMAGES_CACHED_PEOPLE are cached until their tags change.
+    """
+    try:
+        page_size = min(max(int(request.GET.get('page_size', 12)), 1), 50)
+        cursor = int(request.GET['cursor']) if request.GET.get('cursor') else None
+    except ValueError:
+        return Response({'error': 'cursor and page_size must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    person = get_object_or_404(Person, id=person_id)
+    
+    try:
+        cache_key = None
+        if person.id in getattr(settings, 'PERSON_IMAGES_CACHED_PEOPLE', []):
+            version = person_images_cache_version(person.id)
+            cache_key = f'person_images:{person.id}:v{version}:{cursor}:{page_size}'
+            page = cache.get(cache_key)
+        else:
+            page = None
+        
+        if page is None:
+            image_ids = FaceTag.objects.filter(person=person, status='approved')
+            if cursor is not None:
+                image_ids = image_ids.filter(image_id__lt=cursor)
+            image_ids = list(
+                image_ids.order_by('-image_id').values_list('image_id', flat=True).distinct()[:page_size + 1]
+            )
+            
+            has_next = len(image_ids) > page_size
+            image_ids = image_ids[:page_size]
+            
+            # Same prefetches as the gallery list
+            images = Image.objects.select_related('uploader').prefetch_related(
+                'tags',
+                'comments',
+                'likes'
+            ).in_bulk(image_ids)
+            
+            # Serialized without a request so the page is identical for every
+            # viewer; user_has_liked is filled in per request below
+            page = {
+                'results': ImageSerializer([images[i] for i in image_ids if i in images], many=True).data,
+                'has_next': has_next,
+                'next_cursor': str(image_ids[-1]) if has_next else None,
+            }
+            
+            if cache_key:
+                cache.set(cache_key, page, getattr(settings, 'PERSON_IMAGES_CACHE_TTL', 300))
+        
+        results = [dict(item) for item in page['results']]
+        liked = set(Like.objects.filter(
+            user=request.user,
+            image_id__in=[item['id'] for item in results]
+        ).values_list('image_id', flat=True))
+        for item in results:
+            item['user_has_liked'] = item['id'] in liked
+        
+        return Response({
+            'person_id': person.id,
+            'person': person.name,
+            'results': results,
+            'page_size': page_size,
+            'has_next': page['has_next'],
+            'next_cursor': page['next_cursor']
+        })
+        
+    except Exception as e:
+        logger.error(f"Error loading images for person {person_id}: {str(e)}")
+        return Response(
+            {'error': 'Failed to load images for this person'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
 
 
 class FaceTagListCreateView(generics.ListCreateAPIView):
@@ -110,12 +268,14 @@ class FaceTagListCreateView(generics.ListCreateAPIView):
         image = get_object_or_404(Image, id=image_id)
         
         # Show different tags based on user permissions
+        tags = FaceTag.objects.filter(image=image).select_related('image', 'person', 'tagged_by__profile')
+        
         if self.request.user.is_staff:
             # Admins see all tags
-            return FaceTag.objects.filter(image=image)
+            return tags
         else:
             # Regular users only see approved tags
-            return FaceTag.objects.filter(image=image, status='approved')
+            return tags.filter(status='approved')
     
     def perform_create(self, serializer):
         image_id = self.kwargs['image_id'] 
@@ -134,32 +294,53 @@ class FaceTagListCreateView(generics.ListCreateAPIView):
             serializer.is_valid(raise_exception=True)
             
             face_tag = serializer.save(image=image, tagged_by=request.user)
+            cache.delete(PENDING_TAG_COUNT_CACHE_KEY)
+            submit_task(face_tag.generate_face_crop)
             
             # Generate face encoding if not provided
             if not face_tag.face_encoding:
                 try:
-                    # Extract face encoding from image at specified location
-                    faces = detect_faces_in_uploaded_image(image)
+                    box = (face_tag.face_x, face_tag.face_y, face_tag.face_width, face_tag.face_height)
                     
-                    # Find the closest detected face to this tag location
-                    min_distance = float('inf')
-                    best_encoding = None
+                    # Prefer the face stored at ingest under this tag; the manual
+                    # tag takes over its encoding and replaces the candidate
+                    stored = FaceTag.objects.filter(
+                        image=image,
+                        status='unassigned',
+                        person__isnull=True,
+                        face_encoding__isnull=False
+                    ).exclude(id=face_tag.id)
+                    overlaps = [
+                        (box_iou(box, (c.face_x, c.face_y, c.face_width, c.face_height)), c)
+                        for c in stored
+                    ]
+                    overlap, candidate = max(overlaps, key=lambda pair: pair[0], default=(0.0, None))
                     
-                    for face_data in faces:
-                        distance = abs(face_data['x'] - face_tag.face_x) + abs(face_data['y'] - face_tag.face_y)
-                        if distance < min_distance:
-                            min_distance = distance
-                            best_encoding = face_data['encoding']
+                    if candidate is not None and overlap >= 0.5:
+                        face_tag.face_encoding = candidate.face_encoding
+                        face_tag.encoding_version = candidate.encoding_version
+                        candidate.delete()
+                    else:
+                        # Not detected at ingest: extract the encoding at the tag location
+                        faces = detect_faces_in_uploaded_image(image)
+                        
+                        # Find the closest detected face to this tag location
+                        min_distance = float('inf')
+                        best_encoding = None
+                        
+                        for face_data in faces:
+                            distance = abs(face_data['x'] - face_tag.face_x) + abs(face_data['y'] - face_tag.face_y)
+                            if distance < min_distance:
+                                min_distance = distance
+                                best_encoding = face_data['encoding']
+                        
+                        if best_encoding:
+                            face_tag.set_encoding(best_encoding)
                     
-                    if best_encoding:
-                        face_tag.face_encoding = best_encoding
+                    if face_tag.face_encoding:
                         face_tag.save()
-                        
-                        # Update person's face encoding if it's their first tag
-                        person = face_tag.person
-                        if not person.face_encoding:
-                            person.face_encoding = best_encoding
-                            person.save()
+                        add_faces_to_index([face_tag.id], [face_tag.face_encoding])
+                        # Person prototypes are updated when the tag is approved
                     
                 except Exception as e:
                     logger.error(f"Failed to generate face encoding for tag {face_tag.id}: {str(e)}")
@@ -182,15 +363,83 @@ class FaceTagDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     queryset = FaceTag.objects.all()
     serializer_class = FaceTagSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrStaff]
+    owner_field = 'tagged_by'
+    
+    def perform_update(self, serializer):
+        face_tag = serializer.instance
+        old_person_id = face_tag.person_id
+        new_person = serializer.validated_data.get('person', face_tag.person)
+        
+        with transaction.atomic():
+            if face_tag.status == 'approved' and getattr(new_person, 'id', None) != old_person_id:
+                # Moving an approved face to someone else needs a fresh review
+                serializer.save(status='pending', reviewed_by=None, reviewed_at=None)
+                _approval_withdrawn(old_person_id)
+            else:
+                serializer.save()
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            was_approved = instance.status == 'approved'
+            instance.delete()
+            if was_approved:
+                _approval_withdrawn(instance.person_id)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def face_tags_for_images(request):
+    """
+    Approved face tags for a page of images in one query
+    GET /api/face-tags/batch/?image_ids=1,2,3
+    
+    Returns every requested image id as a key, with an empty list for
+    images nobody is tagged in, so the gallery needs one call per page.
+    """
+    try:
+        image_ids = [int(value) for value in request.GET.get('image_ids', '').split(',') if value.strip()]
+    except ValueError:
+        return Response({'error': 'image_ids must be a comma-separated list of integers'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    max_images = getattr(settings, 'FACE_TAG_BATCH_MAX_IMAGES', 100)
+    if not image_ids:
+        return Response({'error': 'image_ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(image_ids) > max_images:
+        return Response({'error': f'At most {max_images} image_ids per request'},
+                        status=status.HTTP_400_BAD_REQUEST)
     
-    def get_permissions(self):
-        """Only allow modifications by tag creator or admin"""
-        if self.request.method in ['PUT', 'PATCH', 'DELETE']:
-            obj = self.get_object()
-            if not (self.request.user.is_staff or obj.tagged_by == self.request.user):
-                return [permissions.IsAdminUser()]
-        return super().get_permissions()
+    try:
+        rows = FaceTag.objects.filter(image_id__in=image_ids, status='approved').order_by('image_id', 'id').values(
+            'id', 'image_id', 'person_id', 'person__name',
+            'face_x', 'face_y', 'face_width', 'face_height', 'face_crop'
+        )
+        
+        crop_storage = FaceTag._meta.get_field('face_crop').storage
+        results = {str(image_id): [] for image_id in image_ids}
+        for row in rows:
+            results[str(row['image_id'])].append({
+                'id': row['id'],
+                'person_id': row['person_id'],
+                'person_name': row['person__name'],
+                'face_location': {
+                    'x': row['face_x'],
+                    'y': row['face_y'],
+                    'width': row['face_width'],
+                    'height': row['face_height']
+                },
+                'face_crop_url': crop_storage.url(row['face_crop']) if row['face_crop'] else None
+            })
+        
+        return Response({'results': results})
+        
+    except Exception as e:
+        logger.error(f"Error loading face tags for images {image_ids}: {str(e)}")
+        return Response(
+            {'error': 'Failed to load face tags'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
 
 
 @api_view(['POST'])
@@ -207,7 +456,8 @@ def suggest_auto_tags(request, image_id):
         untagged_faces = FaceTag.objects.filter(
             image=image,
             person__isnull=True,
-            face_encoding__isnull=False
+            face_encoding__isnull=False,
+            encoding_version=ENCODING_ALGORITHM_VERSION
         )
         
         if not untagged_faces.exists():
@@ -216,43 +466,37 @@ def suggest_auto_tags(request, image_id):
                 'message': 'No untagged faces found in this image'
             })
         
-        # Get all people with face encodings for comparison
-        people_with_encodings = Person.objects.exclude(face_encoding__isnull=True)
+        # Match every untagged face against all people's prototypes in one pass
+        match_index = get_person_match_index()
+        untagged_faces = list(untagged_faces)
+        matches = match_index.match_many(
+            [face_tag.encoding for face_tag in untagged_faces],
+            threshold=0.6,  # Lower threshold for suggestions
+            top_k=3
+        )
         
         suggestions = []
         
-        for face_tag in untagged_faces:
-            face_suggestions = []
-            
-            for person in people_with_encodings:
-                is_match, similarity = face_recognition_service.compare_faces(
-                    face_tag.face_encoding,
-                    person.face_encoding,
-                    threshold=0.6  # Lower threshold for suggestions
-                )
-                
-                if is_match:
-                    face_suggestions.append({
-                        'person_id': person.id,
-                        'person_name': person.name,
-                        'confidence_score': similarity,
-                        'face_tag_id': face_tag.id,
-                        'face_location': {
-                            'x': face_tag.face_x,
-                            'y': face_tag.face_y,
-                            'width': face_tag.face_width,
-                            'height': face_tag.face_height
-                        }
-                    })
-            
-            # Sort by confidence and take top 3 suggestions per face
-            face_suggestions.sort(key=lambda x: x['confidence_score'], reverse=True)
-            suggestions.extend(face_suggestions[:3])
+        for face_tag, face_matches in zip(untagged_faces, matches):
+            # Matches are already sorted by confidence, top 3 per face
+            for person_id, similarity in face_matches:
+                suggestions.append({
+                    'person_id': person_id,
+                    'person_name': match_index.names[person_id],
+                    'confidence_score': similarity,
+                    'face_tag_id': face_tag.id,
+                    'face_location': {
+                        'x': face_tag.face_x,
+                        'y': face_tag.face_y,
+                        'width': face_tag.face_width,
+                        'height': face_tag.face_height
+                    }
+                })
         
         return Response({
             'suggestions': suggestions,
             'image_id': image_id,
-            'untagged_face_count': untagged_faces.count()
+            'untagged_face_count': len(untagged_faces)
         })
         
     except Exception as e:
@@ -285,13 +529,30 @@ def apply_auto_tag_suggestion(request):
         face_tag = get_object_or_404(FaceTag, id=face_tag_id)
         person = get_object_or_404(Person, id=person_id)
         
+        # Unclaimed detections can be suggested by anyone; tags someone made
+        # are theirs (or staff's) to change
+        unclaimed = face_tag.status == 'unassigned' and face_tag.tagged_by_id is None
+        if not (unclaimed or IsOwnerOrStaff.is_owner_or_staff(request.user, face_tag, 'tagged_by')):
+            return Response(
+                {'error': 'You can only change your own face tags'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
         # Update face tag with person assignment
         with transaction.atomic():
+            was_approved = face_tag.status == 'approved'
+            old_person_id = face_tag.person_id
             face_tag.person = person
             face_tag.confidence_score = confidence
             face_tag.is_auto_generated = True
             face_tag.status = 'pending'  # Still needs admin approval
+            if face_tag.tagged_by_id is None:
+                face_tag.tagged_by = request.user
             face_tag.save()
+            if was_approved:
+                _approval_withdrawn(old_person_id)
+            else:
+                cache.delete(PENDING_TAG_COUNT_CACHE_KEY)
         
         return Response({
             'message': 'Auto-tag applied successfully',
@@ -334,12 +595,14 @@ def pending_tags_list(request):
             context={'request': request}
         )
         
+        count = pending_tags.count()
+        
         return Response({
             'results': serializer.data,
-            'count': pending_tags.count(),
+            'count': count,
             'page': page,
             'page_size': page_size,
-            'has_next': end < pending_tags.count()
+            'has_next': end < count
         })
         
     except Exception as e:
@@ -350,6 +613,96 @@ def pending_tags_list(request):
         )
 
 
+def _encode_queue_cursor(created_at, tag_id):
+    raw = f"{created_at.isoformat()}|{tag_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_queue_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    created_at, tag_id = raw.rsplit('|', 1)
+    return datetime.fromisoformat(created_at), int(tag_id)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def moderation_queue(request):
+    """
+    Page through pending face tags for review, newest first
+    GET /api/admin/moderation-queue/?cursor=<next_cursor>&page_size=50
+    
+    Uses keyset pagination on (created_at, id), so deep pages cost the same
+    as the first one, and returns only the columns the reviewer UI needs.
+    """
+    try:
+        page_size = min(max(int(request.GET.get('page_size', 50)), 1), 200)
+    except ValueError:
+        return Response({'error': 'page_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    pending_tags = FaceTag.objects.filter(status='pending')
+    
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            created_at, tag_id = _decode_queue_cursor(cursor)
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        pending_tags = pending_tags.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=tag_id)
+        )
+    
+    try:
+        rows = list(pending_tags.order_by('-created_at', '-id').values(
+            'id', 'created_at', 'image_id', 'image__title', 'person_id', 'person__name',
+            'face_x', 'face_y', 'face_width', 'face_height', 'face_crop',
+            'confidence_score', 'is_auto_generated', 'tagged_by__username'
+        )[:page_size + 1])
+        
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        
+        # Counting the whole queue is the expensive part; cache it briefly
+        count = cache.get(PENDING_TAG_COUNT_CACHE_KEY)
+        if count is None:
+            count = FaceTag.objects.filter(status='pending').count()
+            cache.set(PENDING_TAG_COUNT_CACHE_KEY, count, getattr(settings, 'FACE_MODERATION_COUNT_TTL', 30))
+        
+        crop_storage = FaceTag._meta.get_field('face_crop').storage
+        results = [{
+            'id': row['id'],
+            'image_id': row['image_id'],
+            'image_title': row['image__title'],
+            'person_id': row['person_id'],
+            'person_name': row['person__name'],
+            'face_location': {
+                'x': row['face_x'],
+                'y': row['face_y'],
+                'width': row['face_width'],
+                'height': row['face_height']
+            },
+            'face_crop_url': crop_storage.url(row['face_crop']) if row['face_crop'] else None,
+            'confidence_score': row['confidence_score'],
+            'is_auto_generated': row['is_auto_generated'],
+            'tagged_by': row['tagged_by__username'],
+            'created_at': row['created_at']
+        } for row in rows]
+        
+        return Response({
+            'results': results,
+            'count': count,
+            'page_size': page_size,
+            'has_next': has_next,
+            'next_cursor': _encode_queue_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_next else None
+        })
+        
+    except Exception as e:
+        logger.error(f"Error loading moderation queue: {str(e)}")
+        return Response(
+            {'error': 'Failed to load moderation queue'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAdminUser])
 def approve_face_tag(request, tag_id):
@@ -402,43 +755,241 @@ def reject_face_tag(request, tag_id):
         )
 
 
+def _bulk_review_tags(request, review_status):
+    """Shared implementation of bulk approve/reject"""
+    tag_ids = request.data.get('tag_ids', [])
+    
+    if not tag_ids or not isinstance(tag_ids, list):
+        return Response(
+            {'error': 'tag_ids array is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        tag_ids = [int(tag_id) for tag_id in tag_ids]
+    except (TypeError, ValueError):
+        return Response(
+            {'error': 'tag_ids must be integers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    results = FaceTag.bulk_review(tag_ids, request.user, review_status)
+    updated_count = sum(1 for result in results.values() if result == review_status)
+    
+    return Response({
+        'message': f'Successfully {review_status} {updated_count} face tags',
+        f'{review_status}_count': updated_count,
+        'requested_count': len(tag_ids),
+        'results': [
+            {'tag_id': tag_id, 'status': result}
+            for tag_id, result in results.items()
+        ]
+    })
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAdminUser])
 def bulk_approve_tags(request):
     """
-    Bulk approve multiple face tags
+    Bulk approve multiple face tags in a single UPDATE
     POST /api/admin/bulk-approve-tags/
     Body: { "tag_ids": [1, 2, 3, ...] }
     """
     try:
-        tag_ids = request.data.get('tag_ids', [])
+        return _bulk_review_tags(request, 'approved')
+        
+    except Exception as e:
+        logger.error(f"Error bulk approving tags: {str(e)}")
+        return Response(
+            {'error': 'Failed to bulk approve tags'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def bulk_reject_tags(request):
+    """
+    Bulk reject multiple face tags in a single UPDATE
+    POST /api/admin/bulk-reject-tags/
+    Body: { "tag_ids": [1, 2, 3, ...] }
+    """
+    try:
+        return _bulk_review_tags(request, 'rejected')
+        
+    except Exception as e:
+        logger.error(f"Error bulk rejecting tags: {str(e)}")
+        return Response(
+            {'error': 'Failed to bulk reject tags'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+# Admin Views for Face Clustering
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def run_face_clustering(request):
+    """
+    Queue offline clustering of all untagged faces
+    POST /api/admin/face-clusters/run/
+    """
+    try:
+        job = ProcessingJob.objects.filter(
+            kind='cluster_faces',
+            status__in=['queued', 'running']
+        ).first()
         
-        if not tag_ids:
+        if job is None:
+            with transaction.atomic():
+                job = ProcessingJob.objects.create(kind='cluster_faces', requested_by=request.user)
+                enqueue_processing_job(job)
+        
+        return Response({
+            'job_id': str(job.id),
+            'status': job.status,
+            'status_url': reverse('processing-job-detail', args=[job.id])
+        }, status=status.HTTP_202_ACCEPTED)
+        
+    except Exception as e:
+        logger.error(f"Error queueing face clustering: {str(e)}")
+        return Response(
+            {'error': 'Failed to start face clustering'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def face_cluster_list(request):
+    """
+    List proposed face clusters with a few sample faces each
+    GET /api/admin/face-clusters/?status=proposed&page=1&page_size=20
+    """
+    try:
+        cluster_status = request.GET.get('status', 'proposed')
+        page_size = min(int(request.GET.get('page_size', 20)), 100)
+        page = max(int(request.GET.get('page', 1)), 1)
+        sample_size = getattr(settings, 'FACE_CLUSTER_SAMPLE_SIZE', 6)
+        
+        clusters = FaceCluster.objects.filter(status=cluster_status).select_related('person')
+        total = clusters.count()
+        start = (page - 1) * page_size
+        clusters = list(clusters[start:start + page_size])
+        
+        # Fetch sample faces for the whole page in one query
+        samples = {cluster.id: [] for cluster in clusters}
+        member_faces = FaceTag.objects.filter(cluster__in=clusters).order_by(
+            'cluster_id', '-confidence_score'
+        ).values('id', 'cluster_id', 'image_id', 'face_x', 'face_y', 'face_width', 'face_height')
+        for face in member_faces:
+            cluster_samples = samples[face.pop('cluster_id')]
+            if len(cluster_samples) < sample_size:
+                cluster_samples.append(face)
+        
+        results = FaceClusterSerializer(clusters, many=True).data
+        for cluster_data in results:
+            cluster_data['sample_faces'] = samples[cluster_data['id']]
+        
+        return Response({
+            'results': results,
+            'count': total,
+            'page': page,
+            'page_size': page_size,
+            'has_next': start + page_size < total
+        })
+        
+    except Exception as e:
+        logger.error(f"Error listing face clusters: {str(e)}")
+        return Response(
+            {'error': 'Failed to load face clusters'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def assign_face_cluster(request, cluster_id):
+    """
+    Name a whole cluster in one action
+    POST /api/admin/face-clusters/{cluster_id}/assign/
+    Body: { "person_id": int } or { "name": "New Person" }
+    """
+    try:
+        person_id = request.data.get('person_id')
+        name = (request.data.get('name') or '').strip()
+        
+        if not person_id and not name:
             return Response(
-                {'error': 'tag_ids array is required'},
+                {'error': 'person_id or name is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Approve all tags in bulk
         with transaction.atomic():
-            updated_count = 0
-            for tag_id in tag_ids:
-                try:
-                    face_tag = FaceTag.objects.get(id=tag_id)
-                    face_tag.approve(request.user)
-                    updated_count += 1
-                except FaceTag.DoesNotExist:
-                    continue
+            cluster = get_object_or_404(FaceCluster.objects.select_for_update(), id=cluster_id)
+            
+            if person_id:
+                person = get_object_or_404(Person, id=person_id)
+            else:
+                person = Person.objects.create(name=name, created_by=request.user)
+            
+            # Only faces that are still unassigned; anything tagged since clustering keeps its tag
+            members = FaceTag.objects.filter(cluster=cluster, person__isnull=True).exclude(status='rejected')
+            encodings = list(members.filter(
+                encoding_version=ENCODING_ALGORITHM_VERSION
+            ).values_list('face_encoding', flat=True))
+            
+            tagged_count = members.update(
+                person=person,
+                status='approved',
+                is_auto_generated=True,
+                reviewed_by=request.user,
+                reviewed_at=timezone.now()
+            )
+            
+            cluster.status = 'named'
+            cluster.person = person
+            cluster.save(update_fields=['status', 'person'])
+            
+            person.add_face_encodings(encodings)
+            invalidate_person_images([person.id])
+            Person.refresh_avatars([person.id])
         
         return Response({
-            'message': f'Successfully approved {updated_count} face tags',
-            'approved_count': updated_count,
-            'requested_count': len(tag_ids)
+            'message': f'Tagged {tagged_count} faces as {person.name}',
+            'cluster_id': cluster.id,
+            'person_id': person.id,
+            'person': person.name,
+            'tagged_count': tagged_count
         })
         
+    except Http404:
+        raise
     except Exception as e:
-        logger.error(f"Error bulk approving tags: {str(e)}")
+        logger.error(f"Error assigning face cluster {cluster_id}: {str(e)}")
         return Response(
-            {'error': 'Failed to bulk approve tags'},
+            {'error': 'Failed to assign cluster'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def dismiss_face_cluster(request, cluster_id):
+    """
+    Dismiss a proposed cluster
+    POST /api/admin/face-clusters/{cluster_id}/dismiss/
+    
+    Its faces stay in the dismissed cluster, so later clustering runs do
+    not propose them again.
+    """
+    cluster = get_object_or_404(FaceCluster, id=cluster_id)
+    
+    cluster.status = 'dismissed'
+    cluster.save(update_fields=['status'])
+    
+    return Response({
+        'message': 'Cluster dismissed',
+        'cluster_id': cluster.id,
+        'status': 'dismissed'
+    })
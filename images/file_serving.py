@@ -0,0 +1,285 @@
+"""
+HTTP byte-range support shared by the protected-file and media views
+Handles single and multiple ranges (multipart/byteranges) and If-Range
+for any source that can read an inclusive byte range as a chunk iterator,
+plus hand-off of authorized downloads to the front-end proxy.
+"""
+
+import re
+import uuid
+from typing import Callable, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.views.static import was_modified_since
+
+# (first byte, last byte), inclusive as in HTTP
+ByteRange = Tuple[int, int]
+
+# More ranges than this are treated as abuse and answered with the whole file
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested ranges overlap the file"""
+
+
+def parse_range_header(header: Optional[str], size: int) -> Optional[List[ByteRange]]:
+    """
+    Parse a Range header against a file of the given size
+
+    Returns:
+        Sorted, merged list of (start, end) ranges, or None when the header is
+        absent or malformed and the whole file should be sent
+
+    Raises:
+        RangeNotSatisfiable: if the header is valid but no range overlaps the file
+    """
+    if not header:
+        return None
+
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        first, sep, last = part.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if not first:
+                # Suffix range: the final N bytes (none of an empty file)
+                length = int(last)
+                if length <= 0 or size == 0:
+                    continue
+                start, end = max(0, size - length), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else None
+                if start < 0 or (end is not None and end < start):
+                    return None
+                if start >= size:
+                    continue
+                end = size - 1 if end is None else min(end, size - 1)
+        except ValueError:
+            return None
+
+        ranges.append((start, end))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    # Merge overlapping and adjacent ranges so no byte is sent twice
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def if_range_matches(request, etag: Optional[str], last_modified: Optional[float]) -> bool:
+    """
+    True if a Range request may be honoured under its If-Range precondition
+
+    If-Range holds either an entity tag, compared strongly, or an HTTP date
+    that must equal the file's Last-Modified exactly.
+    """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return bool(etag) and not if_range.startswith('W/') and if_range == etag
+
+    date = parse_http_date_safe(if_range)
+    return date is not None and last_modified is not None and int(last_modified) == date
+
+
+def is_not_modified(request, etag: Optional[str], last_modified: Optional[float]) -> bool:
+    """
+    True if a GET or HEAD can be answered with 304 Not Modified
+
+    If-None-Match is compared weakly, as for GET and HEAD; If-Modified-Since
+    is only consulted without it.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        if not etag:
+            return False
+        bare_etag = etag.removeprefix('W/')
+        etags = parse_etags(if_none_match)
+        return '*' in etags or any(tag.removeprefix('W/') == bare_etag for tag in etags)
+
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    return bool(if_modified_since) and last_modified is not None and \
+        not was_modified_since(if_modified_since, last_modified)
+
+
+def ranged_response(request, size: int, content_type: str,
+                    read_range: Callable[[int, int], Iterable[bytes]],
+                    etag: Optional[str] = None, last_modified: Optional[float] = None):
+    """
+    Build a 200, 206 or 416 streaming response for a byte-addressable file
+
+    Args:
+        request: Incoming request (Range and If-Range are read from it)
+        size: File size in bytes
+        content_type: Content type of the file
+        read_range: Callable(start, end) yielding the bytes of an inclusive range
+        etag: Quoted entity tag, sent and used for If-Range
+        last_modified: Modification time as a POSIX timestamp
+
+    Cache and access headers are left to the caller.
+    """
+    ranges = None
+    if request.method in ('GET', 'HEAD') and if_range_matches(request, etag, last_modified):
+        try:
+            ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return _finish(response, etag, last_modified)
+
+    if not ranges:
+        response = StreamingHttpResponse(
+            read_range(0, size - 1) if size else iter(()),
+            content_type=content_type
+        )
+        response['Content-Length'] = str(size)
+
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(read_range(start, end), status=206, content_type=content_type)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    else:
+        boundary = uuid.uuid4().hex
+        parts = [
+            (
+                f'\r\n--{boundary}\r\nContent-Type: {content_type}\r\n'
+                f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+            ).encode('ascii')
+            for start, end in ranges
+        ]
+        closing = f'\r\n--{boundary}--\r\n'.encode('ascii')
+
+        def multipart():
+            for header, (start, end) in zip(parts, ranges):
+                yield header
+                yield from read_range(start, end)
+            yield closing
+
+        response = StreamingHttpResponse(
+            multipart(), status=206, content_type=f'multipart/byteranges; boundary={boundary}'
+        )
+        response['Content-Length'] = str(
+            sum(len(header) for header in parts)
+            + sum(end - start + 1 for start, end in ranges)
+            + len(closing)
+        )
+
+    return _finish(response, etag, last_modified)
+
+
+def _finish(response, etag, last_modified):
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def iter_file_chunks(path: str, start: int, end: int, chunk_size: Optional[int] = None):
+    """Yield bytes start..end (inclusive) of a local file in bounded chunks"""
+    chunk_size = chunk_size or getattr(settings, 'FILE_STREAM_CHUNK_SIZE', 256 * 1024)
+    remaining = end - start + 1
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def local_file_etag(stat_result) -> str:
+    """Cheap validator for a local file from its modification time and size"""
+    return f'"{int(stat_result.st_mtime):x}-{stat_result.st_size:x}"'
+
+
+# originals/ab/cd/<sha256>.jpg and derivatives/ab/cd/<sha256>_thumb.jpg never change
+CONTENT_ADDRESSED_NAME = re.compile(r'(?:^|/)(?:originals|derivatives)/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64}(?:_thumb)?)\.')
+
+
+def media_file_etag(name: str, stat_result) -> str:
+    """
+    Validator for a media file without reading it
+
+    Content-addressed files use the content hash in their name, which is the
+    same on every server; other files use modification time and size.
+    """
+    match = CONTENT_ADDRESSED_NAME.search(name)
+    if match:
+        return f'"{match.group(1)}"'
+    return local_file_etag(stat_result)
+
+
+def offload_response(mode: str, content_type: str, signed_url: Optional[str] = None,
+                     local_path: Optional[str] = None) -> Optional[HttpResponse]:
+    """
+    Let the front-end proxy send a file that Django has already authorized
+
+    Args:
+        mode: PROTECTED_FILE_OFFLOAD: 'x-accel-redirect' (nginx) or 'x-sendfile'
+        content_type: Content type of the file
+        signed_url: Short-lived URL nginx may fetch a remote object from
+        local_path: Filesystem path, for files on the proxy's own disk
+
+    Returns:
+        An empty response carrying the offload header, or None if the mode
+        cannot serve this file and the caller should stream it instead
+    """
+    response = HttpResponse(content_type=content_type)
+
+    if mode == 'x-accel-redirect':
+        location = getattr(settings, 'PROTECTED_FILE_OFFLOAD_LOCATION', '/_protected/')
+        if local_path:
+            root = getattr(settings, 'PROTECTED_FILE_OFFLOAD_ROOT', '')
+            if not root or not local_path.startswith(root.rstrip('/') + '/'):
+                return None
+            # nginx decodes the redirect URI, so names with spaces, '?', '#' or
+            # non-ASCII characters must be percent-encoded
+            relative = local_path[len(root.rstrip('/')) + 1:]
+            response['X-Accel-Redirect'] = location + 'local/' + quote(relative, safe='/')
+        elif signed_url:
+            # The internal location proxies to the URL in X-Offload-Url; passing
+            # it in a header keeps percent-encoding that nginx would decode in a path
+            response['X-Accel-Redirect'] = location + 'remote/'
+            response['X-Offload-Url'] = signed_url
+        else:
+            return None
+        return response
+
+    if mode == 'x-sendfile' and local_path:
+        response['X-Sendfile'] = local_path
+        return response
+
+    return None
@@ -0,0 +1,115 @@
+"""
+Compare face detector backends on a labelled local fixture set
+Usage: python manage.py benchmark_face_detectors <fixture_dir> [--backends haar,lbp,dnn] [--repeat 3]
+
+The fixture directory holds the images plus a labels.json mapping each file
+name to its ground-truth face boxes in pixels:
+
+    {"group.jpg": [[x, y, width, height], ...], "empty.jpg": []}
+"""
+
+import json
+import os
+import time
+
+import cv2
+from django.core.management.base import BaseCommand, CommandError
+
+from images.benchmarking import match_detections, summarize_latencies
+from images.face_detectors import FACE_DETECTOR_BACKENDS, FaceDetectorUnavailable, create_face_detector
+
+
+class Command(BaseCommand):
+    help = 'Report throughput, latency percentiles and recall for each face detector backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixture_dir', help='Directory containing images and labels.json')
+        parser.add_argument('--backends', default=','.join(FACE_DETECTOR_BACKENDS),
+                            help='Comma-separated backends to compare (default: all)')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Timed passes over the fixture set per backend')
+        parser.add_argument('--iou', type=float, default=0.5,
+                            help='IoU needed for a detection to count as a hit')
+        parser.add_argument('--json', action='store_true',
+                            help='Print results as JSON instead of a table')
+
+    def handle(self, *args, **options):
+        fixtures = self._load_fixtures(options['fixture_dir'])
+        total_faces = sum(len(boxes) for _, _, boxes in fixtures)
+
+        results = []
+        for backend in [b.strip() for b in options['backends'].split(',') if b.strip()]:
+            try:
+                detector = create_face_detector(backend)
+            except FaceDetectorUnavailable as e:
+                self.stderr.write(self.style.WARNING(f"Skipping {backend}: {e}"))
+                continue
+
+            # Warm-up pass so lazy initialisation is not counted
+            detector.detect(fixtures[0][1])
+
+            latencies = []
+            matched = detected = 0
+            started = time.perf_counter()
+            for repeat in range(options['repeat']):
+                for _, image, boxes in fixtures:
+                    call_started = time.perf_counter()
+                    detections = detector.detect(image)
+                    latencies.append(time.perf_counter() - call_started)
+
+                    if repeat == 0:
+                        detected += len(detections)
+                        matched += match_detections(boxes, detections, options['iou'])
+            elapsed = time.perf_counter() - started
+
+            results.append({
+                'backend': backend,
+                'images_per_second': len(latencies) / elapsed if elapsed else 0.0,
+                'recall': matched / total_faces if total_faces else None,
+                'precision': matched / detected if detected else None,
+                'detections': detected,
+                **summarize_latencies(latencies),
+            })
+
+        if not results:
+            raise CommandError('No face detector backend could be loaded')
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f"{len(fixtures)} images, {total_faces} labelled faces, "
+            f"{options['repeat']} passes, IoU >= {options['iou']}"
+        )
+        self.stdout.write(
+            f"{'backend':<8} {'img/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'recall':>7} {'prec':>7}"
+        )
+        for row in results:
+            recall = f"{row['recall']:.3f}" if row['recall'] is not None else '-'
+            precision = f"{row['precision']:.3f}" if row['precision'] is not None else '-'
+            self.stdout.write(
+                f"{row['backend']:<8} {row['images_per_second']:>8.1f} {row['p50_ms']:>8.1f} "
+                f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {recall:>7} {precision:>7}"
+            )
+
+    def _load_fixtures(self, fixture_dir):
+        labels_path = os.path.join(fixture_dir, 'labels.json')
+        if not os.path.exists(labels_path):
+            raise CommandError(f"No labels.json found in {fixture_dir}")
+
+        with open(labels_path) as f:
+            labels = json.load(f)
+
+        # Decode everything up front so decoding is not part of detector latency
+        fixtures = []
+        for filename, boxes in sorted(labels.items()):
+            image = cv2.imread(os.path.join(fixture_dir, filename))
+            if image is None:
+                self.stderr.write(self.style.WARNING(f"Could not read {filename}, skipping"))
+                continue
+            fixtures.append((filename, image, boxes))
+
+        if not fixtures:
+            raise CommandError(f"No readable images listed in {labels_path}")
+        return fixtures
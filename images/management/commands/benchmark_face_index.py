@@ -0,0 +1,99 @@
+"""
+Measure recall and latency of the approximate face index against exact search
+Usage: python manage.py benchmark_face_index [--synthetic 100000] [--nprobe 1,4,8,16,32] [--k 10]
+
+Without --synthetic the stored face encodings are used.
+"""
+
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from images.benchmarking import summarize_latencies
+from images.face_index import IVFFaceIndex, exact_search
+from images.face_recognition_utils import ENCODING_ALGORITHM_VERSION, ENCODING_SIZE, unpack_encodings
+
+
+class Command(BaseCommand):
+    help = 'Compare IVF face index recall and latency with brute-force search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', type=int, default=None,
+                            help='Benchmark on this many generated encodings instead of the database')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Number of query encodings')
+        parser.add_argument('--k', type=int, default=10,
+                            help='Neighbours per query')
+        parser.add_argument('--nprobe', default='1,4,8,16,32',
+                            help='Comma-separated nprobe values to try')
+        parser.add_argument('--nlist', type=int, default=None,
+                            help='Number of coarse buckets (default: 4 * sqrt(n))')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        ids, vectors = self._load_vectors(options, rng)
+        if len(vectors) < 2:
+            raise CommandError('Not enough face encodings to benchmark')
+
+        # Queries are perturbed copies of stored faces, like a new photo of a known person
+        picks = rng.choice(len(vectors), min(options['queries'], len(vectors)), replace=False)
+        queries = vectors[picks] + rng.normal(0, 0.02, size=(len(picks), vectors.shape[1])).astype(np.float32)
+        k = options['k']
+
+        exact_latencies = []
+        truth = []
+        for query in queries:
+            started = time.perf_counter()
+            truth.append(exact_search(ids, vectors, query, k=k)[0])
+            exact_latencies.append(time.perf_counter() - started)
+        exact = summarize_latencies(exact_latencies)
+
+        with tempfile.TemporaryDirectory() as path:
+            started = time.perf_counter()
+            index = IVFFaceIndex.build(path, ids, vectors, nlist=options['nlist'])
+            build_seconds = time.perf_counter() - started
+
+            self.stdout.write(
+                f"{len(vectors)} faces, {len(index.centroids)} buckets, built in {build_seconds:.1f}s; "
+                f"{len(queries)} queries, k={k}"
+            )
+            self.stdout.write(f"{'search':<12} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'speedup':>8}")
+            self.stdout.write(f"{'exact':<12} {1.0:>7.3f} {exact['p50_ms']:>8.2f} {exact['p95_ms']:>8.2f} {1.0:>7.1f}x")
+
+            for nprobe in [int(n) for n in options['nprobe'].split(',') if n.strip()]:
+                latencies = []
+                hits = 0
+                for query, expected in zip(queries, truth):
+                    started = time.perf_counter()
+                    found = index.search(query, k=k, nprobe=nprobe)[0]
+                    latencies.append(time.perf_counter() - started)
+                    hits += len({i for i, _ in found} & {i for i, _ in expected})
+
+                summary = summarize_latencies(latencies)
+                recall = hits / (len(queries) * min(k, len(vectors)))
+                speedup = exact['p50_ms'] / summary['p50_ms'] if summary['p50_ms'] else 0.0
+                self.stdout.write(
+                    f"{'nprobe=' + str(nprobe):<12} {recall:>7.3f} {summary['p50_ms']:>8.2f} "
+                    f"{summary['p95_ms']:>8.2f} {speedup:>7.1f}x"
+                )
+
+    def _load_vectors(self, options, rng):
+        if options['synthetic']:
+            # Clustered data: many faces per person, like a real event
+            people = max(1, options['synthetic'] // 50)
+            centres = rng.random((people, ENCODING_SIZE), dtype=np.float32)
+            owners = rng.integers(0, people, options['synthetic'])
+            vectors = centres[owners] + rng.normal(0, 0.3, size=(options['synthetic'], ENCODING_SIZE)).astype(np.float32)
+            return np.arange(len(vectors), dtype=np.int64), vectors
+
+        from images.models import FaceTag
+
+        rows = list(FaceTag.objects.filter(
+            face_encoding__isnull=False,
+            encoding_version=ENCODING_ALGORITHM_VERSION
+        ).values_list('id', 'face_encoding'))
+        vectors, kept = unpack_encodings([blob for _, blob in rows])
+        return np.asarray([rows[i][0] for i in kept], dtype=np.int64), vectors
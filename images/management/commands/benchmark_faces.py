@@ -0,0 +1,72 @@
+"""
+Benchmark the face-detection and recognition pipeline against a saved baseline
+Usage: python manage.py benchmark_faces [--repeat 5] [--fixtures DIR] [--save-baseline] [--threshold 0.25]
+
+Baselines are machine-specific: save one on the machine that will run the
+comparison (python manage.py benchmark_faces --save-baseline).
+"""
+
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from images.benchmarking import find_regressions, load_baseline, run_face_benchmarks, save_baseline
+
+
+class Command(BaseCommand):
+    help = 'Time face detection, encoding and matching and fail on regressions against the baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed runs per benchmark')
+        parser.add_argument('--fixtures', default=None,
+                            help='Directory of real photos to benchmark alongside the synthetic images')
+        parser.add_argument('--baseline', default=None,
+                            help='Baseline JSON file (default: FACE_BENCHMARK_BASELINE)')
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Allowed p50 slowdown before failing, e.g. 0.25 for 25%% '
+                                 '(default: FACE_BENCHMARK_REGRESSION_THRESHOLD)')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Store these results as the new baseline instead of comparing')
+        parser.add_argument('--json', action='store_true',
+                            help='Print raw results as JSON')
+
+    def handle(self, *args, **options):
+        baseline_path = options['baseline'] or settings.FACE_BENCHMARK_BASELINE
+        threshold = options['threshold']
+        if threshold is None:
+            threshold = getattr(settings, 'FACE_BENCHMARK_REGRESSION_THRESHOLD', 0.25)
+
+        results = run_face_benchmarks(repeat=options['repeat'], fixture_dir=options['fixtures'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+        else:
+            self.stdout.write(f"{'benchmark':<48} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+            for name, summary in sorted(results.items()):
+                self.stdout.write(
+                    f"{name:<48} {summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f}"
+                )
+
+        if options['save_baseline']:
+            save_baseline(results, baseline_path)
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {baseline_path}"))
+            return
+
+        baseline = load_baseline(baseline_path)
+        if baseline is None:
+            self.stdout.write(self.style.WARNING(
+                f"No baseline at {baseline_path}; run with --save-baseline to create one"
+            ))
+            return
+
+        regressions = find_regressions(results, baseline, threshold=threshold)
+        if regressions:
+            for r in regressions:
+                self.stderr.write(
+                    f"{r['name']}: {r['baseline']:.2f} ms -> {r['current']:.2f} ms (+{r['change']:.0%})"
+                )
+            raise CommandError(f"{len(regressions)} benchmark(s) regressed by more than {threshold:.0%}")
+
+        self.stdout.write(self.style.SUCCESS(f"No regressions beyond {threshold:.0%} against {baseline_path}"))
@@ -0,0 +1,29 @@
+"""
+Rebuild the approximate nearest-neighbour face index from stored encodings
+Usage: python manage.py build_face_index [--nlist 1024]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from images.face_index import build_face_index, get_face_index_path
+
+
+class Command(BaseCommand):
+    help = 'Train and write the IVF face index used for large-scale face matching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nlist', type=int, default=None,
+                            help='Number of coarse buckets (default: 4 * sqrt(number of faces))')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        index = build_face_index(nlist=options['nlist'])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(index)} faces in {len(index.centroids)} buckets at "
+            f"{get_face_index_path()} in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,37 @@
+"""
+Cluster every untagged face into proposed people
+Usage: python manage.py cluster_faces [--threshold 0.92] [--block-size 1024] [--min-size 2]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from images.face_clustering import cluster_untagged_faces
+
+
+class Command(BaseCommand):
+    help = 'Cluster untagged face encodings into proposed people for admins to name'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Similarity (0-1) needed to join a cluster (default: FACE_CLUSTER_THRESHOLD)')
+        parser.add_argument('--block-size', type=int, default=None,
+                            help='Faces scored per block; bounds peak memory (default: FACE_CLUSTER_BLOCK_SIZE)')
+        parser.add_argument('--min-size', type=int, default=None,
+                            help='Smallest cluster worth proposing (default: FACE_CLUSTER_MIN_SIZE)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        summary = cluster_untagged_faces(
+            threshold=options['threshold'],
+            block_size=options['block_size'],
+            min_cluster_size=options['min_size'],
+        )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Clustered {summary['clustered_face_count']} of {summary['face_count']} untagged faces "
+            f"into {summary['cluster_count']} proposed people in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,70 @@
+"""
+Hash originals uploaded before content addressing and link identical photos
+Usage: python manage.py dedupe_images [--limit 1000] [--relink]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from images.models import ContentBlob, Image
+
+
+class Command(BaseCommand):
+    help = 'Link images without a ContentBlob to one by SHA-256; --relink also points duplicates at the shared files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Process at most this many images')
+        parser.add_argument('--relink', action='store_true',
+                            help='Point duplicate images at the first copy and delete their own files')
+
+    def handle(self, *args, **options):
+        images = (
+            Image.objects.filter(content__isnull=True)
+            .exclude(image_file='').exclude(image_file__isnull=True)
+            .order_by('id')
+        )
+        if options['limit']:
+            images = images[:options['limit']]
+
+        started = time.perf_counter()
+        linked = duplicates = missing = bytes_freed = 0
+
+        for image in images.iterator(chunk_size=100):
+            try:
+                with image.image_file.open('rb') as f:
+                    digest, size = ContentBlob.hash_file(f)
+            except (FileNotFoundError, OSError):
+                missing += 1
+                continue
+
+            # The first copy seen becomes the shared one
+            blob = ContentBlob.acquire(digest, size)
+            ContentBlob.objects.filter(pk=blob.pk, file_name='').update(file_name=image.image_file.name)
+            if image.thumbnail:
+                ContentBlob.objects.filter(pk=blob.pk, thumbnail_name='').update(thumbnail_name=image.thumbnail.name)
+            blob.refresh_from_db()
+
+            update = {'content': blob}
+            redundant = []
+            if blob.file_name != image.image_file.name:
+                duplicates += 1
+                if options['relink']:
+                    update['image_file'] = blob.file_name
+                    redundant.append(image.image_file.name)
+                    bytes_freed += size
+                    if blob.thumbnail_name and image.thumbnail.name != blob.thumbnail_name:
+                        update['thumbnail'] = blob.thumbnail_name
+                        redundant.append(image.thumbnail.name)
+
+            Image.objects.filter(pk=image.pk).update(**update)
+            for name in filter(None, redundant):
+                image.image_file.storage.delete(name)
+            linked += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Linked {linked} images ({duplicates} duplicates, {bytes_freed} bytes freed, "
+            f"{missing} missing files) in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,43 @@
+"""
+Store unassigned face detections for photos uploaded before ingest-time detection
+Usage: python manage.py detect_stored_faces [--limit 500] [--all]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from images.face_recognition_utils import detect_faces_in_uploaded_image, store_detected_faces
+from images.models import Image
+
+
+class Command(BaseCommand):
+    help = 'Detect faces in photos without stored detections and save them as unassigned face tags'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Process at most this many photos')
+        parser.add_argument('--all', action='store_true',
+                            help='Re-detect every photo, replacing earlier unassigned detections')
+
+    def handle(self, *args, **options):
+        images = Image.objects.exclude(image_file='').exclude(image_file__isnull=True).order_by('id')
+        if not options['all']:
+            images = images.filter(faces_detected_at__isnull=True)
+        if options['limit']:
+            images = images[:options['limit']]
+
+        started = time.perf_counter()
+        image_count = face_count = 0
+
+        for image in images.iterator(chunk_size=100):
+            faces = detect_faces_in_uploaded_image(image)
+            face_count += len(store_detected_faces(image, faces))
+            image_count += 1
+            if image_count % 100 == 0:
+                self.stdout.write(f"{image_count} photos, {face_count} faces stored")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {face_count} faces from {image_count} photos in {elapsed:.1f}s"
+        ))
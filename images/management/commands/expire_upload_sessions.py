@@ -0,0 +1,46 @@
+"""
+Remove the objects of direct uploads that were never completed
+Usage: python manage.py expire_upload_sessions [--dry-run]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from images.models import Image, UploadSession
+
+
+class Command(BaseCommand):
+    help = 'Mark pending direct uploads past their expiry as expired and delete whatever was uploaded for them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many sessions would be expired')
+
+    def handle(self, *args, **options):
+        sessions = UploadSession.objects.filter(
+            status='pending', expires_at__lte=timezone.now()
+        ).order_by('expires_at')
+
+        if options['dry_run']:
+            self.stdout.write(f"{sessions.count()} upload sessions would be expired")
+            return
+
+        storage = Image._meta.get_field('image_file').storage
+        started = time.perf_counter()
+        expired = 0
+
+        for session in sessions.iterator(chunk_size=100):
+            # Claim it first so a completion racing this command wins or loses cleanly
+            if not UploadSession.objects.filter(pk=session.pk, status='pending').update(status='verifying'):
+                continue
+            try:
+                storage.delete(session.file_name)
+            except Exception as e:
+                self.stderr.write(f"Could not delete {session.file_name}: {e}")
+            session.fail('Upload session expired', status='expired')
+            expired += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} upload sessions in {elapsed:.1f}s"))
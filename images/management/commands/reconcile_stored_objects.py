@@ -0,0 +1,103 @@
+"""
+Resync the StoredObject index from the objects and ACL policies in storage
+Usage: python manage.py reconcile_stored_objects [--prefix /default-bucket/private] [--prune]
+"""
+
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from images.models import StoredObject
+from images.storage import ReplitAppStorage, blob_metadata, get_storage_client
+
+BATCH_SIZE = 500
+
+UPDATE_FIELDS = [
+    'owner', 'visibility', 'acl_rules', 'size', 'content_type',
+    'etag', 'generation', 'modified_at', 'synced_at',
+]
+
+
+class Command(BaseCommand):
+    help = 'Upsert a StoredObject row for every object with an ACL policy, optionally pruning rows for missing objects'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', action='append', default=None,
+                            help='Storage path to scan, e.g. /default-bucket/private '
+                                 '(repeatable; default: PRIVATE_OBJECT_DIR and PUBLIC_OBJECT_SEARCH_PATHS)')
+        parser.add_argument('--prune', action='store_true',
+                            help='Delete rows under the scanned paths whose object is gone or has no ACL policy')
+
+    def handle(self, *args, **options):
+        storage = ReplitAppStorage()
+        prefixes = options['prefix'] or (
+            [os.getenv('PRIVATE_OBJECT_DIR', '/default-bucket/private')]
+            + os.getenv('PUBLIC_OBJECT_SEARCH_PATHS', '/default-bucket/public').split(',')
+        )
+
+        started_at = timezone.now()
+        started = time.perf_counter()
+        scanned = synced = pruned = 0
+
+        for prefix in prefixes:
+            try:
+                bucket_name, object_prefix = storage._get_bucket_and_object_name(prefix.strip())
+            except ValueError as e:
+                raise CommandError(f"{prefix}: {e}")
+
+            scanned_before, synced_before = scanned, synced
+            batch = []
+            for blob in get_storage_client().list_blobs(bucket_name, prefix=object_prefix):
+                scanned += 1
+                metadata = blob_metadata(blob)
+                if not metadata['acl_policy']:
+                    continue
+                batch.append((blob.name, metadata))
+                if len(batch) >= BATCH_SIZE:
+                    synced += self._upsert(bucket_name, batch)
+                    batch = []
+            if batch:
+                synced += self._upsert(bucket_name, batch)
+
+            # Every row seen above was just touched, so older ones are stale
+            if options['prune']:
+                pruned += StoredObject.objects.filter(
+                    bucket=bucket_name,
+                    object_name__startswith=object_prefix,
+                    synced_at__lt=started_at
+                ).delete()[0]
+
+            self.stdout.write(
+                f"{prefix}: {scanned - scanned_before} objects scanned, {synced - synced_before} synced"
+            )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {synced} of {scanned} objects and pruned {pruned} rows in {elapsed:.1f}s"
+        ))
+
+    def _upsert(self, bucket_name, batch):
+        """Insert or update one batch of (object_name, metadata) in a single query"""
+        owner_ids = {
+            int(owner) for owner in (str(metadata['acl_policy'].get('owner', '')) for _, metadata in batch)
+            if owner.isdigit()
+        }
+        existing_users = set(User.objects.filter(pk__in=owner_ids).values_list('pk', flat=True))
+
+        rows = []
+        for object_name, metadata in batch:
+            fields = StoredObject.fields_from_metadata(metadata)
+            if fields['owner_id'] not in existing_users:
+                fields['owner_id'] = None
+            rows.append(StoredObject(bucket=bucket_name, object_name=object_name, **fields))
+
+        StoredObject.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['bucket', 'object_name'],
+            update_fields=UPDATE_FIELDS
+        )
+        return len(rows)
@@ -0,0 +1,82 @@
+"""
+Re-encode every stored face with the current encoding algorithm
+Usage: python manage.py reencode_faces [--batch-size 200] [--workers 4] [--restart] [--no-swap | --swap-only]
+
+Progress is checkpointed on a 'reencode_faces' ProcessingJob after every batch;
+re-running the command resumes the unfinished job for the same version.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from images.face_recognition_utils import ENCODING_ALGORITHM_VERSION
+from images.face_reencoding import get_or_create_reencode_job, reencode_faces, swap_staged_encodings
+
+
+class Command(BaseCommand):
+    help = 'Backfill face encodings for the current encoding algorithm version, resumably and in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Faces per worker task and per checkpoint')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: FACE_REENCODE_WORKERS; 0 to encode in this process)')
+        parser.add_argument('--target-version', type=int, default=ENCODING_ALGORITHM_VERSION,
+                            help='Target encoding version (default: the current algorithm)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore any saved checkpoint and start from the first face')
+        parser.add_argument('--no-swap', action='store_true',
+                            help='Stage the new encodings but do not switch matching over to them')
+        parser.add_argument('--swap-only', action='store_true',
+                            help='Only swap previously staged encodings in')
+
+    def handle(self, *args, **options):
+        version = options['target_version']
+        started = time.perf_counter()
+
+        if options['swap_only']:
+            swapped = swap_staged_encodings(version)
+            self.stdout.write(self.style.SUCCESS(f"Swapped in {swapped} version {version} encodings"))
+            return
+
+        job = get_or_create_reencode_job(version, restart=options['restart'])
+        if job.result:
+            self.stdout.write(f"Resuming job {job.id} after face {job.result.get('last_id')}")
+
+        job.status = 'running'
+        job.started_at = job.started_at or timezone.now()
+        job.error = ''
+        job.save(update_fields=['status', 'started_at', 'error'])
+
+        def progress(state):
+            self.stdout.write(
+                f"  up to face {state['last_id']}: {state['encoded']} encoded, {state['failed']} unreadable"
+            )
+
+        try:
+            state = reencode_faces(
+                job,
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                swap=not options['no_swap'],
+                progress=progress
+            )
+        except BaseException as e:
+            # Keep the checkpoint; the next run resumes from it
+            job.status = 'failed'
+            job.error = str(e) or e.__class__.__name__
+            job.save(update_fields=['status', 'error'])
+            raise
+
+        job.status = 'completed'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'finished_at'])
+
+        elapsed = time.perf_counter() - started
+        swapped = f", swapped in {state['swapped']}" if state['swapped'] is not None else ' (staged only)'
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-encoded {state['encoded']} faces to version {version}{swapped}; "
+            f"{state['failed']} could not be read ({elapsed:.1f}s)"
+        ))
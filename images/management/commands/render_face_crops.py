@@ -0,0 +1,39 @@
+"""
+Render missing face-crop thumbnails and pick every person's avatar
+Usage: python manage.py render_face_crops [--limit 5000]
+"""
+
+import time
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+
+from images.models import FaceTag, Person
+
+
+class Command(BaseCommand):
+    help = 'Generate face crops for tags without one, then refresh person avatars'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Render at most this many crops')
+
+    def handle(self, *args, **options):
+        missing = FaceTag.objects.filter(face_crop='') | FaceTag.objects.filter(face_crop__isnull=True)
+        missing = missing.select_related('image').order_by('image_id', 'id')
+        if options['limit']:
+            missing = missing[:options['limit']]
+
+        started = time.perf_counter()
+        rendered = 0
+
+        # Crops of the same photo are rendered together so it is decoded once
+        for _, face_tags in groupby(missing.iterator(chunk_size=500), key=lambda face_tag: face_tag.image_id):
+            face_tags = list(face_tags)
+            FaceTag.generate_face_crops(face_tags)
+            rendered += sum(1 for face_tag in face_tags if face_tag.face_crop)
+
+        Person.refresh_avatars(Person.objects.values_list('id', flat=True))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Rendered {rendered} face crops in {elapsed:.1f}s"))
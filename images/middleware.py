@@ -1,10 +1,18 @@
 """
 Middleware for media file caching and performance optimization
 """
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import HttpResponseNotModified
+from django.utils._os import safe_join
 from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
 from django.conf import settings
+import os
+import posixpath
 import re
 
+from .file_serving import is_not_modified, media_file_etag
+
 
 class MediaCacheMiddleware:
     """
@@ -14,6 +22,10 @@ class MediaCacheMiddleware:
     - Original media files: 1 year cache (immutable)
     - Thumbnail files: 1 year cache (immutable)
     - Other requests: No caching
+    
+    Validators (ETag, Last-Modified) come from the file's stat and name, and
+    conditional GETs are answered with 304 before the file is opened. The
+    response body is never read, so streaming responses pass through as is.
     """
     
     def __init__(self, get_response):
@@ -21,16 +33,20 @@ class MediaCacheMiddleware:
         self.media_url = settings.MEDIA_URL.rstrip('/')
         
     def __call__(self, request):
-        response = self.get_response(request)
+        validators = self._validators(request)
+        if validators is not None and is_not_modified(request, *validators):
+            response = HttpResponseNotModified()
+        else:
+            response = self.get_response(request)
         
         # Only process successful responses
-        if response.status_code != 200:
+        if response.status_code not in (200, 304):
             return response
         
         # Check if this is a media file request
         if request.path.startswith(self.media_url):
             # Determine if this is a thumbnail or original image
-            if '/thumbnails/' in request.path or '.thumbnail.' in request.path:
+            if '/thumbnails/' in request.path or '/derivatives/' in request.path or '.thumbnail.' in request.path:
                 # Thumbnails: Aggressive caching (1 year, immutable)
                 patch_cache_control(
                     response,
@@ -48,14 +64,23 @@ class MediaCacheMiddleware:
                 )
             
             # Add ETag support for conditional requests
-            if not response.has_header('ETag') and hasattr(response, 'content'):
-                from hashlib import md5
-                etag = md5(response.content).hexdigest()
-                response['ETag'] = f'"{etag}"'
-                
-                # Handle If-None-Match for 304 responses
-                if request.META.get('HTTP_IF_NONE_MATCH') == response['ETag']:
-                    response.status_code = 304
-                    response.content = b''
+            if validators is not None:
+                etag, mtime = validators
+                if not response.has_header('ETag'):
+                    response['ETag'] = etag
+                if not response.has_header('Last-Modified'):
+                    response['Last-Modified'] = http_date(mtime)
         
         return response
+    
+    def _validators(self, request):
+        """(ETag, modification time) of a requested media file from its stat, or None"""
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(self.media_url + '/'):
+            return None
+        name = request.path[len(self.media_url) + 1:]
+        try:
+            path = safe_join(settings.MEDIA_ROOT, posixpath.normpath(name).lstrip('/'))
+            stat_result = os.stat(path)
+        except (SuspiciousFileOperation, OSError, ValueError):
+            return None
+        return media_file_etag(name, stat_result), stat_result.st_mtime
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.2 on 2026-10-19 10:02
+
+from django.db import migrations, models
+
+
+def seed_prototypes(apps, schema_editor):
+    """Existing single encodings become the first prototype"""
+    Person = apps.get_model('images', 'Person')
+    for person in Person.objects.exclude(face_encoding__isnull=True):
+        person.prototype_encodings = [person.face_encoding]
+        person.encoding_count = 1
+        person.save(update_fields=['prototype_encodings', 'encoding_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0017_person_facetag_processingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='encoding_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of approved encodings folded into the mean'),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='prototype_encodings',
+            field=models.JSONField(blank=True, default=list, help_text='Small set of diverse exemplar encodings'),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='face_encoding',
+            field=models.JSONField(blank=True, help_text='Running mean of approved face encodings', null=True),
+        ),
+        migrations.RunPython(seed_prototypes, migrations.RunPython.noop),
+    ]
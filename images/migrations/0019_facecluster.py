@@ -0,0 +1,38 @@
+# Generated by Django 5.0.2 on 2026-10-19 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0018_person_prototype_encodings'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='processingjob',
+            name='kind',
+            field=models.CharField(choices=[('detect_faces', 'Face Detection'), ('cluster_faces', 'Face Clustering')], max_length=30),
+        ),
+        migrations.CreateModel(
+            name='FaceCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('proposed', 'Proposed'), ('named', 'Named'), ('dismissed', 'Dismissed')], default='proposed', max_length=20)),
+                ('size', models.PositiveIntegerField(default=0, help_text='Number of faces in the cluster when proposed')),
+                ('centroid', models.JSONField(blank=True, help_text='Normalized mean encoding of the cluster', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('person', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='face_clusters', to='images.person')),
+            ],
+            options={
+                'ordering': ['-size', '-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='facetag',
+            name='cluster',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='face_tags', to='images.facecluster'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.2 on 2026-10-19 12:41
+
+import images.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0019_facecluster'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facetag',
+            name='face_crop',
+            field=models.ImageField(blank=True, help_text='Small square crop of the face, rendered at detection time', null=True, upload_to=images.models.get_face_crop_upload_path),
+        ),
+        migrations.AddIndex(
+            model_name='facetag',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='facetag_status_created_idx'),
+        ),
+    ]
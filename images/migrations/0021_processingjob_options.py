@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-19 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0020_facetag_face_crop'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='options',
+            field=models.JSONField(blank=True, default=dict, help_text='Parameters passed to the job handler'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0021_processingjob_options'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='facetag',
+            index=models.Index(fields=['person', 'status', 'image'], name='facetag_person_status_img_idx'),
+        ),
+    ]
@@ -0,0 +1,126 @@
+# Generated by Django 5.0.2 on 2026-10-19 15:10
+
+import numpy as np
+from django.db import migrations, models
+
+# Matches face_recognition_utils.ENCODING_FORMATS: version 1 is little-endian float32
+FLOAT32_VERSION = 1
+BATCH_SIZE = 1000
+
+
+def _pack(values):
+    return bytes([FLOAT32_VERSION]) + np.asarray(values, dtype='<f4').tobytes()
+
+
+def _unpack(blob, dim=None):
+    values = np.frombuffer(blob, dtype='<f4' if blob[0] == FLOAT32_VERSION else '<f2', offset=1)
+    return values.reshape(-1, dim).tolist() if dim else values.tolist()
+
+
+def _convert(model, fields, convert):
+    """Rewrite each (source, target) field pair in batches with bulk_update"""
+    batch = []
+    sources = [source for source, _ in fields]
+    for obj in model.objects.only('id', *sources).iterator(chunk_size=BATCH_SIZE):
+        for source, target in fields:
+            value = getattr(obj, source)
+            setattr(obj, target, convert(value, source) if value else None)
+        batch.append(obj)
+        if len(batch) == BATCH_SIZE:
+            model.objects.bulk_update(batch, [target for _, target in fields])
+            batch = []
+    if batch:
+        model.objects.bulk_update(batch, [target for _, target in fields])
+
+
+def pack_encodings(apps, schema_editor):
+    """JSON float lists -> packed float32 blobs"""
+    def convert(value, source):
+        return _pack(value)
+
+    _convert(apps.get_model('images', 'FaceTag'), [('face_encoding', 'face_encoding_packed')], convert)
+    _convert(apps.get_model('images', 'Person'), [
+        ('face_encoding', 'face_encoding_packed'),
+        ('prototype_encodings', 'prototype_encodings_packed'),
+    ], convert)
+
+
+def unpack_encodings(apps, schema_editor):
+    """Packed blobs -> JSON float lists"""
+    def convert(value, source):
+        # Prototypes are a stack of ENCODING_SIZE (138) rows
+        return _unpack(bytes(value), 138 if source == 'prototype_encodings_packed' else None)
+
+    _convert(apps.get_model('images', 'FaceTag'), [('face_encoding_packed', 'face_encoding')], convert)
+    _convert(apps.get_model('images', 'Person'), [
+        ('face_encoding_packed', 'face_encoding'),
+        ('prototype_encodings_packed', 'prototype_encodings'),
+    ], convert)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0022_facetag_person_status_img_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facetag',
+            name='face_encoding_packed',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='face_encoding_packed',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='prototype_encodings_packed',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(pack_encodings, unpack_encodings),
+        migrations.RemoveField(
+            model_name='facetag',
+            name='face_encoding',
+        ),
+        migrations.RemoveField(
+            model_name='person',
+            name='face_encoding',
+        ),
+        migrations.RemoveField(
+            model_name='person',
+            name='prototype_encodings',
+        ),
+        migrations.RenameField(
+            model_name='facetag',
+            old_name='face_encoding_packed',
+            new_name='face_encoding',
+        ),
+        migrations.RenameField(
+            model_name='person',
+            old_name='face_encoding_packed',
+            new_name='face_encoding',
+        ),
+        migrations.RenameField(
+            model_name='person',
+            old_name='prototype_encodings_packed',
+            new_name='prototype_encodings',
+        ),
+        migrations.AlterField(
+            model_name='facetag',
+            name='face_encoding',
+            field=models.BinaryField(blank=True, help_text='Face encoding for this detection (packed)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='face_encoding',
+            field=models.BinaryField(blank=True, help_text='Running mean of approved face encodings (packed)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='prototype_encodings',
+            field=models.BinaryField(blank=True, help_text='Small set of diverse exemplar encodings (packed)', null=True),
+        ),
+    ]
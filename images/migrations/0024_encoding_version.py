@@ -0,0 +1,47 @@
+# Generated by Django 5.0.2 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+def mark_existing_encodings(apps, schema_editor):
+    """Everything stored so far came from the first encoding algorithm"""
+    FaceTag = apps.get_model('images', 'FaceTag')
+    Person = apps.get_model('images', 'Person')
+    FaceTag.objects.filter(face_encoding__isnull=False).update(encoding_version=1)
+    Person.objects.filter(face_encoding__isnull=False).update(encoding_version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0023_binary_face_encodings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facetag',
+            name='encoding_version',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Encoding algorithm version of face_encoding', null=True),
+        ),
+        migrations.AddField(
+            model_name='facetag',
+            name='staged_encoding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='facetag',
+            name='staged_encoding_version',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='encoding_version',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Encoding algorithm version of the mean and prototypes', null=True),
+        ),
+        migrations.AlterField(
+            model_name='processingjob',
+            name='kind',
+            field=models.CharField(choices=[('detect_faces', 'Face Detection'), ('cluster_faces', 'Face Clustering'), ('reencode_faces', 'Face Re-encoding')], max_length=30),
+        ),
+        migrations.RunPython(mark_existing_encodings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.2 on 2026-10-19 17:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0024_encoding_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='faces_detected_at',
+            field=models.DateTimeField(blank=True, help_text='When every detected face was stored as a FaceTag', null=True),
+        ),
+        migrations.AlterField(
+            model_name='facetag',
+            name='status',
+            field=models.CharField(choices=[('unassigned', 'Unassigned Detection'), ('pending', 'Pending Approval'), ('approved', 'Approved'), ('rejected', 'Rejected')], default='pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='facetag',
+            name='tagged_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='created_tags', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-19 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0025_facetag_unassigned_detections'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='avatar_tag',
+            field=models.ForeignKey(blank=True, help_text="Approved tag whose face crop is shown as this person's avatar", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='images.facetag'),
+        ),
+    ]
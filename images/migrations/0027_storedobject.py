@@ -0,0 +1,39 @@
+# Generated by Django 5.0.2 on 2026-10-19 18:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0026_person_avatar_tag'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(max_length=63)),
+                ('object_name', models.CharField(max_length=1024)),
+                ('visibility', models.CharField(choices=[('public', 'Public'), ('private', 'Private')], default='private', max_length=10)),
+                ('acl_rules', models.JSONField(blank=True, default=list)),
+                ('size', models.BigIntegerField(default=0)),
+                ('content_type', models.CharField(blank=True, max_length=255)),
+                ('etag', models.CharField(blank=True, max_length=128)),
+                ('generation', models.BigIntegerField(blank=True, null=True)),
+                ('modified_at', models.DateTimeField(blank=True, help_text='Last change to the object in storage', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stored_objects', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['owner', '-id'], name='storedobject_owner_id_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'object_name'), name='storedobject_bucket_object_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.2 on 2026-10-19 19:20
+
+import django.db.models.deletion
+import images.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0027_storedobject'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('file_name', models.CharField(blank=True, help_text='Storage name of the shared original', max_length=255)),
+                ('thumbnail_name', models.CharField(blank=True, help_text='Storage name of the shared thumbnail', max_length=255)),
+                ('ref_count', models.PositiveIntegerField(default=0, help_text='Images using this content')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='image_file',
+            field=models.ImageField(blank=True, null=True, upload_to=images.models.get_original_upload_path),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='content',
+            field=models.ForeignKey(blank=True, help_text='Deduplicated original shared with identical uploads', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='images', to='images.contentblob'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-19 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0029_upload_session'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='processingjob',
+            name='kind',
+            field=models.CharField(choices=[('detect_faces', 'Face Detection'), ('cluster_faces', 'Face Clustering'), ('reencode_faces', 'Face Re-encoding'), ('verify_upload', 'Upload Verification')], max_length=30),
+        ),
+    ]
@@ -1,21 +1,25 @@
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password, check_password
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.utils import timezone
+from django.core.cache import cache
 from PIL import Image as PILImage
 from io import BytesIO
 from django.core.files.base import ContentFile
+import hashlib
 import os
 import secrets
 import string
-import threading
+import uuid
 import requests
 import re
 
+from .processing import submit_task
+
 
 class UserProfile(models.Model):
     ROLE_CHOICES = [
@@ -43,23 +47,118 @@ class UserProfile(models.Model):
         return True  # All users can comment
 
 
+def _content_digest(instance):
+    """SHA-256 of an Image's original, if it has been hashed"""
+    digest = getattr(instance, '_content_sha256', None)
+    if not digest and getattr(instance, 'content_id', None):
+        digest = instance.content.sha256
+    return digest
+
 def get_image_upload_path(instance, filename):
     """Generate upload path for images"""
     ext = filename.split('.')[-1]
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     return f'images/{instance.uploader.username}/{timestamp}_{filename}'
 
+def get_original_upload_path(instance, filename):
+    """Content-addressed upload path for originals, so identical uploads share one file"""
+    digest = _content_digest(instance)
+    if not digest:
+        return get_image_upload_path(instance, filename)
+    ext = os.path.splitext(filename)[1].lower()
+    return f'originals/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
 def get_thumbnail_upload_path(instance, filename):
     """Generate upload path for thumbnails"""
+    digest = _content_digest(instance)
+    if digest:
+        # Derived from the original's bytes alone, so shared like the original
+        return f'derivatives/{digest[:2]}/{digest[2:4]}/{digest}_thumb.jpg'
     ext = filename.split('.')[-1]
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     return f'images/{instance.uploader.username}/thumbnails/{timestamp}_{filename}'
 
+def get_face_crop_upload_path(instance, filename):
+    """Generate upload path for small face crops"""
+    return f'faces/{instance.image_id}/{filename}'
+
+
+def _delete_stored_files(names, storage=None):
+    """Delete files from the media storage, ignoring ones already gone"""
+    storage = storage or Image._meta.get_field('image_file').storage
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception as e:
+            print(f"Error deleting file {name}: {e}")
+
+
+class ContentBlob(models.Model):
+    """
+    One distinct uploaded original, stored once under its SHA-256 and
+    shared, with its thumbnail, by every Image with the same bytes
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField(default=0)
+    file_name = models.CharField(max_length=255, blank=True, help_text="Storage name of the shared original")
+    thumbnail_name = models.CharField(max_length=255, blank=True, help_text="Storage name of the shared thumbnail")
+    ref_count = models.PositiveIntegerField(default=0, help_text="Images using this content")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} images)"
+    
+    @staticmethod
+    def hash_file(file):
+        """Return (SHA-256 hex digest, size) of a Django File, leaving it rewound"""
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in file.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        file.seek(0)
+        return digest.hexdigest(), size
+    
+    @classmethod
+    def acquire(cls, sha256, size):
+        """Take a reference to the content with this hash, creating its row if new"""
+        with transaction.atomic():
+            blob, _ = cls.objects.select_for_update().get_or_create(sha256=sha256, defaults={'size': size})
+            blob.ref_count += 1
+            blob.save(update_fields=['ref_count'])
+        return blob
+    
+    @classmethod
+    def release(cls, content_id, file_names=()):
+        """
+        Drop one Image's reference to this content
+        
+        Files the Image did not share (file_names not belonging to the blob)
+        are deleted at once; the shared original and thumbnail go with the
+        last reference.
+        """
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(pk=content_id).first()
+            if blob is None:
+                return
+            
+            shared = {blob.file_name, blob.thumbnail_name} - {''}
+            doomed = {name for name in file_names if name and name not in shared}
+            
+            blob.ref_count = max(blob.ref_count - 1, 0)
+            if blob.ref_count == 0:
+                doomed |= shared
+                blob.delete()
+            else:
+                blob.save(update_fields=['ref_count'])
+            
+            transaction.on_commit(lambda: _delete_stored_files(doomed))
+
 
 class Image(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    image_file = models.ImageField(upload_to=get_image_upload_path, blank=True, null=True)
+    image_file = models.ImageField(upload_to=get_original_upload_path, blank=True, null=True)
     thumbnail = models.ImageField(upload_to=get_thumbnail_upload_path, blank=True, null=True)
     
     # Vimeo embed URL for videos (domain-level privacy links)
@@ -73,6 +172,16 @@ class Image(models.Model):
     face_y = models.FloatField(null=True, blank=True, help_text="Face center Y coordinate (0-1)")
     face_width = models.FloatField(null=True, blank=True, help_text="Face width (0-1)")
     face_height = models.FloatField(null=True, blank=True, help_text="Face height (0-1)")
+    faces_detected_at = models.DateTimeField(null=True, blank=True,
+                                             help_text="When every detected face was stored as a FaceTag")
+    content = models.ForeignKey(
+        ContentBlob,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='images',
+        help_text="Deduplicated original shared with identical uploads"
+    )
     
     uploader = models.ForeignKey(
         settings.AUTH_USER_MODEL, 
@@ -97,77 +206,192 @@ class Image(models.Model):
     def save(self, *args, **kwargs):
         """Override save - face detection and Vimeo thumbnail fetching moved to async processing"""
         is_new = self.pk is None
-        super().save(*args, **kwargs)
+        
+        # A new original is stored once per distinct content; a photo seen
+        # before is linked to the stored file and its processed artifacts
+        acquired = self.__dict__.pop('_acquired_content', None)
+        linked = acquired is not None or bool(self.image_file and not self.image_file._committed)
+        processed_copy = None
+        if acquired is not None:
+            processed_copy = self._adopt_content(acquired)
+        elif linked:
+            processed_copy = self._link_content()
+        
+        replaced = self.__dict__.pop('_replaced_files', None)
+        try:
+            super().save(*args, **kwargs)
+        except Exception:
+            if linked:
+                stored = [self.image_file.name] if self.image_file._committed else []
+                ContentBlob.release(self.content_id, stored)
+            raise
+        
+        if replaced is not None:
+            self._release_replaced_files(*replaced)
+        
+        if linked and not self.content.file_name:
+            ContentBlob.objects.filter(pk=self.content_id, file_name='').update(file_name=self.image_file.name)
         
         # Fetch Vimeo thumbnail if this is a video and no thumbnail exists
         if is_new and self.vimeo_url and not self.thumbnail:
-            threading.Thread(
-                target=self._async_fetch_vimeo_thumbnail,
-                daemon=True
-            ).start()
-        
-        # Move face detection to background thread to prevent blocking upload
-        if is_new and self.image_file and self.face_x is None:
-            threading.Thread(
-                target=self._async_detect_and_store_face_coordinates,
-                daemon=True
-            ).start()
+            submit_task(self._async_fetch_vimeo_thumbnail)
+        
+        # Duplicate of an already processed photo: copy its face detections
+        # instead of running detection and thumbnailing again
+        if processed_copy is not None:
+            submit_task(self._copy_face_detections, processed_copy)
+        
+        # Move face detection to the processing pool to prevent blocking upload.
+        # The thumbnail is generated after it, reusing the detected face.
+        elif is_new and self.image_file and self.face_x is None:
+            submit_task(self._async_detect_and_store_face_coordinates)
         
         # Legacy: Generate thumbnail if image_file exists but thumbnail doesn't
         # (will be deprecated once easy-thumbnails is fully integrated)
-        if self.image_file and not self.thumbnail:
-            # Also run thumbnail generation in background to prevent blocking
-            threading.Thread(
-                target=self.create_thumbnail,
-                daemon=True
-            ).start()
+        elif self.image_file and not self.thumbnail:
+            # Also run thumbnail generation in the processing pool to prevent blocking
+            submit_task(self.create_thumbnail)
+    
+    def _link_content(self):
+        """
+        Hash the uploaded original and take a reference to its ContentBlob
+        
+        If the same bytes are already stored, the upload is dropped in favour
+        of the stored file, and the thumbnail and face coordinates of an
+        already processed copy are reused.
+        
+        Returns:
+            The processed Image whose face detections should be copied, or None
+        """
+        digest, size = ContentBlob.hash_file(self.image_file.file)
+        previous = self.pk and Image.objects.filter(pk=self.pk).values_list(
+            'content', 'image_file', 'thumbnail'
+        ).first()
+        if previous:
+            # The old thumbnail shows the replaced photo; it goes with the
+            # old original once the new one is saved
+            self._replaced_files = previous
+            self.thumbnail = None
+        return self._adopt_content(ContentBlob.acquire(digest, size))
+    
+    def _release_replaced_files(self, content_id, image_file, thumbnail):
+        """Drop the original and thumbnail this image used before its file was replaced"""
+        in_use = {self.image_file.name, self.thumbnail.name}
+        names = [name for name in (image_file, thumbnail) if name and name not in in_use]
+        if content_id:
+            ContentBlob.release(content_id, names)
+        elif names:
+            # Never shared through a blob, so nothing else refers to it
+            transaction.on_commit(lambda: _delete_stored_files(names))
+    
+    def attach_content(self, blob):
+        """
+        Link an original that is already in storage (a direct upload) to the
+        ContentBlob its verified hash was acquired for, on the next save
+        """
+        self._acquired_content = blob
+    
+    def _adopt_content(self, blob):
+        """Point this image at a referenced ContentBlob, reusing its stored file and artifacts"""
+        self.content = blob
+        self._content_sha256 = blob.sha256
+        
+        if not blob.file_name or not self.image_file.storage.exists(blob.file_name):
+            return None
+        
+        self.image_file = blob.file_name
+        processed = Image.objects.filter(
+            content=blob, faces_detected_at__isnull=False
+        ).exclude(pk=self.pk).order_by('id').first()
+        if processed is None:
+            return None
+        
+        # Only the blob's thumbnail is refcounted with it; without one a
+        # fresh thumbnail is generated after the detections are copied
+        if blob.thumbnail_name:
+            self.thumbnail = blob.thumbnail_name
+        self.face_x, self.face_y = processed.face_x, processed.face_y
+        self.face_width, self.face_height = processed.face_width, processed.face_height
+        return processed
+    
+    def _copy_face_detections(self, source):
+        """Store the faces detected in an identical photo as this one's unassigned candidates"""
+        try:
+            from .face_recognition_utils import ENCODING_ALGORITHM_VERSION, store_detected_faces
+            
+            faces = [
+                {
+                    'x': face_tag.face_x,
+                    'y': face_tag.face_y,
+                    'width': face_tag.face_width,
+                    'height': face_tag.face_height,
+                    'confidence': face_tag.confidence_score,
+                    'encoding': face_tag.encoding,
+                }
+                for face_tag in FaceTag.objects.filter(
+                    image=source, face_encoding__isnull=False, encoding_version=ENCODING_ALGORITHM_VERSION
+                )
+            ]
+            store_detected_faces(self, faces)
+        except Exception as e:
+            print(f"Error copying face detections to image {self.id}: {e}")
+        
+        if not self.thumbnail:
+            self.create_thumbnail()
+    
+    def _store_thumbnail(self, thumbnail_name, data):
+        """Save thumbnail bytes and share them with identical uploads"""
+        self.thumbnail.save(thumbnail_name, ContentFile(data), save=False)
+        super().save(update_fields=['thumbnail'])
+        
+        if self.content_id:
+            ContentBlob.objects.filter(pk=self.content_id, thumbnail_name='').update(
+                thumbnail_name=self.thumbnail.name
+            )
     
     def _async_fetch_vimeo_thumbnail(self):
-        """Async wrapper for Vimeo thumbnail fetching - runs in background thread"""
+        """Async wrapper for Vimeo thumbnail fetching - runs in the processing pool"""
         try:
             self.fetch_vimeo_thumbnail()
         except Exception as e:
             print(f"Error fetching Vimeo thumbnail for image {self.id}: {e}")
     
     def _async_detect_and_store_face_coordinates(self):
-        """Async wrapper for face detection - runs in background thread"""
+        """Async wrapper for face detection - runs in the processing pool"""
         try:
             self.detect_and_store_face_coordinates()
         except Exception as e:
             print(f"Error in async face detection for image {self.id}: {e}")
+        
+        if not self.thumbnail:
+            self.create_thumbnail()
     
     def detect_and_store_face_coordinates(self):
-        """Detect faces and store normalized coordinates for smart cropping"""
+        """
+        Detect faces once, store the largest face's normalized coordinates for
+        smart cropping, and persist every face as an unassigned FaceTag
+        """
         if not self.image_file:
             return
             
         try:
-            import cv2
-            
-            # Load image with OpenCV for face detection
-            cv_image = cv2.imread(self.image_file.path)
-            if cv_image is None:
-                return
+            from .face_recognition_utils import detect_faces_in_uploaded_image, store_detected_faces
             
-            # Detect faces in the image
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+            # Boxes and encodings for every face, with the configured backend
+            faces = detect_faces_in_uploaded_image(self)
             
             if len(faces) > 0:
-                # Get the largest face
-                largest_face = max(faces, key=lambda rect: rect[2] * rect[3])
-                x, y, w, h = largest_face
-                
-                # Normalize coordinates (0-1) based on image dimensions
-                img_height, img_width = cv_image.shape[:2]
-                self.face_x = (x + w/2) / img_width  # Center X
-                self.face_y = (y + h/2) / img_height  # Center Y
-                self.face_width = w / img_width
-                self.face_height = h / img_height
+                # Get the largest face (detections are relative, top-left origin)
+                largest_face = max(faces, key=lambda face: face['width'] * face['height'])
+                self.face_x = largest_face['x'] + largest_face['width'] / 2  # Center X
+                self.face_y = largest_face['y'] + largest_face['height'] / 2  # Center Y
+                self.face_width = largest_face['width']
+                self.face_height = largest_face['height']
                 
                 # Save face coordinates without triggering recursion
                 super(Image, self).save(update_fields=['face_x', 'face_y', 'face_width', 'face_height'])
+            
+            store_detected_faces(self, faces)
                 
         except ImportError:
             # OpenCV not available - skip face detection
@@ -183,32 +407,36 @@ class Image(models.Model):
         try:
             import cv2
             import numpy as np
+            from .storage import local_file_path
             
             # Load image with OpenCV for face detection
-            cv_image = cv2.imread(self.image_file.path)
+            with local_file_path(self.image_file.name, self.image_file.storage) as image_path:
+                cv_image = cv2.imread(image_path)
             if cv_image is None:
                 # Fallback to basic thumbnail if OpenCV can't read the image
                 return self._create_basic_thumbnail()
             
-            # Detect faces in the image
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+            img_height, img_width = cv_image.shape[:2]
+            face_center = None
+            
+            if self.face_x is not None:
+                # Reuse the largest face found by detect_and_store_face_coordinates
+                face_center = (int(self.face_x * img_width), int(self.face_y * img_height))
+            else:
+                # Detect faces in the image with the configured backend
+                from .face_detectors import get_face_detector
+                faces = get_face_detector().detect(cv_image)
+                if len(faces) > 0:
+                    x, y, w, h, _score = max(faces, key=lambda rect: rect[2] * rect[3])
+                    face_center = (x + w // 2, y + h // 2)
             
             thumbnail_size = 300
             
-            if len(faces) > 0:
+            if face_center is not None:
                 # Face detected - create smart crop centered on the largest face
-                largest_face = max(faces, key=lambda rect: rect[2] * rect[3])
-                x, y, w, h = largest_face
-                
-                # Calculate center of the face
-                face_center_x = x + w // 2
-                face_center_y = y + h // 2
+                face_center_x, face_center_y = face_center
                 
                 # Calculate crop area (square) centered on face
-                img_height, img_width = cv_image.shape[:2]
-                
                 # Determine crop size (use smaller of image dimensions or desired size)
                 crop_size = min(thumbnail_size * 2, img_width, img_height)  # Use 2x for better quality
                 half_crop = crop_size // 2
@@ -244,14 +472,7 @@ class Image(models.Model):
             thumbnail_name = f'{name}_thumb.jpg'
             
             # Save thumbnail
-            self.thumbnail.save(
-                thumbnail_name,
-                ContentFile(thumb_io.getvalue()),
-                save=False
-            )
-            
-            # Save the model again to save the thumbnail field
-            super().save(update_fields=['thumbnail'])
+            self._store_thumbnail(thumbnail_name, thumb_io.getvalue())
             
         except ImportError:
             # OpenCV not available - fallback to basic thumbnail
@@ -357,9 +578,12 @@ class Image(models.Model):
     
     def _create_basic_thumbnail(self):
         """Fallback basic thumbnail creation using PIL only"""
+        from .storage import local_file_path
+        
         try:
             # Open the image file
-            with PILImage.open(self.image_file.path) as image:
+            image_file = self.image_file
+            with local_file_path(image_file.name, image_file.storage) as path, PILImage.open(path) as image:
                 # Convert RGBA to RGB if necessary (for PNG files with transparency)
                 if image.mode in ('RGBA', 'LA', 'P'):
                     background = PILImage.new('RGB', image.size, (255, 255, 255))
@@ -386,14 +610,7 @@ class Image(models.Model):
                 thumbnail_name = f'{name}_thumb.jpg'
                 
                 # Save thumbnail
-                self.thumbnail.save(
-                    thumbnail_name,
-                    ContentFile(thumb_io.getvalue()),
-                    save=False
-                )
-                
-                # Save the model again to save the thumbnail field
-                super().save(update_fields=['thumbnail'])
+                self._store_thumbnail(thumbnail_name, thumb_io.getvalue())
                 
         except Exception as e:
             print(f"Error creating basic thumbnail for image {self.id}: {e}")
@@ -432,6 +649,33 @@ class Comment(models.Model):
         return self.parent is not None
 
 
+# Drop the deleted image's reference to its shared original and thumbnail
+@receiver(post_delete, sender=Image)
+def release_image_content(sender, instance, **kwargs):
+    if instance.content_id:
+        ContentBlob.release(instance.content_id, [instance.image_file.name, instance.thumbnail.name])
+
+
+# Face crops belong to one tag; remove the file with it (also when the
+# tag goes with its image, or is replaced by a re-detection)
+@receiver(post_delete, sender='images.FaceTag')
+def delete_face_tag_crop(sender, instance, **kwargs):
+    if instance.face_crop:
+        name, storage = instance.face_crop.name, instance.face_crop.storage
+        transaction.on_commit(lambda: _delete_stored_files([name], storage))
+
+
+# Keep per-person image pages in step with tag changes
+@receiver(post_save, sender='images.FaceTag')
+@receiver(post_delete, sender='images.FaceTag')
+def invalidate_face_tag_person_images(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and set(update_fields) <= {'face_crop', 'cluster'}:
+        return
+    invalidate_person_images([instance.person_id, getattr(instance, '_loaded_person_id', None)])
+    instance._loaded_person_id = instance.person_id
+
+
 # Signal to create UserProfile automatically when User is created
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -616,4 +860,756 @@ class PasswordResetToken(models.Model):
     
     def is_valid(self):
         """Check if token is still valid"""
-        return not self.is_used and timezone.now() < self.expires_at
\ No newline at end of file
+        return not self.is_used and timezone.now() < self.expires_at
+
+class Person(models.Model):
+    """A named person who can be tagged in photos"""
+    name = models.CharField(max_length=100)
+    face_encoding = models.BinaryField(null=True, blank=True, help_text="Running mean of approved face encodings (packed)")
+    prototype_encodings = models.BinaryField(null=True, blank=True, help_text="Small set of diverse exemplar encodings (packed)")
+    encoding_version = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Encoding algorithm version of the mean and prototypes")
+    encoding_count = models.PositiveIntegerField(default=0, help_text="Number of approved encodings folded into the mean")
+    avatar_tag = models.ForeignKey(
+        'FaceTag',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text="Approved tag whose face crop is shown as this person's avatar"
+    )
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='created_people'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+    
+    @property
+    def encoding(self):
+        """Running mean encoding as a read-only numpy view, or None"""
+        from .face_recognition_utils import unpack_encoding
+        return unpack_encoding(self.face_encoding)
+    
+    @property
+    def prototypes(self):
+        """Exemplar encodings as an (n, d) read-only numpy view, or None"""
+        from .face_recognition_utils import unpack_encoding, ENCODING_SIZE
+        return unpack_encoding(self.prototype_encodings, ENCODING_SIZE)
+    
+    def _fold_face_encodings(self, encodings):
+        """
+        Update the running mean and exemplars in memory (no save)
+        
+        encodings must come from the current ENCODING_ALGORITHM_VERSION;
+        prototypes from an older version are discarded rather than mixed in.
+        """
+        from .face_recognition_utils import update_prototypes, pack_encoding, coerce_encoding, ENCODING_ALGORITHM_VERSION
+        
+        encodings = [e for e in map(coerce_encoding, encodings) if e is not None]
+        is_current = self.encoding_version == ENCODING_ALGORITHM_VERSION
+        mean, prototypes, self.encoding_count = update_prototypes(
+            self.encoding if is_current else None,
+            self.prototypes if is_current else None,
+            self.encoding_count if is_current else 0,
+            encodings,
+            max_prototypes=getattr(settings, 'PERSON_MAX_PROTOTYPES', 4),
+        )
+        self.face_encoding = pack_encoding(mean)
+        self.prototype_encodings = pack_encoding(prototypes)
+        self.encoding_version = ENCODING_ALGORITHM_VERSION
+    
+    def add_face_encodings(self, encodings):
+        """
+        Fold newly approved face encodings into this person's prototypes
+        
+        Updates the running mean and exemplar set incrementally, without
+        rescanning existing tags, then invalidates the shared match index.
+        The row is locked while it is read, folded and written, so
+        concurrent approvals for one person do not lose encodings.
+        """
+        from .face_recognition_utils import invalidate_person_match_index, coerce_encoding
+        
+        encodings = [e for e in map(coerce_encoding, encodings) if e is not None]
+        if not encodings:
+            return
+        
+        fields = ['face_encoding', 'prototype_encodings', 'encoding_count', 'encoding_version']
+        with transaction.atomic():
+            locked = Person.objects.select_for_update().get(pk=self.pk)
+            locked._fold_face_encodings(encodings)
+            locked.save(update_fields=fields)
+        
+        for field in fields:
+            setattr(self, field, getattr(locked, field))
+        invalidate_person_match_index()
+    
+    @classmethod
+    def bulk_add_face_encodings(cls, encodings_by_person):
+        """
+        Fold approved encodings into several people at once
+        
+        Args:
+            encodings_by_person: Dict of person_id -> list of encodings (arrays or packed blobs)
+        
+        Loads (locking the rows) and saves all affected people in one query
+        each and invalidates the match index once.
+        """
+        from .face_recognition_utils import invalidate_person_match_index, coerce_encoding
+        
+        encodings_by_person = {
+            person_id: [e for e in map(coerce_encoding, encodings) if e is not None]
+            for person_id, encodings in encodings_by_person.items()
+        }
+        encodings_by_person = {k: v for k, v in encodings_by_person.items() if v}
+        if not encodings_by_person:
+            return
+        
+        with transaction.atomic():
+            people = cls.objects.select_for_update().in_bulk(list(encodings_by_person))
+            for person_id, person in people.items():
+                person._fold_face_encodings(encodings_by_person[person_id])
+            
+            cls.objects.bulk_update(people.values(), ['face_encoding', 'prototype_encodings', 'encoding_count', 'encoding_version'])
+        invalidate_person_match_index()
+    
+    @classmethod
+    def rebuild_face_encodings(cls, person_ids):
+        """
+        Recompute these people's mean and prototypes from scratch from their
+        approved, current-version tags
+        
+        Used when an approved tag is withdrawn, since its encoding cannot be
+        subtracted back out of the running mean and exemplars.
+        """
+        from .face_recognition_utils import invalidate_person_match_index, ENCODING_ALGORITHM_VERSION
+        
+        person_ids = {person_id for person_id in person_ids if person_id is not None}
+        if not person_ids:
+            return
+        
+        with transaction.atomic():
+            people = list(cls.objects.select_for_update().filter(id__in=person_ids))
+            
+            encodings_by_person = {}
+            approved = FaceTag.objects.filter(
+                person_id__in=person_ids,
+                status='approved',
+                face_encoding__isnull=False,
+                encoding_version=ENCODING_ALGORITHM_VERSION
+            ).order_by('id').values_list('person_id', 'face_encoding')
+            for person_id, blob in approved:
+                encodings_by_person.setdefault(person_id, []).append(blob)
+            
+            for person in people:
+                person.face_encoding = None
+                person.prototype_encodings = None
+                person.encoding_count = 0
+                person.encoding_version = None
+                if person.id in encodings_by_person:
+                    person._fold_face_encodings(encodings_by_person[person.id])
+            
+            cls.objects.bulk_update(people, ['face_encoding', 'prototype_encodings', 'encoding_count', 'encoding_version'])
+        invalidate_person_match_index()
+    
+    @property
+    def avatar_url(self):
+        """URL of the avatar face crop, or None"""
+        if self.avatar_tag is None or not self.avatar_tag.face_crop:
+            return None
+        return self.avatar_tag.face_crop.url
+    
+    @classmethod
+    def refresh_avatars(cls, person_ids):
+        """
+        Point each person's avatar at their highest-confidence approved tag
+        that has a face crop, in a single UPDATE
+        """
+        person_ids = {person_id for person_id in person_ids if person_id is not None}
+        if not person_ids:
+            return
+        
+        best_tag = FaceTag.objects.filter(
+            person=models.OuterRef('pk'),
+            status='approved'
+        ).exclude(face_crop='').exclude(face_crop__isnull=True).order_by(
+            models.F('confidence_score').desc(nulls_last=True), '-id'
+        ).values('id')[:1]
+        
+        cls.objects.filter(id__in=person_ids).update(avatar_tag=models.Subquery(best_tag))
+
+
+class FaceCluster(models.Model):
+    """A group of similar untagged faces proposed as one person by offline clustering"""
+    STATUS_CHOICES = [
+        ('proposed', 'Proposed'),
+        ('named', 'Named'),
+        ('dismissed', 'Dismissed'),
+    ]
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='proposed')
+    size = models.PositiveIntegerField(default=0, help_text="Number of faces in the cluster when proposed")
+    centroid = models.JSONField(null=True, blank=True, help_text="Normalized mean encoding of the cluster")
+    person = models.ForeignKey(
+        Person,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='face_clusters'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-size', '-created_at']
+    
+    def __str__(self):
+        return f"Cluster {self.id} ({self.size} faces, {self.get_status_display()})"
+
+
+# Cached size of the moderation queue; cleared whenever tags are reviewed
+PENDING_TAG_COUNT_CACHE_KEY = 'face_tags_pending_count'
+
+
+def person_images_cache_version(person_id):
+    """Current version of a person's cached image pages"""
+    return cache.get(f'person_images_version:{person_id}', 0)
+
+
+def invalidate_person_images(person_ids):
+    """Make cached /api/people/{id}/images/ pages stale for these people"""
+    for person_id in set(person_ids):
+        if person_id is None:
+            continue
+        key = f'person_images_version:{person_id}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+class FaceTag(models.Model):
+    """A face region in an image, optionally assigned to a Person"""
+    STATUS_CHOICES = [
+        ('unassigned', 'Unassigned Detection'),
+        ('pending', 'Pending Approval'),
+        ('approved', 'Approved'),
+        ('rejected', 'Rejected'),
+    ]
+    
+    image = models.ForeignKey(
+        Image,
+        on_delete=models.CASCADE,
+        related_name='face_tags'
+    )
+    person = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='face_tags'
+    )
+    cluster = models.ForeignKey(
+        FaceCluster,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='face_tags'
+    )
+    
+    # Face bounding box (normalized 0-1, top-left origin)
+    face_x = models.FloatField(help_text="Face top-left X coordinate (0-1)")
+    face_y = models.FloatField(help_text="Face top-left Y coordinate (0-1)")
+    face_width = models.FloatField(help_text="Face width (0-1)")
+    face_height = models.FloatField(help_text="Face height (0-1)")
+    face_encoding = models.BinaryField(null=True, blank=True, help_text="Face encoding for this detection (packed)")
+    encoding_version = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Encoding algorithm version of face_encoding")
+    # Written by the re-encoding backfill and swapped into face_encoding in one step
+    staged_encoding = models.BinaryField(null=True, blank=True)
+    staged_encoding_version = models.PositiveSmallIntegerField(null=True, blank=True)
+    face_crop = models.ImageField(upload_to=get_face_crop_upload_path, blank=True, null=True,
+                                  help_text="Small square crop of the face, rendered at detection time")
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    confidence_score = models.FloatField(null=True, blank=True, help_text="AI confidence score (0-1)")
+    is_auto_generated = models.BooleanField(default=False, help_text="Generated by auto-tagging")
+    
+    # Null for faces stored automatically at ingest
+    tagged_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='created_tags'
+    )
+    reviewed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='reviewed_tags'
+    )
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the moderation queue
+            models.Index(fields=['status', '-created_at', '-id'], name='facetag_status_created_idx'),
+            # Photos of a person: WHERE person_id = ? AND status = 'approved' ORDER BY image_id
+            models.Index(fields=['person', 'status', 'image'], name='facetag_person_status_img_idx'),
+        ]
+    
+    def __str__(self):
+        person_name = self.person.name if self.person else 'Unknown'
+        return f"{person_name} in {self.image.title} ({self.get_status_display()})"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The person as loaded, so moving the tag also refreshes the previous person's pages
+        instance._loaded_person_id = instance.__dict__.get('person_id')
+        return instance
+    
+    @property
+    def encoding(self):
+        """Face encoding as a read-only numpy view, or None"""
+        from .face_recognition_utils import unpack_encoding
+        return unpack_encoding(self.face_encoding)
+    
+    @property
+    def has_current_encoding(self):
+        """True if face_encoding was produced by the current encoding algorithm"""
+        from .face_recognition_utils import ENCODING_ALGORITHM_VERSION
+        return bool(self.face_encoding) and self.encoding_version == ENCODING_ALGORITHM_VERSION
+    
+    def set_encoding(self, encoding):
+        """Pack an encoding (sequence or array of floats) from the current algorithm into face_encoding"""
+        from .face_recognition_utils import pack_encoding, ENCODING_ALGORITHM_VERSION
+        self.face_encoding = pack_encoding(encoding)
+        self.encoding_version = ENCODING_ALGORITHM_VERSION
+    
+    def generate_face_crop(self, source=None, save=True):
+        """
+        Render and store a small square crop of this face
+        
+        Args:
+            source: Optional already-decoded PIL image of self.image, so callers
+                    creating several crops from one photo decode it only once
+            save: Save face_crop (and refresh the person's avatar); callers
+                  rendering many crops pass False and save them in bulk
+        """
+        if not self.image.image_file:
+            return
+        
+        size = getattr(settings, 'FACE_CROP_SIZE', 96)
+        margin = getattr(settings, 'FACE_CROP_MARGIN', 0.2)
+        
+        try:
+            if source is None:
+                from .storage import local_file_path
+                
+                image_file = self.image.image_file
+                with local_file_path(image_file.name, image_file.storage) as image_path:
+                    with PILImage.open(image_path) as opened:
+                        source = opened.convert('RGB')
+            
+            img_width, img_height = source.size
+            
+            # Square box around the face, padded by the margin, clamped to the image
+            side = max(self.face_width * img_width, self.face_height * img_height) * (1 + margin * 2)
+            center_x = (self.face_x + self.face_width / 2) * img_width
+            center_y = (self.face_y + self.face_height / 2) * img_height
+            left = max(0, int(center_x - side / 2))
+            top = max(0, int(center_y - side / 2))
+            right = min(img_width, int(center_x + side / 2))
+            bottom = min(img_height, int(center_y + side / 2))
+            
+            crop = source.crop((left, top, right, bottom))
+            crop = crop.resize((size, size), PILImage.Resampling.LANCZOS)
+            
+            crop_io = BytesIO()
+            crop.save(crop_io, format='JPEG', quality=80, optimize=True)
+            
+            self.face_crop.save(f'face_{self.id}.jpg', ContentFile(crop_io.getvalue()), save=False)
+            if save:
+                super().save(update_fields=['face_crop'])
+                if self.status == 'approved':
+                    Person.refresh_avatars([self.person_id])
+            
+        except Exception as e:
+            print(f"Error creating face crop for face tag {self.id}: {e}")
+    
+    @classmethod
+    def generate_face_crops(cls, face_tags):
+        """
+        Render crops for several faces of the same photo, decoding it once
+        and saving them with one bulk UPDATE
+        """
+        face_tags = [face_tag for face_tag in face_tags if face_tag.image.image_file]
+        if not face_tags:
+            return
+        
+        from .storage import local_file_path
+        
+        try:
+            image_file = face_tags[0].image.image_file
+            with local_file_path(image_file.name, image_file.storage) as image_path:
+                with PILImage.open(image_path) as opened:
+                    source = opened.convert('RGB')
+        except Exception as e:
+            print(f"Error opening image {face_tags[0].image_id} for face crops: {e}")
+            return
+        
+        for face_tag in face_tags:
+            face_tag.generate_face_crop(source, save=False)
+        
+        rendered = [face_tag for face_tag in face_tags if face_tag.face_crop]
+        cls.objects.bulk_update(rendered, ['face_crop'])
+        Person.refresh_avatars(
+            face_tag.person_id for face_tag in rendered if face_tag.status == 'approved'
+        )
+    
+    def approve(self, user):
+        """Approve this tag and feed its encoding into the person's prototypes"""
+        was_approved = self.status == 'approved'
+        self.status = 'approved'
+        self.reviewed_by = user
+        self.reviewed_at = timezone.now()
+        self.save(update_fields=['status', 'reviewed_by', 'reviewed_at', 'updated_at'])
+        cache.delete(PENDING_TAG_COUNT_CACHE_KEY)
+        
+        if not was_approved and self.person_id and self.has_current_encoding:
+            self.person.add_face_encodings([self.encoding])
+        Person.refresh_avatars([self.person_id])
+    
+    def reject(self, user):
+        """Reject this tag, taking its encoding back out of the person's prototypes if it was approved"""
+        was_approved = self.status == 'approved'
+        self.status = 'rejected'
+        self.reviewed_by = user
+        self.reviewed_at = timezone.now()
+        self.save(update_fields=['status', 'reviewed_by', 'reviewed_at', 'updated_at'])
+        cache.delete(PENDING_TAG_COUNT_CACHE_KEY)
+        
+        if was_approved:
+            Person.rebuild_face_encodings([self.person_id])
+        Person.refresh_avatars([self.person_id])
+    
+    @classmethod
+    def bulk_review(cls, tag_ids, user, status):
+        """
+        Approve or reject many tags with a single UPDATE ... WHERE id IN (...)
+        
+        Only tags assigned to a person and pending or approved are reviewed;
+        unassigned detections and already rejected tags are skipped. Newly
+        approved tags are folded into their people's prototypes in one batch
+        afterwards, and people who lose an approved tag have theirs rebuilt.
+        
+        Args:
+            tag_ids: Iterable of FaceTag ids
+            user: Reviewing user
+            status: 'approved' or 'rejected'
+            
+        Returns:
+            Dict of tag_id -> resulting status, 'skipped' or 'not_found'
+        """
+        if status not in ('approved', 'rejected'):
+            raise ValueError(f"Cannot bulk review tags to status '{status}'")
+        
+        tag_ids = list(dict.fromkeys(tag_ids))
+        now = timezone.now()
+        
+        with transaction.atomic():
+            existing = {
+                row['id']: row
+                for row in cls.objects.select_for_update().filter(id__in=tag_ids).values(
+                    'id', 'status', 'person_id', 'face_encoding', 'encoding_version'
+                )
+            }
+            
+            reviewable = {
+                tag_id: row for tag_id, row in existing.items()
+                if row['status'] in ('pending', 'approved') and row['person_id']
+            }
+            
+            cls.objects.filter(id__in=list(reviewable)).update(
+                status=status,
+                reviewed_by=user,
+                reviewed_at=now,
+                updated_at=now
+            )
+            
+            if status == 'approved':
+                from .face_recognition_utils import ENCODING_ALGORITHM_VERSION
+                
+                newly_approved = {}
+                for row in reviewable.values():
+                    if (row['status'] != 'approved' and row['face_encoding']
+                            and row['encoding_version'] == ENCODING_ALGORITHM_VERSION):
+                        newly_approved.setdefault(row['person_id'], []).append(row['face_encoding'])
+                Person.bulk_add_face_encodings(newly_approved)
+            else:
+                Person.rebuild_face_encodings(
+                    row['person_id'] for row in reviewable.values() if row['status'] == 'approved'
+                )
+        
+        cache.delete(PENDING_TAG_COUNT_CACHE_KEY)
+        # .update() skips post_save, so clear the people's image pages here
+        invalidate_person_images(row['person_id'] for row in reviewable.values())
+        Person.refresh_avatars(row['person_id'] for row in reviewable.values())
+        
+        def result(tag_id):
+            if tag_id in reviewable:
+                return status
+            return 'skipped' if tag_id in existing else 'not_found'
+        
+        return {tag_id: result(tag_id) for tag_id in tag_ids}
+
+
+class ProcessingJob(models.Model):
+    """A unit of background work queued on the image-processing pool"""
+    KIND_CHOICES = [
+        ('detect_faces', 'Face Detection'),
+        ('cluster_faces', 'Face Clustering'),
+        ('reencode_faces', 'Face Re-encoding'),
+        ('verify_upload', 'Upload Verification'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    image = models.ForeignKey(
+        Image,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='processing_jobs'
+    )
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='processing_jobs'
+    )
+    options = models.JSONField(default=dict, blank=True, help_text="Parameters passed to the job handler")
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} job {self.id} ({self.status})"
+    
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+    
+    def run(self):
+        """Execute the job and record its outcome"""
+        from .processing import get_job_handler
+        
+        self.status = 'running'
+        self.started_at = timezone.now()
+        self.save(update_fields=['status', 'started_at'])
+        
+        try:
+            handler = get_job_handler(self.kind)
+            self.result = handler(self)
+            self.status = 'completed'
+        except Exception as e:
+            self.error = str(e)
+            self.status = 'failed'
+        
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'result', 'error', 'finished_at'])
+
+
+class StoredObject(models.Model):
+    """
+    Database mirror of an uploaded cloud-storage object and its ACL policy
+    
+    The policy itself lives in the object's `custom:aclPolicy` metadata;
+    this row lets access checks and file listings be answered with one
+    indexed query instead of a storage round trip. Written by set_file_acl
+    and resynced from the bucket by `manage.py reconcile_stored_objects`.
+    """
+    VISIBILITY_CHOICES = [
+        ('public', 'Public'),
+        ('private', 'Private'),
+    ]
+    
+    bucket = models.CharField(max_length=63)
+    object_name = models.CharField(max_length=1024)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stored_objects'
+    )
+    visibility = models.CharField(max_length=10, choices=VISIBILITY_CHOICES, default='private')
+    acl_rules = models.JSONField(default=list, blank=True)
+    size = models.BigIntegerField(default=0)
+    content_type = models.CharField(max_length=255, blank=True)
+    etag = models.CharField(max_length=128, blank=True)
+    generation = models.BigIntegerField(null=True, blank=True)
+    modified_at = models.DateTimeField(null=True, blank=True, help_text="Last change to the object in storage")
+    created_at = models.DateTimeField(auto_now_add=True)
+    synced_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'object_name'], name='storedobject_bucket_object_uniq'),
+        ]
+        indexes = [
+            # Per-user file listings, newest first
+            models.Index(fields=['owner', '-id'], name='storedobject_owner_id_idx'),
+        ]
+    
+    def __str__(self):
+        return f"/{self.bucket}/{self.object_name} ({self.visibility})"
+    
+    @property
+    def acl_policy(self):
+        """The policy in the same shape as the `custom:aclPolicy` metadata"""
+        return {
+            'owner': str(self.owner_id) if self.owner_id else '',
+            'visibility': self.visibility,
+            'aclRules': self.acl_rules,
+        }
+    
+    def as_blob_metadata(self):
+        """This row in the shape returned by storage.get_blob_metadata"""
+        return {
+            'size': self.size,
+            'generation': self.generation,
+            'etag': self.etag or None,
+            'content_type': self.content_type or None,
+            'updated': self.modified_at.timestamp() if self.modified_at else None,
+            'acl_policy': self.acl_policy,
+        }
+    
+    @staticmethod
+    def fields_from_metadata(metadata, owner_id=None):
+        """
+        Model field values for a storage.get_blob_metadata dict
+        
+        Args:
+            metadata: Object metadata with a non-empty acl_policy
+            owner_id: Owner's user id, already checked to exist (default:
+                      taken from the policy as is)
+        """
+        acl_policy = metadata['acl_policy']
+        if owner_id is None:
+            owner = str(acl_policy.get('owner', ''))
+            owner_id = int(owner) if owner.isdigit() else None
+        
+        return {
+            'owner_id': owner_id,
+            'visibility': 'public' if acl_policy.get('visibility') == 'public' else 'private',
+            'acl_rules': acl_policy.get('aclRules') or [],
+            'size': metadata['size'] or 0,
+            'content_type': metadata['content_type'] or '',
+            'etag': metadata['etag'] or '',
+            'generation': metadata['generation'],
+            'modified_at': (
+                datetime.fromtimestamp(metadata['updated'], tz=dt_timezone.utc)
+                if metadata['updated'] is not None else None
+            ),
+        }
+    
+    @classmethod
+    def record(cls, bucket_name, object_name, metadata):
+        """Insert or refresh the row for an object from its metadata"""
+        stored, _ = cls.objects.update_or_create(
+            bucket=bucket_name,
+            object_name=object_name,
+            defaults=cls.fields_from_metadata(metadata)
+        )
+        return stored
+
+
+class UploadSession(models.Model):
+    """
+    A direct-to-storage upload of an original, from presign to completion
+    
+    The client declares the file's size and SHA-256, PUTs the bytes to a
+    presigned URL and then calls the completion endpoint, which checks the
+    stored object against the declaration before creating the Image. Sessions
+    left pending past expires_at are cleaned up by
+    `manage.py expire_upload_sessions`.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('verifying', 'Verifying'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('expired', 'Expired'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    file_name = models.CharField(max_length=255, help_text="Media storage name the client uploads to")
+    original_filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    expected_size = models.BigIntegerField()
+    expected_sha256 = models.CharField(max_length=64)
+    title = models.CharField(max_length=200, blank=True)
+    description = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    image = models.ForeignKey(
+        Image,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='upload_sessions'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Sweeping abandoned sessions
+            models.Index(fields=['status', 'expires_at'], name='uploadsession_status_exp_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Upload {self.id} by {self.user} ({self.status})"
+    
+    @property
+    def is_expired(self):
+        return timezone.now() >= self.expires_at
+    
+    def fail(self, error, status='failed'):
+        """Mark the session as finished without an Image"""
+        self.status = status
+        self.error = error
+        self.completed_at = timezone.now()
+        self.save(update_fields=['status', 'error', 'completed_at'])
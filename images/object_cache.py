@@ -0,0 +1,386 @@
+"""
+Read-through local disk cache for cloud-storage objects
+Popular objects (gallery thumbnails, recently viewed originals) are kept on
+the app server's local disk so repeat views are served, or handed to the
+proxy with X-Sendfile/X-Accel-Redirect, without a trip to the bucket.
+
+Entries are keyed by bucket, object name and generation, so an overwritten
+object is never served stale; old generations simply age out. Files are
+downloaded to a temporary file and renamed into place, so a reader never
+sees a partial object. A download sent to a client on a miss fills the
+cache as it streams, and each object is downloaded by one thread at a time.
+
+The cache is bounded by OBJECT_CACHE_MAX_BYTES with least-recently-used
+eviction (modification time is bumped on every hit). Every worker process
+shares one running byte count in a file, updated under a file lock, and
+eviction re-measures the disk under the same lock. Objects matching OBJECT_CACHE_PINNED_PATTERNS are only evicted once
+nothing else is left to evict. Hit/miss/eviction counters are kept in the
+Django cache.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+COUNTER_NAMES = ('hits', 'misses', 'bytes_fetched', 'evictions', 'bytes_evicted')
+
+# Evict down to this fraction of the budget so a full cache is not
+# rescanned on every insert
+EVICTION_LOW_WATER = 0.9
+
+
+class ObjectDiskCache:
+    """Size-bounded LRU cache of cloud objects on local disk"""
+
+    def __init__(self, root: str, max_bytes: int, max_object_size: int,
+                 pinned_patterns: Iterable[str] = ()):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_object_size = max_object_size
+        self.pinned_patterns = list(pinned_patterns)
+        self._lock = threading.Lock()
+        # Entry path -> Event set when the download filling it finishes
+        self._fetching: Dict[str, threading.Event] = {}
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+
+    def _entry_path(self, bucket_name: str, object_name: str, generation, pinned: bool) -> str:
+        digest = hashlib.sha256(f"{bucket_name}/{object_name}#{generation}".encode('utf-8')).hexdigest()
+        return os.path.join(self.root, 'pinned' if pinned else 'lru', digest[:2], digest)
+
+    def _object_path(self, bucket_name: str, object_name: str, metadata: Dict) -> str:
+        return self._entry_path(bucket_name, object_name, metadata['generation'], self.is_pinned(object_name))
+
+    def is_pinned(self, object_name: str) -> bool:
+        return any(fnmatch(object_name, pattern) for pattern in self.pinned_patterns)
+
+    def is_cacheable(self, metadata: Dict) -> bool:
+        return bool(metadata['generation']) and metadata['size'] <= self.max_object_size
+
+    def get(self, bucket_name: str, object_name: str, generation) -> Optional[str]:
+        """Path of the cached copy of this object generation, or None"""
+        path = self._entry_path(bucket_name, object_name, generation, self.is_pinned(object_name))
+        try:
+            # Bump the modification time, which eviction treats as last use
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def lookup(self, bucket_name: str, object_name: str, metadata: Dict) -> Optional[str]:
+        """Like get(), but counted as a cache hit or miss; None for uncacheable objects"""
+        if not self.is_cacheable(metadata):
+            return None
+
+        path = self.get(bucket_name, object_name, metadata['generation'])
+        _count('hits' if path is not None else 'misses')
+        return path
+
+    def get_or_fetch(self, bucket_name: str, object_name: str, metadata: Dict) -> Optional[str]:
+        """
+        Local path of an object, downloading it on a miss
+
+        Concurrent misses for one object wait for a single download.
+
+        Args:
+            metadata: storage.get_blob_metadata dict for the object
+
+        Returns:
+            Path to a complete local copy, or None if the object is larger
+            than OBJECT_CACHE_MAX_OBJECT_SIZE or could not be fetched
+        """
+        path = self.lookup(bucket_name, object_name, metadata)
+        if path is not None or not self.is_cacheable(metadata):
+            return path
+
+        entry_path = self._object_path(bucket_name, object_name, metadata)
+        done, claimed = self._claim(entry_path)
+        if not claimed:
+            done.wait()
+            return self.get(bucket_name, object_name, metadata['generation'])
+
+        try:
+            return self._fetch(bucket_name, object_name, metadata, entry_path)
+        except Exception as e:
+            logger.error(f"Failed to cache {bucket_name}/{object_name}: {e}")
+            return None
+        finally:
+            self._release(entry_path)
+
+    def fetch_in_background(self, bucket_name: str, object_name: str, metadata: Dict):
+        """Queue a download of the object into the cache unless one is already running"""
+        from .processing import submit_task
+
+        if self.is_cacheable(metadata) and self._object_path(bucket_name, object_name, metadata) not in self._fetching:
+            submit_task(self._fill, bucket_name, object_name, metadata)
+
+    def filling_reader(self, bucket_name: str, object_name: str, metadata: Dict, read_range):
+        """
+        Wrap a read_range(start, end) chunk reader for an uncached object
+
+        Reads of the whole object are written to the cache as they are
+        streamed, so the first byte is sent without waiting for the download.
+        Partial reads are passed through and the object is fetched in the
+        background instead.
+        """
+        if not self.is_cacheable(metadata):
+            return read_range
+
+        def reader(start, end):
+            if start == 0 and end == metadata['size'] - 1:
+                return self._stream_into_cache(bucket_name, object_name, metadata, read_range(start, end))
+            self.fetch_in_background(bucket_name, object_name, metadata)
+            return read_range(start, end)
+
+        return reader
+
+    def _claim(self, entry_path: str):
+        """
+        Register a download of entry_path
+
+        Returns:
+            (event, True) if the caller should download it, or the running
+            download's (event, False)
+        """
+        with self._lock:
+            done = self._fetching.get(entry_path)
+            if done is not None:
+                return done, False
+            done = self._fetching[entry_path] = threading.Event()
+            return done, True
+
+    def _release(self, entry_path: str):
+        with self._lock:
+            self._fetching.pop(entry_path).set()
+
+    def _stream_into_cache(self, bucket_name: str, object_name: str, metadata: Dict, chunks):
+        """Yield chunks while writing them to a temporary file, stored once all have been sent"""
+        entry_path = self._object_path(bucket_name, object_name, metadata)
+        _, claimed = self._claim(entry_path)
+        if not claimed:
+            # Another request is already downloading this object
+            yield from chunks
+            return
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        cache_file = os.fdopen(fd, 'wb')
+        try:
+            written = 0
+            for chunk in chunks:
+                if cache_file is not None:
+                    try:
+                        cache_file.write(chunk)
+                        written += len(chunk)
+                    except OSError as e:
+                        # A full or failing cache disk must not break the download
+                        logger.error(f"Failed to cache {bucket_name}/{object_name}: {e}")
+                        cache_file.close()
+                        cache_file = None
+                yield chunk
+
+            if cache_file is not None:
+                cache_file.close()
+                cache_file = None
+                if written == metadata['size']:
+                    try:
+                        self._store(tmp_path, entry_path, written)
+                    except OSError as e:
+                        logger.error(f"Failed to cache {bucket_name}/{object_name}: {e}")
+        finally:
+            if cache_file is not None:
+                cache_file.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._release(entry_path)
+
+    def _fill(self, bucket_name: str, object_name: str, metadata: Dict):
+        """Background task: download the object unless it is cached or already downloading"""
+        if self.get(bucket_name, object_name, metadata['generation']) is not None:
+            return
+
+        entry_path = self._object_path(bucket_name, object_name, metadata)
+        _, claimed = self._claim(entry_path)
+        if not claimed:
+            return
+        try:
+            self._fetch(bucket_name, object_name, metadata, entry_path)
+        except Exception as e:
+            logger.error(f"Failed to cache {bucket_name}/{object_name}: {e}")
+        finally:
+            self._release(entry_path)
+
+    def _fetch(self, bucket_name: str, object_name: str, metadata: Dict, entry_path: str) -> str:
+        from .storage import get_storage_client, iter_blob_chunks
+
+        blob = get_storage_client().bucket(bucket_name).blob(object_name, generation=metadata['generation'])
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if metadata['size']:
+                    for chunk in iter_blob_chunks(blob, end=metadata['size'] - 1):
+                        f.write(chunk)
+            self._store(tmp_path, entry_path, metadata['size'])
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return entry_path
+
+    def _store(self, tmp_path: str, entry_path: str, size: int):
+        """Rename a downloaded file into place and add it to the shared size"""
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        with self._usage_lock():
+            used = self._read_usage()
+            if not os.path.exists(entry_path):
+                used += size
+            os.replace(tmp_path, entry_path)
+            self._write_usage(used)
+            if used > self.max_bytes:
+                self._evict()
+
+        _count('bytes_fetched', size)
+
+    @contextmanager
+    def _usage_lock(self):
+        """Exclusive lock shared by every process updating or evicting this cache"""
+        with open(os.path.join(self.root, 'usage.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_usage(self) -> int:
+        """Bytes cached, as counted by all processes; measured from disk if unknown"""
+        try:
+            with open(os.path.join(self.root, 'usage')) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return self._scan()[0]
+
+    def _write_usage(self, used: int):
+        with open(os.path.join(self.root, 'usage'), 'w') as f:
+            f.write(str(used))
+
+    def used_bytes(self) -> int:
+        """Current size of the cache as tracked across processes"""
+        with self._usage_lock():
+            return self._read_usage()
+
+    def _entries(self):
+        """(mtime, size, pinned, path) of every cached file"""
+        entries = []
+        for pinned, directory in ((False, 'lru'), (True, 'pinned')):
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, directory)):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, pinned, path))
+        return entries
+
+    def _scan(self):
+        entries = self._entries()
+        return sum(size for _, size, _, _ in entries), entries
+
+    def evict(self) -> int:
+        """
+        Delete least-recently-used files until the cache is under its low-water
+        mark, pinned files last
+
+        Returns:
+            Number of files deleted
+        """
+        with self._usage_lock():
+            return self._evict()
+
+    def _evict(self) -> int:
+        # Callers hold the usage lock. The disk is measured again, since the
+        # shared count can drift (files removed by hand, a crashed writer).
+        # Thread-level locks are not held, so lookups carry on meanwhile.
+        used, entries = self._scan()
+        target = self.max_bytes * EVICTION_LOW_WATER
+        evicted = evicted_bytes = 0
+
+        # Unpinned files, oldest first, then pinned ones
+        for _, size, _, path in sorted(entries, key=lambda entry: (entry[2], entry[0])):
+            if used <= target:
+                break
+            used -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            evicted += 1
+            evicted_bytes += size
+
+        self._write_usage(used)
+
+        if evicted:
+            _count('evictions', evicted)
+            _count('bytes_evicted', evicted_bytes)
+        return evicted
+
+    def stats(self) -> Dict:
+        """Counters plus the current size of the cache"""
+        counters = cache.get_many([_counter_key(name) for name in COUNTER_NAMES])
+        stats = {name: counters.get(_counter_key(name), 0) for name in COUNTER_NAMES}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else None
+
+        used, entries = self._scan()
+        stats.update({
+            'files': len(entries),
+            'bytes_used': used,
+            'pinned_bytes': sum(size for _, size, pinned, _ in entries if pinned),
+            'max_bytes': self.max_bytes,
+        })
+        return stats
+
+
+def _counter_key(name: str) -> str:
+    return f"object_cache:{name}"
+
+
+def _count(name: str, amount: int = 1):
+    key = _counter_key(name)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        if not cache.add(key, amount, timeout=None):
+            cache.incr(key, amount)
+
+
+_object_cache = None
+_object_cache_lock = threading.Lock()
+
+
+def get_object_cache() -> Optional[ObjectDiskCache]:
+    """The process-wide object cache, or None if OBJECT_CACHE_DIR is not set"""
+    global _object_cache
+    root = getattr(settings, 'OBJECT_CACHE_DIR', '')
+    if not root:
+        return None
+
+    if _object_cache is None or _object_cache.root != root:
+        with _object_cache_lock:
+            if _object_cache is None or _object_cache.root != root:
+                _object_cache = ObjectDiskCache(
+                    root,
+                    max_bytes=getattr(settings, 'OBJECT_CACHE_MAX_BYTES', 10 * 1024 ** 3),
+                    max_object_size=getattr(settings, 'OBJECT_CACHE_MAX_OBJECT_SIZE', 100 * 1024 ** 2),
+                    pinned_patterns=getattr(settings, 'OBJECT_CACHE_PINNED_PATTERNS', ())
+                )
+    return _object_cache
@@ -0,0 +1,89 @@
+"""
+Background image-processing pool
+Runs face detection, thumbnail generation and other slow image work off the
+request thread on a small, bounded pool of worker threads.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# ProcessingJob.kind -> dotted path of the callable that performs it.
+# Handlers receive the job and return a JSON-serializable result.
+JOB_HANDLERS = {
+    'detect_faces': 'images.face_recognition_utils.run_face_detection_job',
+    'cluster_faces': 'images.face_clustering.run_face_clustering_job',
+    'reencode_faces': 'images.face_reencoding.run_reencode_job',
+    'verify_upload': 'images.direct_uploads.run_upload_verification_job',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_processing_pool() -> ThreadPoolExecutor:
+    """Return the process-wide image-processing pool, creating it on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2),
+                    thread_name_prefix='image-processing',
+                )
+    return _executor
+
+
+def _run_task(func, args, kwargs):
+    """Run a task with a fresh DB connection and never let errors escape"""
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        logger.error(f"Background task {getattr(func, '__name__', func)} failed: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def submit_task(func, *args, **kwargs):
+    """
+    Queue a callable on the image-processing pool
+
+    Returns:
+        concurrent.futures.Future for the queued task
+    """
+    return get_processing_pool().submit(_run_task, func, args, kwargs)
+
+
+def get_job_handler(kind):
+    """Resolve the handler callable for a ProcessingJob kind"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"No handler registered for job kind '{kind}'")
+    return import_string(JOB_HANDLERS[kind])
+
+
+def run_processing_job(job_id):
+    """Execute a queued ProcessingJob by id (runs inside the pool)"""
+    from .models import ProcessingJob
+
+    try:
+        job = ProcessingJob.objects.select_related('image').get(id=job_id)
+    except ProcessingJob.DoesNotExist:
+        logger.warning(f"Processing job {job_id} disappeared before it could run")
+        return
+
+    job.run()
+
+
+def enqueue_processing_job(job):
+    """Submit a saved ProcessingJob once the surrounding transaction commits"""
+    from django.db import transaction
+
+    transaction.on_commit(lambda: submit_task(run_processing_job, job.id))
+    return job
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from easy_thumbnails.files import get_thumbnailer
-from .models import Image, Comment, Tag, Like
+from .models import Image, Comment, Tag, Like, Person, FaceTag, FaceCluster, ProcessingJob
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -201,4 +201,89 @@ class ImageCreateSerializer(serializers.ModelSerializer):
                     # Skip non-existent tags silently
                     pass
         
-        return image
\ No newline at end of file
+        return image
+
+class PersonSerializer(serializers.ModelSerializer):
+    face_tag_count = serializers.SerializerMethodField()
+    avatar_url = serializers.CharField(read_only=True)
+    
+    class Meta:
+        model = Person
+        fields = ['id', 'name', 'avatar_url', 'created_by', 'created_at', 'face_tag_count']
+        read_only_fields = ['id', 'created_by', 'created_at']
+    
+    def get_face_tag_count(self, obj):
+        # Annotated by the people list to avoid a count query per person
+        if hasattr(obj, 'approved_tag_count'):
+            return obj.approved_tag_count
+        return obj.face_tags.filter(status='approved').count()
+
+
+class FaceTagSerializer(serializers.ModelSerializer):
+    person_name = serializers.CharField(source='person.name', read_only=True, default=None)
+    tagged_by = UserSerializer(read_only=True)
+    image_title = serializers.CharField(source='image.title', read_only=True)
+    face_crop_url = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = FaceTag
+        fields = ['id', 'image', 'image_title', 'person', 'person_name',
+                 'face_x', 'face_y', 'face_width', 'face_height', 'face_crop_url',
+                 'status', 'confidence_score', 'is_auto_generated',
+                 'tagged_by', 'reviewed_by', 'reviewed_at', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'image', 'status', 'is_auto_generated',
+                           'tagged_by', 'reviewed_by', 'reviewed_at', 'created_at', 'updated_at']
+    
+    def get_face_crop_url(self, obj):
+        return obj.face_crop.url if obj.face_crop else None
+
+
+class DetectedFaceSerializer(serializers.Serializer):
+    x = serializers.FloatField()
+    y = serializers.FloatField()
+    width = serializers.FloatField()
+    height = serializers.FloatField()
+    confidence = serializers.FloatField()
+    quality_tier = serializers.CharField(required=False)
+    detection_method = serializers.CharField(required=False)
+
+
+class FaceDetectionResultSerializer(serializers.Serializer):
+    faces = DetectedFaceSerializer(many=True)
+    image_id = serializers.IntegerField()
+    face_count = serializers.IntegerField()
+    timings = serializers.DictField(required=False)
+
+
+class AutoTagSuggestionSerializer(serializers.Serializer):
+    person_id = serializers.IntegerField()
+    person_name = serializers.CharField()
+    confidence_score = serializers.FloatField()
+    face_tag_id = serializers.IntegerField()
+    face_location = serializers.DictField(child=serializers.FloatField())
+
+
+class ProcessingJobSerializer(serializers.ModelSerializer):
+    result = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ProcessingJob
+        fields = ['id', 'kind', 'status', 'image', 'options', 'result', 'error',
+                 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+    
+    def get_result(self, obj):
+        if obj.status != 'completed' or obj.result is None:
+            return None
+        if obj.kind == 'detect_faces':
+            return FaceDetectionResultSerializer(obj.result).data
+        return obj.result
+
+
+class FaceClusterSerializer(serializers.ModelSerializer):
+    person_name = serializers.CharField(source='person.name', read_only=True, default=None)
+    
+    class Meta:
+        model = FaceCluster
+        fields = ['id', 'status', 'size', 'person', 'person_name', 'created_at']
+        read_only_fields = fields
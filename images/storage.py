@@ -3,19 +3,144 @@ Custom Django storage backend for Replit App Storage integration.
 Provides secure file upload, storage, and retrieval with authentication and access controls.
 """
 
+import hashlib
+import mimetypes
 import os
+import tempfile
+import threading
 import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from urllib.parse import urljoin
-from django.core.files.storage import Storage
-from django.core.files.base import ContentFile
+from django.core.cache import cache
+from django.core.files.storage import Storage, default_storage
+from django.core.files.base import File
 from django.conf import settings
 from django.contrib.auth.models import User
+from google.api_core.exceptions import NotFound
 from google.cloud import storage as gcs
+from google.cloud.storage import transfer_manager
 import requests
 import json
 from typing import Optional, Dict, Any
 
 
+SIDECAR_ENDPOINT = "http://127.0.0.1:1106"
+
+_storage_client = None
+_storage_client_lock = threading.Lock()
+
+
+def get_storage_client():
+    """
+    Return the process-wide Google Cloud Storage client, creating it on first use
+    
+    Building a client sets up credentials and an HTTP session, so it is done
+    once per process rather than once per request. With
+    CLOUD_STORAGE_EMULATOR_ROOT set, a local-filesystem emulator is used instead.
+    """
+    global _storage_client
+    if _storage_client is None:
+        with _storage_client_lock:
+            if _storage_client is None and getattr(settings, 'CLOUD_STORAGE_EMULATOR_ROOT', ''):
+                from .storage_emulator import EmulatorClient
+                _storage_client = EmulatorClient(settings.CLOUD_STORAGE_EMULATOR_ROOT)
+            elif _storage_client is None:
+                _storage_client = gcs.Client(
+                    credentials={
+                        "audience": "replit",
+                        "subject_token_type": "access_token", 
+                        "token_url": f"{SIDECAR_ENDPOINT}/token",
+                        "type": "external_account",
+                        "credential_source": {
+                            "url": f"{SIDECAR_ENDPOINT}/credential",
+                            "format": {
+                                "type": "json",
+                                "subject_token_field_name": "access_token",
+                            },
+                        },
+                        "universe_domain": "googleapis.com",
+                    }
+                )
+    return _storage_client
+
+
+def _blob_metadata_cache_key(bucket_name: str, object_name: str) -> str:
+    digest = hashlib.sha256(f"{bucket_name}/{object_name}".encode('utf-8')).hexdigest()
+    return f"blob_metadata:{digest}"
+
+
+def get_blob_metadata(bucket_name: str, object_name: str) -> Optional[Dict[str, Any]]:
+    """
+    Object metadata and ACL policy, cached for FILE_METADATA_CACHE_TTL seconds
+    
+    Returns:
+        Dict with size, generation, etag, content_type, updated (POSIX
+        timestamp or None) and acl_policy (dict or None), or None if the
+        object does not exist
+    """
+    key = _blob_metadata_cache_key(bucket_name, object_name)
+    metadata = cache.get(key)
+    if metadata is not None:
+        return metadata
+    
+    blob = get_storage_client().bucket(bucket_name).blob(object_name)
+    try:
+        blob.reload()
+    except NotFound:
+        return None
+    
+    metadata = blob_metadata(blob)
+    cache.set(key, metadata, getattr(settings, 'FILE_METADATA_CACHE_TTL', 60))
+    return metadata
+
+
+def blob_metadata(blob) -> Dict[str, Any]:
+    """The get_blob_metadata dict for a blob whose properties are loaded"""
+    acl_policy = None
+    if blob.metadata and "custom:aclPolicy" in blob.metadata:
+        try:
+            acl_policy = json.loads(blob.metadata["custom:aclPolicy"])
+        except ValueError:
+            pass
+    
+    return {
+        'size': blob.size or 0,
+        'generation': blob.generation,
+        'etag': blob.etag,
+        'content_type': blob.content_type,
+        'updated': blob.updated.timestamp() if blob.updated else None,
+        'acl_policy': acl_policy,
+    }
+
+
+def get_object_metadata(bucket_name: str, object_name: str) -> Optional[Dict[str, Any]]:
+    """
+    Metadata and ACL policy for an uploaded object, from the object index
+    
+    Objects not in the StoredObject table yet (uploaded before it existed
+    and not reconciled) are looked up in storage unless
+    STORED_OBJECT_METADATA_FALLBACK is off.
+    
+    Returns:
+        Dict in the get_blob_metadata shape, or None if the object is unknown
+    """
+    from .models import StoredObject
+    
+    stored = StoredObject.objects.filter(bucket=bucket_name, object_name=object_name).first()
+    if stored is not None:
+        return stored.as_blob_metadata()
+    
+    if not getattr(settings, 'STORED_OBJECT_METADATA_FALLBACK', True):
+        return None
+    return get_blob_metadata(bucket_name, object_name)
+
+
+def invalidate_blob_metadata(bucket_name: str, object_name: str):
+    """Drop cached metadata after an object or its ACL changes"""
+    cache.delete(_blob_metadata_cache_key(bucket_name, object_name))
+
+
 class ReplitAppStorage(Storage):
     """
     Custom Django storage backend for Replit App Storage.
@@ -28,30 +153,24 @@ class ReplitAppStorage(Storage):
     """
     
     def __init__(self):
-        self.sidecar_endpoint = "http://127.0.0.1:1106"
-        
-        # Initialize Google Cloud Storage client with Replit credentials
-        self.storage_client = gcs.Client(
-            credentials={
-                "audience": "replit",
-                "subject_token_type": "access_token", 
-                "token_url": f"{self.sidecar_endpoint}/token",
-                "type": "external_account",
-                "credential_source": {
-                    "url": f"{self.sidecar_endpoint}/credential",
-                    "format": {
-                        "type": "json",
-                        "subject_token_field_name": "access_token",
-                    },
-                },
-                "universe_domain": "googleapis.com",
-            }
-        )
+        self.sidecar_endpoint = SIDECAR_ENDPOINT
+        
+        # Google Cloud Storage client with Replit credentials, shared by the process
+        self.storage_client = get_storage_client()
         
         # Configure storage paths from environment
         self.private_object_dir = os.getenv('PRIVATE_OBJECT_DIR', '/default-bucket/private')
         self.public_object_search_paths = os.getenv('PUBLIC_OBJECT_SEARCH_PATHS', '/default-bucket/public').split(',')
         
+        # Files saved through Django (ImageFields) live under this path
+        self.media_object_dir = getattr(settings, 'CLOUD_STORAGE_MEDIA_DIR', '') or f"{self.private_object_dir}/media"
+    
+    def _object_path(self, name: str) -> str:
+        """Full /bucket/object path for a storage name; relative names are media files."""
+        if name.startswith('/'):
+            return name
+        return f"{self.media_object_dir.rstrip('/')}/{name}"
+        
     def _get_bucket_and_object_name(self, path: str) -> tuple[str, str]:
         """Parse object path into bucket name and object name."""
         if not path.startswith('/'):
@@ -72,13 +191,14 @@ class ReplitAppStorage(Storage):
         # Create user-specific directory structure
         return f"{self.private_object_dir}/users/{user_id}/{object_id}/{filename}"
     
-    def _get_presigned_upload_url(self, bucket_name: str, object_name: str) -> str:
-        """Get presigned URL for file upload."""
+    def _get_presigned_url(self, bucket_name: str, object_name: str, method: str, ttl_seconds: int) -> str:
+        """Ask the sidecar to sign a URL for one object and method, valid for ttl_seconds."""
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
         request_data = {
             "bucket_name": bucket_name,
             "object_name": object_name,
-            "method": "PUT",
-            "expires_at": "2025-12-31T23:59:59Z"  # Far future expiry
+            "method": method,
+            "expires_at": expires_at.strftime('%Y-%m-%dT%H:%M:%SZ')
         }
         
         response = requests.post(
@@ -92,8 +212,26 @@ class ReplitAppStorage(Storage):
         
         return response.json()["signed_url"]
     
-    def _set_object_acl_policy(self, bucket_name: str, object_name: str, user_id: str, is_public: bool = False):
-        """Set ACL policy for the uploaded object."""
+    def _get_presigned_upload_url(self, bucket_name: str, object_name: str, ttl_seconds: Optional[int] = None) -> str:
+        """
+        Get a presigned URL the client PUTs a file to, valid for
+        ttl_seconds (default: DIRECT_UPLOAD_URL_TTL).
+        
+        The storage emulator signs a URL to its own upload endpoint instead.
+        """
+        if ttl_seconds is None:
+            ttl_seconds = getattr(settings, 'DIRECT_UPLOAD_URL_TTL', 900)
+        if hasattr(self.storage_client, 'signed_upload_url'):
+            return self.storage_client.signed_upload_url(bucket_name, object_name, ttl_seconds)
+        return self._get_presigned_url(bucket_name, object_name, "PUT", ttl_seconds)
+    
+    def _get_presigned_download_url(self, bucket_name: str, object_name: str, ttl_seconds: int = 300) -> str:
+        """Get a short-lived presigned URL for reading an object."""
+        return self._get_presigned_url(bucket_name, object_name, "GET", ttl_seconds)
+    
+    def _set_object_acl_policy(self, bucket_name: str, object_name: str, user_id: str,
+                               is_public: bool = False) -> Dict[str, Any]:
+        """Set ACL policy for the uploaded object and return its updated metadata."""
         bucket = self.storage_client.bucket(bucket_name)
         blob = bucket.blob(object_name)
         
@@ -107,26 +245,109 @@ class ReplitAppStorage(Storage):
         blob.metadata = blob.metadata or {}
         blob.metadata["custom:aclPolicy"] = json.dumps(acl_policy)
         blob.patch()
+        
+        # patch() reloads the object's properties from the response, so the
+        # fresh metadata can be cached without another round trip
+        metadata = blob_metadata(blob)
+        cache.set(
+            _blob_metadata_cache_key(bucket_name, object_name),
+            metadata,
+            getattr(settings, 'FILE_METADATA_CACHE_TTL', 60)
+        )
+        return metadata
     
-    def _save(self, name: str, content: ContentFile) -> str:
-        """Save file to Replit App Storage."""
-        # This method is called by Django when saving files
-        # For now, we'll use local storage and implement the full cloud upload
-        # in the API endpoints for better control over the upload process
+    def _save(self, name: str, content: File) -> str:
+        """
+        Upload a file saved through Django (e.g. an ImageField) to App Storage.
+        
+        Small files go up in one request. Larger ones use a resumable upload
+        session sent in CLOUD_STORAGE_UPLOAD_CHUNK_SIZE pieces, so a failed
+        chunk is retried from the last committed offset rather than from the
+        start. Files of CLOUD_STORAGE_PARALLEL_UPLOAD_THRESHOLD bytes or more
+        that Django has spooled to disk are sent as a multipart upload on
+        CLOUD_STORAGE_UPLOAD_WORKERS threads.
+        
+        Media files get a private ACL policy with no owner, so they are served
+        to signed-in guests like the rest of the gallery.
+        """
+        bucket_name, object_name = self._get_bucket_and_object_name(self._object_path(name))
+        chunk_size = getattr(settings, 'CLOUD_STORAGE_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+        parallel_threshold = getattr(settings, 'CLOUD_STORAGE_PARALLEL_UPLOAD_THRESHOLD', 64 * 1024 * 1024)
+        content_type = (
+            getattr(content, 'content_type', None)
+            or mimetypes.guess_type(name)[0]
+            or 'application/octet-stream'
+        )
+        
+        blob = self.storage_client.bucket(bucket_name).blob(object_name)
+        blob.metadata = {
+            "custom:aclPolicy": json.dumps({"owner": "", "visibility": "private", "aclRules": []})
+        }
+        
+        size = content.size
+        if (size >= parallel_threshold and hasattr(content, 'temporary_file_path')
+                and isinstance(self.storage_client, gcs.Client)):
+            transfer_manager.upload_chunks_concurrently(
+                content.temporary_file_path(),
+                blob,
+                content_type=content_type,
+                chunk_size=getattr(settings, 'CLOUD_STORAGE_PARALLEL_CHUNK_SIZE', 32 * 1024 * 1024),
+                worker_type=transfer_manager.THREAD,
+                max_workers=getattr(settings, 'CLOUD_STORAGE_UPLOAD_WORKERS', 4)
+            )
+            blob.reload()
+        else:
+            if size > chunk_size:
+                blob.chunk_size = chunk_size
+            content.seek(0)
+            # if_generation_match=0 only creates the object, which also makes
+            # retried requests safe
+            blob.upload_from_file(content, size=size, content_type=content_type, if_generation_match=0)
+        
+        metadata = blob_metadata(blob)
+        cache.set(
+            _blob_metadata_cache_key(bucket_name, object_name),
+            metadata,
+            getattr(settings, 'FILE_METADATA_CACHE_TTL', 60)
+        )
+        
+        from .models import StoredObject
+        StoredObject.record(bucket_name, object_name, metadata)
         return name
     
-    def _open(self, name: str, mode: str = 'rb'):
-        """Open file from storage."""
-        # Implementation for reading files from cloud storage
-        pass
+    def _open(self, name: str, mode: str = 'rb') -> File:
+        """
+        Open a file for streaming reads.
+        
+        The returned file fetches FILE_STREAM_CHUNK_SIZE ranged reads as it
+        is consumed and is pinned to the generation that was opened.
+        """
+        if 'r' not in mode or '+' in mode:
+            raise ValueError(f"Cloud storage files can only be opened for reading, not {mode!r}")
+        
+        bucket_name, object_name = self._get_bucket_and_object_name(self._object_path(name))
+        metadata = get_blob_metadata(bucket_name, object_name)
+        if metadata is None:
+            raise FileNotFoundError(f"No such file in cloud storage: {name}")
+        
+        blob = self.storage_client.bucket(bucket_name).blob(object_name, generation=metadata['generation'])
+        reader = blob.open('rb', chunk_size=getattr(settings, 'FILE_STREAM_CHUNK_SIZE', 256 * 1024))
+        
+        cloud_file = File(reader, name=name)
+        cloud_file.size = metadata['size']
+        return cloud_file
     
     def delete(self, name: str) -> bool:
         """Delete file from storage."""
         try:
-            bucket_name, object_name = self._get_bucket_and_object_name(name)
+            bucket_name, object_name = self._get_bucket_and_object_name(self._object_path(name))
             bucket = self.storage_client.bucket(bucket_name)
             blob = bucket.blob(object_name)
             blob.delete()
+            invalidate_blob_metadata(bucket_name, object_name)
+            
+            from .models import StoredObject
+            StoredObject.objects.filter(bucket=bucket_name, object_name=object_name).delete()
             return True
         except Exception:
             return False
@@ -134,26 +355,23 @@ class ReplitAppStorage(Storage):
     def exists(self, name: str) -> bool:
         """Check if file exists in storage."""
         try:
-            bucket_name, object_name = self._get_bucket_and_object_name(name)
-            bucket = self.storage_client.bucket(bucket_name)
-            blob = bucket.blob(object_name)
-            return blob.exists()
+            bucket_name, object_name = self._get_bucket_and_object_name(self._object_path(name))
+            return get_blob_metadata(bucket_name, object_name) is not None
         except Exception:
             return False
     
     def url(self, name: str) -> str:
         """Get URL for accessing the file."""
         # Return URL that goes through Django's protected file serving endpoint
-        return f"/api/files/{name.lstrip('/')}"
+        _, object_name = self._get_bucket_and_object_name(self._object_path(name))
+        return f"/api/files/{object_name}"
     
     def size(self, name: str) -> int:
         """Get file size."""
         try:
-            bucket_name, object_name = self._get_bucket_and_object_name(name)
-            bucket = self.storage_client.bucket(bucket_name)
-            blob = bucket.blob(object_name)
-            blob.reload()
-            return blob.size or 0
+            bucket_name, object_name = self._get_bucket_and_object_name(self._object_path(name))
+            metadata = get_blob_metadata(bucket_name, object_name)
+            return metadata['size'] if metadata else 0
         except Exception:
             return 0
 
@@ -190,20 +408,72 @@ class FileAccessControl:
         
         # Allow access for users with valid invitation codes (wedding guests)
         # This implements the wedding gallery sharing logic
-        return user.is_authenticated and hasattr(user, 'userprofile')
+        return user.is_authenticated and hasattr(user, 'profile')
     
     @staticmethod
     def get_file_acl_policy(bucket_name: str, object_name: str) -> Optional[Dict[str, Any]]:
-        """Get ACL policy for a file from its metadata."""
+        """Get ACL policy for a file from the object index or its (cached) metadata."""
         try:
-            storage_client = gcs.Client()
-            bucket = storage_client.bucket(bucket_name)
-            blob = bucket.blob(object_name)
-            blob.reload()
-            
-            if blob.metadata and "custom:aclPolicy" in blob.metadata:
-                return json.loads(blob.metadata["custom:aclPolicy"])
+            metadata = get_object_metadata(bucket_name, object_name)
+            if metadata:
+                return metadata['acl_policy']
         except Exception:
             pass
         
-        return None
\ No newline at end of file
+        return None
+
+
+def iter_blob_chunks(blob, chunk_size: Optional[int] = None, start: int = 0, end: Optional[int] = None):
+    """
+    Yield a blob's bytes as a series of ranged downloads.
+    
+    Only one chunk is held in memory at a time, whatever the object size.
+    The blob's generation must be known (loaded, or passed to bucket.blob())
+    and so must its size unless end is given. Reads are pinned to that
+    generation, so an object overwritten mid-stream fails instead of mixing
+    two versions.
+    
+    Args:
+        blob: google.cloud.storage Blob
+        chunk_size: Bytes per request (default: FILE_STREAM_CHUNK_SIZE)
+        start: First byte to send
+        end: Last byte to send, inclusive as in HTTP ranges (default: end of object)
+    """
+    chunk_size = chunk_size or getattr(settings, 'FILE_STREAM_CHUNK_SIZE', 256 * 1024)
+    last = blob.size - 1 if end is None else end
+    download_kwargs = {'if_generation_match': blob.generation} if blob.generation else {}
+    
+    position = start
+    while position <= last:
+        chunk_end = min(position + chunk_size - 1, last)
+        # Whole-object checksums cannot be verified on partial reads
+        yield blob.download_as_bytes(start=position, end=chunk_end, checksum=None, **download_kwargs)
+        position = chunk_end + 1
+
+
+@contextmanager
+def local_file_path(name: str, storage: Optional[Storage] = None):
+    """
+    A local filesystem path for a stored file, for libraries such as OpenCV
+    that only read from paths.
+    
+    Storages with local files (FileSystemStorage) give their own path; others
+    are copied to a temporary file in FILE_STREAM_CHUNK_SIZE pieces, which is
+    removed on exit.
+    """
+    storage = storage or default_storage
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        path = None
+    
+    if path is not None:
+        yield path
+        return
+    
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(name)[1]) as tmp:
+        with storage.open(name, 'rb') as stored:
+            for chunk in stored.chunks(getattr(settings, 'FILE_STREAM_CHUNK_SIZE', 256 * 1024)):
+                tmp.write(chunk)
+        tmp.flush()
+        yield tmp.name
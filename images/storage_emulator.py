@@ -0,0 +1,234 @@
+"""
+Local-filesystem stand-in for the Google Cloud Storage client
+Implements the part of the google.cloud.storage Client/Bucket/Blob API that
+ReplitAppStorage and the file views use, so USE_CLOUD_STORAGE can run in
+development and tests without the Replit sidecar. Selected by setting
+CLOUD_STORAGE_EMULATOR_ROOT.
+
+Layout: <root>/<bucket>/objects/<object name> holds the bytes and
+<root>/<bucket>/metadata/<object name>.json the object resource
+(generation, content type, custom metadata). Writes go through a temporary
+file and os.replace, so readers never see a partial object.
+
+Presigned upload URLs point at the app's own /api/storage-emulator/upload/
+endpoint, with the bucket, object and expiry signed with SECRET_KEY, so
+the direct-upload flow can be exercised end to end.
+"""
+
+import base64
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from django.core import signing
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+UPLOAD_TOKEN_SALT = 'images.storage_emulator.upload'
+
+
+class EmulatorClient:
+    """Drop-in for google.cloud.storage.Client backed by a directory"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def bucket(self, bucket_name: str) -> 'EmulatorBucket':
+        return EmulatorBucket(self, bucket_name)
+
+    def list_blobs(self, bucket_or_name, prefix: Optional[str] = None):
+        """Yield the loaded blobs of a bucket whose names start with prefix, in name order"""
+        bucket = bucket_or_name if isinstance(bucket_or_name, EmulatorBucket) else self.bucket(bucket_or_name)
+        objects_dir = os.path.join(self.root, bucket.name, 'objects')
+
+        names = []
+        for dirpath, _, filenames in os.walk(objects_dir):
+            for filename in filenames:
+                name = os.path.relpath(os.path.join(dirpath, filename), objects_dir).replace(os.sep, '/')
+                if not prefix or name.startswith(prefix):
+                    names.append(name)
+
+        for name in sorted(names):
+            blob = bucket.blob(name)
+            try:
+                blob.reload()
+            except NotFound:
+                continue
+            yield blob
+
+    def signed_upload_url(self, bucket_name: str, object_name: str, ttl_seconds: int) -> str:
+        """URL of the emulator upload endpoint that accepts one PUT of this object until it expires"""
+        token = signing.dumps(
+            {'bucket': bucket_name, 'object': object_name, 'expires': int(time.time()) + ttl_seconds},
+            salt=UPLOAD_TOKEN_SALT
+        )
+        return f"/api/storage-emulator/upload/{token}"
+
+    @staticmethod
+    def unsign_upload_token(token: str):
+        """
+        (bucket name, object name) of an upload URL token
+
+        Raises:
+            signing.BadSignature: If the token was tampered with or has expired
+        """
+        payload = signing.loads(token, salt=UPLOAD_TOKEN_SALT)
+        if payload['expires'] < time.time():
+            raise signing.SignatureExpired('Upload URL has expired')
+        return payload['bucket'], payload['object']
+
+
+class EmulatorBucket:
+    def __init__(self, client: EmulatorClient, name: str):
+        self.client = client
+        self.name = name
+
+    def blob(self, blob_name: str, generation: Optional[int] = None, chunk_size: Optional[int] = None):
+        return EmulatorBlob(self, blob_name, generation=generation, chunk_size=chunk_size)
+
+
+class EmulatorBlob:
+    """Drop-in for google.cloud.storage.Blob; properties are None until loaded"""
+
+    def __init__(self, bucket: EmulatorBucket, name: str, generation: Optional[int] = None,
+                 chunk_size: Optional[int] = None):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+        self.metadata = None
+        self.content_type = None
+        self.size = None
+        self.etag = None
+        self.updated = None
+        self.generation = generation
+        self._pinned_generation = generation
+
+    @property
+    def _data_path(self) -> str:
+        return os.path.join(self.bucket.client.root, self.bucket.name, 'objects', *self.name.split('/'))
+
+    @property
+    def _metadata_path(self) -> str:
+        return os.path.join(self.bucket.client.root, self.bucket.name, 'metadata', *self.name.split('/')) + '.json'
+
+    def _read_resource(self) -> dict:
+        try:
+            with open(self._metadata_path) as f:
+                resource = json.load(f)
+        except FileNotFoundError:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+
+        if self._pinned_generation and resource['generation'] != self._pinned_generation:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}#{self._pinned_generation}")
+        return resource
+
+    def _load(self, resource: dict):
+        self.generation = resource['generation']
+        self.size = resource['size']
+        self.content_type = resource['content_type']
+        self.metadata = resource['metadata']
+        self.updated = datetime.fromtimestamp(resource['updated'], tz=timezone.utc)
+        self.etag = base64.b64encode(str(resource['generation']).encode()).decode()
+
+    def _write_resource(self, resource: dict):
+        os.makedirs(os.path.dirname(self._metadata_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self._metadata_path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(resource, f)
+        os.replace(tmp_path, self._metadata_path)
+
+    def _check_generation(self, if_generation_match: Optional[int]):
+        if if_generation_match is None:
+            return
+        try:
+            current = self._read_resource()['generation']
+        except NotFound:
+            current = 0
+        if current != if_generation_match:
+            raise PreconditionFailed(f"Generation of {self.bucket.name}/{self.name} is {current}")
+
+    def exists(self) -> bool:
+        try:
+            self._read_resource()
+        except NotFound:
+            return False
+        return True
+
+    def reload(self, **kwargs):
+        self._load(self._read_resource())
+
+    def patch(self, **kwargs):
+        resource = self._read_resource()
+        resource['metadata'] = self.metadata
+        if self.content_type:
+            resource['content_type'] = self.content_type
+        self._write_resource(resource)
+        self._load(resource)
+
+    def delete(self, **kwargs):
+        self._read_resource()
+        os.remove(self._metadata_path)
+        try:
+            os.remove(self._data_path)
+        except FileNotFoundError:
+            pass
+
+    def upload_from_file(self, file_obj, rewind: bool = False, size: Optional[int] = None,
+                         content_type: Optional[str] = None, if_generation_match: Optional[int] = None,
+                         **kwargs):
+        """Copy file_obj into the bucket in bounded chunks and replace the object atomically"""
+        self._check_generation(if_generation_match)
+        if rewind:
+            file_obj.seek(0)
+
+        os.makedirs(os.path.dirname(self._data_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self._data_path), suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                remaining = size
+                while remaining is None or remaining > 0:
+                    chunk = file_obj.read(COPY_CHUNK_SIZE if remaining is None else min(COPY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                written = out.tell()
+            os.replace(tmp_path, self._data_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        resource = {
+            'generation': time.time_ns() // 1000,
+            'size': written,
+            'content_type': content_type or self.content_type or 'application/octet-stream',
+            'metadata': self.metadata,
+            'updated': time.time(),
+        }
+        self._pinned_generation = None
+        self._write_resource(resource)
+        self._load(resource)
+
+    def download_as_bytes(self, start: Optional[int] = None, end: Optional[int] = None,
+                          if_generation_match: Optional[int] = None, **kwargs) -> bytes:
+        """Bytes start..end, inclusive as in HTTP ranges"""
+        self._check_generation(if_generation_match)
+        self._read_resource()
+        with open(self._data_path, 'rb') as f:
+            f.seek(start or 0)
+            if end is None:
+                return f.read()
+            return f.read(end - (start or 0) + 1)
+
+    def open(self, mode: str = 'r', chunk_size: Optional[int] = None, **kwargs):
+        """Seekable binary reader over the object (only 'rb' is supported)"""
+        if mode != 'rb':
+            raise ValueError(f"The storage emulator only opens objects with mode 'rb', not {mode!r}")
+        self.reload()
+        return open(self._data_path, 'rb', buffering=chunk_size or -1)
@@ -1,3 +1,2037 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import unittest
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image as PILImage
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import direct_uploads, face_detectors, face_reencoding, face_views, models, storage, views
+from .benchmarking import (
+    find_regressions, load_baseline, run_face_benchmarks, summarize_latencies, synthesize_face_image
+)
+from .face_clustering import cluster_untagged_faces
+from .face_index import IVFFaceIndex, build_face_index, exact_search, get_face_index
+from .face_recognition_utils import (
+    FaceRecognitionService, coerce_encoding, find_matching_faces_for_person, get_person_match_index,
+    pack_encoding, store_detected_faces, unpack_encoding, unpack_encodings, update_prototypes
+)
+from .file_serving import RangeNotSatisfiable, offload_response, parse_range_header, ranged_response
+from .middleware import MediaCacheMiddleware
+from .models import StoredObject
+from .object_cache import ObjectDiskCache
+
+
+def face_encoding(seed, dim=138):
+    """Reproducible unit-length stand-in for a face encoding"""
+    vector = np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FaceDataMixin:
+    """Photos in a temporary MEDIA_ROOT with background processing switched off"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        patcher = mock.patch.object(models, 'submit_task')
+        self.submit_task = patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+        self.user = User.objects.create_user('guest', password='x')
+        self.staff = User.objects.create_user('admin', password='x', is_staff=True)
+
+    @staticmethod
+    def jpeg(seed=1, width=64, height=48):
+        import cv2
+        image, _ = synthesize_face_image(width, height, face_count=1, seed=seed)
+        return cv2.imencode('.jpg', image)[1].tobytes()
+
+    def create_image(self, seed=1, **fields):
+        fields.setdefault('title', f'photo {seed}')
+        fields.setdefault('uploader', self.user)
+        return models.Image.objects.create(
+            image_file=SimpleUploadedFile(f'IMG_{seed:04d}.jpg', self.jpeg(seed)), **fields
+        )
+
+    def create_tag(self, image, person=None, status='approved', seed=None, **fields):
+        face_tag = models.FaceTag(
+            image=image, person=person, status=status,
+            face_x=0.25, face_y=0.25, face_width=0.5, face_height=0.5, **fields
+        )
+        if seed is not None:
+            face_tag.set_encoding(face_encoding(seed))
+        face_tag.save()
+        return face_tag
+
+    def api(self, view, method='get', user=None, data=None, **kwargs):
+        factory = APIRequestFactory()
+        request = getattr(factory, method)('/', data, format='json' if method != 'get' else None)
+        force_authenticate(request, user=user or self.user)
+        return view(request, **kwargs)
+
+
+class FaceDetectionJobTests(FaceDataMixin, TestCase):
+    """Face detection queued as a ProcessingJob and polled for its result"""
+
+    def setUp(self):
+        super().setUp()
+        self.image = self.create_image()
+
+    def queue(self, user=None, **data):
+        with mock.patch('images.processing.submit_task') as submit, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.api(face_views.detect_faces_in_image, 'post', user=user, data=data,
+                                image_id=self.image.id)
+        return response, submit
+
+    def test_detection_is_queued_once_per_image(self):
+        first, submit = self.queue()
+        second, _ = self.queue()
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.data['status_url'], f"/api/jobs/{first.data['job_id']}/")
+        self.assertEqual(second.data['job_id'], first.data['job_id'])
+        self.assertEqual(models.ProcessingJob.objects.count(), 1)
+        submit.assert_called_once()
+
+    def test_different_options_get_their_own_job(self):
+        first, _ = self.queue()
+        second, _ = self.queue(detailed_quality=True)
+
+        self.assertNotEqual(first.data['job_id'], second.data['job_id'])
+
+    def test_finished_job_result_is_polled_by_requester_and_staff(self):
+        response, _ = self.queue()
+        job = models.ProcessingJob.objects.get(pk=response.data['job_id'])
+        faces = [{'x': 0.1, 'y': 0.2, 'width': 0.3, 'height': 0.3, 'confidence': 0.9,
+                  'encoding': face_encoding(1).tolist()}]
+        with mock.patch('images.face_recognition_utils.detect_faces_in_uploaded_image', return_value=faces):
+            job.run()
+
+        polled = self.api(face_views.processing_job_detail, job_id=job.id)
+        other = User.objects.create_user('other', password='x')
+
+        self.assertEqual(polled.data['status'], 'completed')
+        self.assertEqual(polled.data['result']['face_count'], 1)
+        self.assertNotIn('encoding', polled.data['result']['faces'][0])
+        self.assertEqual(polled.data['result']['faces'][0]['confidence'], 0.9)
+        self.assertEqual(self.api(face_views.processing_job_detail, user=self.staff, job_id=job.id).status_code, 200)
+        self.assertEqual(self.api(face_views.processing_job_detail, user=other, job_id=job.id).status_code, 403)
+
+    def test_failed_job_records_error(self):
+        response, _ = self.queue()
+        job = models.ProcessingJob.objects.get(pk=response.data['job_id'])
+        models.Image.objects.filter(pk=self.image.pk).update(image_file='')
+        job.refresh_from_db()
+
+        job.run()
+
+        self.assertEqual((job.status, job.error), ('failed', 'Job has no image file to run face detection on'))
+
+
+class PersonPrototypeTests(FaceDataMixin, TestCase):
+    """Incremental mean/exemplar updates and the shared person match index"""
+
+    def test_update_prototypes_keeps_running_mean_and_caps_exemplars(self):
+        encodings = [face_encoding(seed) for seed in range(6)]
+
+        mean, prototypes, count = update_prototypes(None, None, 0, encodings[:4], max_prototypes=3)
+        mean, prototypes, count = update_prototypes(mean, prototypes, count, encodings[4:], max_prototypes=3)
+
+        self.assertEqual(count, 6)
+        self.assertEqual(prototypes.shape, (3, 138))
+        np.testing.assert_allclose(mean, np.mean(encodings, axis=0), atol=1e-6)
+
+    def test_concurrent_instances_do_not_lose_encodings(self):
+        person = models.Person.objects.create(name='Alex', created_by=self.user)
+        stale = models.Person.objects.get(pk=person.pk)
+
+        person.add_face_encodings([face_encoding(1)])
+        stale.add_face_encodings([face_encoding(2)])
+
+        person.refresh_from_db()
+        self.assertEqual(person.encoding_count, 2)
+        np.testing.assert_allclose(person.encoding, (face_encoding(1) + face_encoding(2)) / 2, atol=1e-6)
+
+    def test_bulk_add_folds_each_person(self):
+        alex = models.Person.objects.create(name='Alex')
+        sam = models.Person.objects.create(name='Sam')
+
+        models.Person.bulk_add_face_encodings({
+            alex.id: [face_encoding(1), face_encoding(2)],
+            sam.id: [pack_encoding(face_encoding(3))],
+        })
+
+        counts = dict(models.Person.objects.values_list('name', 'encoding_count'))
+        self.assertEqual(counts, {'Alex': 2, 'Sam': 1})
+
+    def test_match_index_is_rebuilt_after_prototypes_change(self):
+        alex = models.Person.objects.create(name='Alex')
+        alex.add_face_encodings([face_encoding(1)])
+        self.assertEqual(len(get_person_match_index()), 1)
+
+        sam = models.Person.objects.create(name='Sam')
+        sam.add_face_encodings([face_encoding(2)])
+        index = get_person_match_index()
+
+        self.assertEqual(len(index), 2)
+        matches = index.match_many([face_encoding(2), face_encoding(1)], threshold=0.9, top_k=1)
+        self.assertEqual([[person_id for person_id, _ in row] for row in matches], [[sam.id], [alex.id]])
+
+
+class FaceClusteringTests(FaceDataMixin, TestCase):
+    """Offline clustering of untagged faces and the admin review actions"""
+
+    def setUp(self):
+        super().setUp()
+        image = self.create_image()
+        rng = np.random.default_rng(0)
+        self.groups = []
+        for centre_seed in (1, 2):
+            centre = face_encoding(centre_seed)
+            tags = []
+            for _ in range(3):
+                tag = self.create_tag(image, status='unassigned')
+                tag.set_encoding(centre + rng.normal(0, 0.01, centre.shape).astype(np.float32))
+                tag.save()
+                tags.append(tag)
+            self.groups.append(tags)
+        self.loner = self.create_tag(image, status='unassigned', seed=3)
+
+    def cluster_of(self, tags):
+        return {tag.cluster_id for tag in models.FaceTag.objects.filter(pk__in=[t.pk for t in tags])}
+
+    def test_similar_faces_are_proposed_together(self):
+        summary = cluster_untagged_faces(threshold=0.9)
+
+        self.assertEqual((summary['face_count'], summary['cluster_count']), (7, 2))
+        first, second = (self.cluster_of(tags) for tags in self.groups)
+        self.assertEqual((len(first), len(second)), (1, 1))
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.cluster_of([self.loner]), {None})
+
+    def test_explicit_zero_threshold_is_respected(self):
+        summary = cluster_untagged_faces(threshold=0.0)
+
+        self.assertEqual(summary['threshold'], 0.0)
+        self.assertEqual(summary['cluster_count'], 1)
+
+    def test_dismissed_clusters_are_not_proposed_again(self):
+        cluster_untagged_faces(threshold=0.9)
+        dismissed_id = self.cluster_of(self.groups[0]).pop()
+
+        response = self.api(face_views.dismiss_face_cluster, 'post', user=self.staff, cluster_id=dismissed_id)
+        summary = cluster_untagged_faces(threshold=0.9)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((summary['face_count'], summary['cluster_count']), (4, 1))
+        self.assertEqual(self.cluster_of(self.groups[0]), {dismissed_id})
+        self.assertEqual(
+            list(models.FaceCluster.objects.values_list('status', flat=True).order_by('status')),
+            ['dismissed', 'proposed']
+        )
+
+    def test_assigning_cluster_tags_every_face(self):
+        cluster_untagged_faces(threshold=0.9)
+        cluster_id = self.cluster_of(self.groups[1]).pop()
+
+        response = self.api(face_views.assign_face_cluster, 'post', user=self.staff, data={'name': 'Sam'},
+                            cluster_id=cluster_id)
+
+        person = models.Person.objects.get(name='Sam')
+        self.assertEqual(response.data['tagged_count'], 3)
+        self.assertEqual(person.encoding_count, 3)
+        self.assertEqual(models.FaceCluster.objects.get(pk=cluster_id).status, 'named')
+        self.assertEqual(set(models.FaceTag.objects.filter(person=person).values_list('status', flat=True)),
+                         {'approved'})
+
+
+class BulkTagReviewTests(FaceDataMixin, TestCase):
+    """Set-based approve/reject with per-id results"""
+
+    def setUp(self):
+        super().setUp()
+        self.image = self.create_image()
+        self.person = models.Person.objects.create(name='Alex')
+
+    def review(self, view, tag_ids):
+        return self.api(view, 'post', user=self.staff, data={'tag_ids': tag_ids})
+
+    def test_bulk_approve_reports_each_id(self):
+        pending = self.create_tag(self.image, self.person, status='pending', seed=1)
+        unassigned = self.create_tag(self.image, status='unassigned', seed=2)
+        rejected = self.create_tag(self.image, self.person, status='rejected', seed=3)
+
+        response = self.review(face_views.bulk_approve_tags, [pending.id, unassigned.id, rejected.id, 999999])
+
+        self.assertEqual(response.data['approved_count'], 1)
+        self.assertEqual(
+            {row['tag_id']: row['status'] for row in response.data['results']},
+            {pending.id: 'approved', unassigned.id: 'skipped', rejected.id: 'skipped', 999999: 'not_found'}
+        )
+        statuses = dict(models.FaceTag.objects.values_list('id', 'status'))
+        self.assertEqual((statuses[unassigned.id], statuses[rejected.id]), ('unassigned', 'rejected'))
+        self.person.refresh_from_db()
+        self.assertEqual(self.person.encoding_count, 1)
+
+    def test_rejecting_approved_tags_rebuilds_prototypes(self):
+        tags = [self.create_tag(self.image, self.person, status='pending', seed=seed) for seed in (1, 2, 3)]
+        self.review(face_views.bulk_approve_tags, [tag.id for tag in tags])
+
+        self.review(face_views.bulk_reject_tags, [tags[0].id])
+
+        self.person.refresh_from_db()
+        self.assertEqual(self.person.encoding_count, 2)
+        np.testing.assert_allclose(self.person.encoding, (face_encoding(2) + face_encoding(3)) / 2, atol=1e-6)
+
+    def test_rejecting_last_approved_tag_clears_encoding(self):
+        tag = self.create_tag(self.image, self.person, status='pending', seed=1)
+        tag.approve(self.staff)
+
+        tag.reject(self.staff)
+
+        self.person.refresh_from_db()
+        self.assertEqual((self.person.encoding_count, self.person.face_encoding), (0, None))
+
+
+class ModerationQueueTests(FaceDataMixin, TestCase):
+    """Keyset-paginated queue of pending tags and face-crop cleanup"""
+
+    def setUp(self):
+        super().setUp()
+        self.image = self.create_image()
+        person = models.Person.objects.create(name='Alex')
+        self.tags = [self.create_tag(self.image, person, status='pending') for _ in range(5)]
+        self.create_tag(self.image, person, status='approved')
+
+    def page(self, **params):
+        request = APIRequestFactory().get('/api/admin/moderation-queue/', params)
+        force_authenticate(request, user=self.staff)
+        return face_views.moderation_queue(request)
+
+    def walk(self):
+        ids, cursor = [], None
+        while True:
+            response = self.page(page_size=2, **({'cursor': cursor} if cursor else {}))
+            ids += [row['id'] for row in response.data['results']]
+            cursor = response.data['next_cursor']
+            if not response.data['has_next']:
+                return ids, response.data['count']
+
+    def test_cursor_walks_every_pending_tag_newest_first(self):
+        ids, count = self.walk()
+
+        self.assertEqual(ids, [tag.id for tag in reversed(self.tags)])
+        self.assertEqual(count, 5)
+
+    def test_tags_created_at_the_same_instant_are_ordered_by_id(self):
+        models.FaceTag.objects.update(created_at=timezone.now())
+
+        ids, _ = self.walk()
+
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(ids), 5)
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.page(cursor='not-a-cursor').status_code, 400)
+
+    def test_deleting_a_tag_removes_its_face_crop(self):
+        tag = self.tags[0]
+        tag.face_crop.save('face.jpg', ContentFile(b'crop'))
+        path = tag.face_crop.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.delete()
+
+        self.assertFalse(os.path.exists(path))
+
+
+class FaceQualityTierTests(SimpleTestCase):
+    """The eye cascade only runs for borderline faces unless asked for"""
+
+    def setUp(self):
+        self.service = FaceRecognitionService()
+        # Flat mid-grey: no sharpness, ideal brightness, minimum size -> cheap score 0.25
+        self.face = np.full((30, 30), 128, dtype=np.uint8)
+
+    def test_clear_faces_use_the_cheap_tier(self):
+        timings = {}
+
+        score, tier = self.service._calculate_face_quality(self.face, timings=timings)
+
+        self.assertEqual(tier, 'cheap')
+        self.assertAlmostEqual(score, 0.25, places=2)
+        self.assertEqual(timings.get('eye_checks', 0), 0)
+
+    def test_borderline_faces_run_the_eye_check(self):
+        self.service.quality_threshold = 0.3
+        timings = {}
+
+        _, tier = self.service._calculate_face_quality(self.face, timings=timings)
+
+        self.assertEqual((tier, timings['eye_checks']), ('eyes', 1))
+
+    def test_eye_check_can_be_forced_either_way(self):
+        self.service.quality_threshold = 0.3
+
+        self.assertEqual(self.service._calculate_face_quality(self.face, eye_check=True)[1], 'eyes')
+        self.assertEqual(self.service._calculate_face_quality(self.face, eye_check=False)[1], 'cheap')
+
+    def test_detailed_quality_checks_every_face_and_reports_timings(self):
+        import cv2
+        image, _ = synthesize_face_image(160, 120, face_count=1, seed=1)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as tmp:
+            cv2.imwrite(tmp.name, image)
+            detector = mock.Mock(detect=mock.Mock(return_value=[(10, 10, 60, 60, 1.0), (80, 20, 40, 40, 1.0)]))
+            detector.name = 'stub'
+            timings = {}
+            with mock.patch('images.face_recognition_utils.get_face_detector', return_value=detector):
+                faces = self.service.detect_faces_in_image(tmp.name, detailed_quality=True, timings=timings)
+
+        self.assertEqual([face['quality_tier'] for face in faces], ['eyes', 'eyes'])
+        self.assertEqual(timings['eye_checks'], 2)
+        for stage in ('decode', 'detect', 'encode', 'quality_cheap', 'quality_eyes'):
+            self.assertGreaterEqual(timings[stage], 0.0, stage)
+
+
+class FaceDetectorBackendTests(SimpleTestCase):
+    """Backend selection, fallback and the detector interface"""
+
+    def setUp(self):
+        patcher = mock.patch.object(face_detectors, '_local', threading.local())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_incomplete_backend_fails_when_created(self):
+        class NoDetect(face_detectors.FaceDetector):
+            name = 'incomplete'
+
+        with self.assertRaises(TypeError):
+            NoDetect()
+
+    @override_settings(FACE_DETECTOR_BACKEND='dnn', FACE_DETECTOR_DNN_MODEL='')
+    def test_unavailable_backend_falls_back_to_haar(self):
+        with self.assertLogs('images.face_detectors', 'WARNING'):
+            detector = face_detectors.get_face_detector()
+
+        self.assertIsInstance(detector, face_detectors.HaarFaceDetector)
+        self.assertIs(face_detectors.get_face_detector(), detector)
+
+    def test_unknown_backend_is_reported(self):
+        with self.assertRaises(face_detectors.FaceDetectorUnavailable):
+            face_detectors.create_face_detector('nope')
+
+    def test_detections_are_pixel_boxes_with_scores(self):
+        image, _ = synthesize_face_image(320, 240, face_count=2, seed=3)
+
+        for x, y, w, h, score in face_detectors.get_face_detector('haar').detect(image):
+            self.assertTrue(0 <= x < 320 and 0 <= y < 240 and w > 0 and h > 0)
+            self.assertEqual(score, 1.0)
+
+
+class PersonImagesTests(FaceDataMixin, TestCase):
+    """Keyset-paginated photos of a person and their cached pages"""
+
+    def setUp(self):
+        super().setUp()
+        self.alex = models.Person.objects.create(name='Alex')
+        self.sam = models.Person.objects.create(name='Sam')
+        self.images = [self.create_image(seed) for seed in range(1, 4)]
+        self.tags = [self.create_tag(image, self.alex) for image in self.images]
+        settings_override = override_settings(PERSON_IMAGES_CACHED_PEOPLE=[self.alex.id, self.sam.id])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def image_ids(self, person, **params):
+        response = self.api(face_views.person_images, data=params, person_id=person.id)
+        return [item['id'] for item in response.data['results']], response.data['next_cursor']
+
+    def test_pages_follow_the_cursor_newest_first(self):
+        first, cursor = self.image_ids(self.alex, page_size=2)
+        second, last_cursor = self.image_ids(self.alex, page_size=2, cursor=cursor)
+
+        self.assertEqual(first + second, [image.id for image in reversed(self.images)])
+        self.assertIsNone(last_cursor)
+
+    def test_cached_page_is_served_until_tags_change(self):
+        self.image_ids(self.alex)
+        with self.assertNumQueries(2):  # the person and the viewer's likes; the page itself is cached
+            cached, _ = self.image_ids(self.alex)
+        self.assertEqual(len(cached), 3)
+
+        self.tags[0].delete()
+
+        self.assertEqual(len(self.image_ids(self.alex)[0]), 2)
+
+    def test_moving_a_tag_refreshes_both_people(self):
+        self.image_ids(self.alex)
+        self.image_ids(self.sam)
+
+        tag = models.FaceTag.objects.get(pk=self.tags[0].pk)
+        tag.person = self.sam
+        tag.save()
+
+        self.assertNotIn(self.images[0].id, self.image_ids(self.alex)[0])
+        self.assertEqual(self.image_ids(self.sam)[0], [self.images[0].id])
+
+
+class EncodingStorageTests(SimpleTestCase):
+    """Binary encoding blobs: a format version byte followed by the floats"""
+
+    def test_float32_round_trip_is_exact(self):
+        encoding = face_encoding(1)
+        blob = pack_encoding(encoding, 'float32')
+
+        self.assertEqual(blob[0], 1)
+        self.assertEqual(len(blob), 1 + 138 * 4)
+        np.testing.assert_array_equal(unpack_encoding(blob), encoding)
+
+    def test_float16_round_trip_is_close_and_half_the_size(self):
+        encoding = face_encoding(2)
+        blob = pack_encoding(encoding, 'float16')
+
+        self.assertEqual(blob[0], 2)
+        self.assertEqual(len(blob), 1 + 138 * 2)
+        np.testing.assert_allclose(unpack_encoding(blob), encoding, atol=1e-3)
+
+    def test_default_dtype_follows_setting(self):
+        with override_settings(FACE_ENCODING_DTYPE='float16'):
+            self.assertEqual(pack_encoding(face_encoding(1))[0], 2)
+
+    def test_prototype_stack_unpacks_to_rows(self):
+        stack = np.stack([face_encoding(seed) for seed in range(3)])
+
+        np.testing.assert_array_equal(unpack_encoding(pack_encoding(stack, 'float32'), dim=138), stack)
+
+    def test_empty_and_unknown_blobs(self):
+        self.assertIsNone(pack_encoding(None))
+        self.assertIsNone(unpack_encoding(None))
+        self.assertIsNone(unpack_encoding(b''))
+        with self.assertRaises(ValueError):
+            unpack_encoding(b'\x09abcd')
+
+    def test_coerce_accepts_blobs_and_float_lists(self):
+        encoding = face_encoding(3)
+
+        np.testing.assert_array_equal(coerce_encoding(memoryview(pack_encoding(encoding, 'float32'))), encoding)
+        np.testing.assert_allclose(coerce_encoding(encoding.tolist()), encoding, rtol=1e-6)
+        self.assertIsNone(coerce_encoding([]))
+
+    def test_unpack_encodings_skips_missing_and_wrong_length(self):
+        blobs = [pack_encoding(face_encoding(1), 'float32'), None,
+                 pack_encoding(face_encoding(2)[:10], 'float32'), pack_encoding(face_encoding(3), 'float16')]
+
+        matrix, kept = unpack_encodings(blobs)
+
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertEqual(kept.tolist(), [0, 3])
+        np.testing.assert_array_equal(matrix[0], face_encoding(1))
+
+
+class EncodingDataMigrationTests(TransactionTestCase):
+    """0023 packs the JSON encodings into blobs and 0024 stamps their algorithm version"""
+
+    before = [('images', '0022_facetag_person_status_img_idx')]
+    after = [('images', '0024_encoding_version')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def create_rows(self, apps):
+        user = apps.get_model('auth', 'User').objects.create(username='guest')
+        image = apps.get_model('images', 'Image').objects.create(
+            title='photo', image_file='IMG_0001.jpg', uploader=user
+        )
+        person = apps.get_model('images', 'Person').objects.create(
+            name='Alex', face_encoding=face_encoding(1).tolist(),
+            prototype_encodings=[face_encoding(1).tolist(), face_encoding(2).tolist()], encoding_count=2,
+        )
+        FaceTag = apps.get_model('images', 'FaceTag')
+        box = dict(image=image, tagged_by=user, face_x=0, face_y=0, face_width=1, face_height=1)
+        tagged = FaceTag.objects.create(person=person, face_encoding=face_encoding(3).tolist(), **box)
+        untagged = FaceTag.objects.create(**box)
+        return person.pk, tagged.pk, untagged.pk
+
+    def test_forward_packs_and_versions_encodings(self):
+        person_id, tagged_id, untagged_id = self.create_rows(self.migrate(self.before))
+
+        apps = self.migrate(self.after)
+        Person = apps.get_model('images', 'Person')
+        FaceTag = apps.get_model('images', 'FaceTag')
+        person = Person.objects.get(pk=person_id)
+        tagged = FaceTag.objects.get(pk=tagged_id)
+        untagged = FaceTag.objects.get(pk=untagged_id)
+
+        np.testing.assert_allclose(unpack_encoding(bytes(person.face_encoding)), face_encoding(1), rtol=1e-6)
+        self.assertEqual(unpack_encoding(bytes(person.prototype_encodings), dim=138).shape, (2, 138))
+        np.testing.assert_allclose(unpack_encoding(bytes(tagged.face_encoding)), face_encoding(3), rtol=1e-6)
+        self.assertEqual((person.encoding_version, tagged.encoding_version), (1, 1))
+        self.assertIsNone(untagged.face_encoding)
+        self.assertIsNone(untagged.encoding_version)
+
+    def test_backward_restores_float_lists(self):
+        person_id, tagged_id, _ = self.create_rows(self.migrate(self.before))
+        self.migrate(self.after)
+
+        apps = self.migrate(self.before)
+        person = apps.get_model('images', 'Person').objects.get(pk=person_id)
+        tagged = apps.get_model('images', 'FaceTag').objects.get(pk=tagged_id)
+
+        np.testing.assert_allclose(person.prototype_encodings[1], face_encoding(2), rtol=1e-6)
+        np.testing.assert_allclose(tagged.face_encoding, face_encoding(3), rtol=1e-6)
+
+
+class FaceBenchmarkHelpersTests(SimpleTestCase):
+    """Fast checks of the benchmark plumbing; these run with the normal test suite"""
+
+    def test_synthetic_images_are_reproducible(self):
+        image, boxes = synthesize_face_image(320, 240, 3, seed=7)
+        again, _ = synthesize_face_image(320, 240, 3, seed=7)
+
+        self.assertEqual(image.shape, (240, 320, 3))
+        self.assertEqual(len(boxes), 3)
+        self.assertTrue((image == again).all())
+
+    def test_summarize_latencies_reports_milliseconds(self):
+        summary = summarize_latencies([0.001, 0.002, 0.003])
+
+        self.assertEqual(summary['count'], 3)
+        self.assertAlmostEqual(summary['p50_ms'], 2.0)
+
+    def test_find_regressions_flags_slowdowns_beyond_threshold(self):
+        baseline = {
+            'detect': {'p50_ms': 100.0},
+            'encode': {'p50_ms': 10.0},
+            'compare_faces': {'p50_ms': 0.01},
+        }
+        results = {
+            'detect': {'p50_ms': 140.0},
+            'encode': {'p50_ms': 11.0},
+            'compare_faces': {'p50_ms': 0.03},  # below the noise floor
+            'new_benchmark': {'p50_ms': 5.0},   # no baseline yet
+        }
+
+        regressions = find_regressions(results, baseline, threshold=0.25)
+
+        self.assertEqual([r['name'] for r in regressions], ['detect'])
+        self.assertAlmostEqual(regressions[0]['change'], 0.4)
+
+    def test_run_face_benchmarks_covers_every_stage(self):
+        results = run_face_benchmarks(repeat=1, cases=[('tiny', 160, 120, 1)], candidates=10)
+
+        for name in ('detect/synthetic/tiny/total', 'detect/synthetic/tiny/detect',
+                     'detect/synthetic/tiny/encode', 'encode/64px', 'compare_faces',
+                     'find_similar_faces/10'):
+            self.assertIn(name, results)
+
+
+class IVFFaceIndexTests(SimpleTestCase):
+    """Approximate index: recall against exact search, persistence and inserts"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centres = rng.random((40, 138), dtype=np.float32)
+        self.vectors = centres[rng.integers(0, 40, 4000)] + rng.normal(0, 0.3, (4000, 138)).astype(np.float32)
+        self.ids = np.arange(4000, dtype=np.int64)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = tmp.name
+
+    def test_recall_against_exact_search(self):
+        index = IVFFaceIndex.build(self.path, self.ids, self.vectors, nlist=64)
+        queries = self.vectors[:50]
+
+        hits = 0
+        for query in queries:
+            expected = {i for i, _ in exact_search(self.ids, self.vectors, query, k=10)[0]}
+            found = {i for i, _ in index.search(query, k=10, nprobe=8)[0]}
+            hits += len(expected & found)
+
+        self.assertGreaterEqual(hits / (len(queries) * 10), 0.9)
+
+    def test_incremental_inserts_are_persisted(self):
+        index = IVFFaceIndex.build(self.path, self.ids[:1000], self.vectors[:1000], nlist=16)
+        reader = IVFFaceIndex.load(self.path)
+
+        # Grows past the initial capacity
+        index.add(self.ids[1000:], self.vectors[1000:])
+        reader.refresh()
+
+        self.assertEqual(len(reader), 4000)
+        self.assertEqual(reader.search(self.vectors[3999], k=1, nprobe=16)[0][0][0], 3999)
+
+    def test_empty_index_trains_on_first_insert(self):
+        index = IVFFaceIndex.build(self.path, np.empty(0, dtype=np.int64), np.empty((0, 138), dtype=np.float32))
+
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.search(self.vectors[0], k=1), [[]])
+
+        index.add(self.ids[:10], self.vectors[:10])
+        reader = IVFFaceIndex.load(self.path)
+
+        self.assertEqual(len(reader), 10)
+        self.assertEqual(reader.search(self.vectors[3], k=1, nprobe=16)[0][0][0], 3)
+
+    def test_nlist_is_clamped_to_the_vector_count(self):
+        index = IVFFaceIndex.build(self.path, self.ids[:5], self.vectors[:5], nlist=64)
+
+        self.assertEqual(len(index.centroids), 5)
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ['centroids.npy', 'ids.npy', 'lists.npy', 'meta.json', 'vectors.npy', 'write.lock'])
+
+
+class FaceIndexBuildTests(TestCase):
+
+    def test_building_with_no_stored_faces_gives_an_empty_index(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+
+        with override_settings(FACE_ANN_INDEX_DIR=tmp.name, FACE_ANN_ENABLED=True, FACE_ANN_MIN_FACES=0), \
+                mock.patch('images.face_index._index', None):
+            index = build_face_index()
+            self.assertEqual(len(index), 0)
+            self.assertEqual(len(get_face_index()), 0)
+
+
+class IndexedFaceMatchingTests(FaceDataMixin, TestCase):
+    """Person matching through the ANN index"""
+
+    def test_untagged_matches_survive_many_tagged_neighbours(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(
+            FACE_ANN_INDEX_DIR=tmp.name, FACE_ANN_ENABLED=True, FACE_ANN_MIN_FACES=0,
+            FACE_ANN_CANDIDATES=3, FACE_ANN_NPROBE=64
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch('images.face_index._index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        person = models.Person.objects.create(name='Alex')
+        image = self.create_image()
+        base = face_encoding(1)
+        rng = np.random.default_rng(0)
+
+        def near(scale):
+            return base + rng.normal(0, scale, base.shape).astype(np.float32)
+
+        # Ten tagged faces are closer to the person than the two untagged ones
+        for _ in range(10):
+            tag = self.create_tag(image, person)
+            tag.set_encoding(near(0.005))
+            tag.save()
+        untagged = []
+        for _ in range(2):
+            tag = self.create_tag(image, status='unassigned')
+            tag.set_encoding(near(0.02))
+            tag.save()
+            untagged.append(tag.id)
+        models.Person.rebuild_face_encodings([person.id])
+        build_face_index()
+        person.refresh_from_db()
+
+        matches = find_matching_faces_for_person(person)
+
+        self.assertEqual(sorted(face_tag.id for face_tag in matches), untagged)
+
+
+class FaceReencodingTests(FaceDataMixin, TestCase):
+    """Resumable backfill into the staging column and the atomic swap"""
+
+    def setUp(self):
+        super().setUp()
+        self.person = models.Person.objects.create(name='Alex')
+        self.tags = [self.create_tag(self.create_image(seed), self.person, seed=seed) for seed in range(1, 4)]
+        self.job = face_reencoding.get_or_create_reencode_job(2)
+
+    def test_interrupted_run_resumes_from_the_checkpoint(self):
+        real_batch = face_reencoding._reencode_batch
+        batches = []
+
+        def flaky_batch(tasks, dtype):
+            batches.append(tasks)
+            if len(batches) == 2:
+                raise RuntimeError('worker died')
+            return real_batch(tasks, dtype)
+
+        with mock.patch.object(face_reencoding, '_reencode_batch', side_effect=flaky_batch), \
+                self.assertRaises(RuntimeError):
+            face_reencoding.reencode_faces(self.job, batch_size=1, workers=0, swap=False)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.result['last_id'], self.tags[0].id)
+
+        with mock.patch.object(face_reencoding, '_reencode_batch', side_effect=flaky_batch):
+            state = face_reencoding.reencode_faces(self.job, batch_size=1, workers=0, swap=False)
+
+        # The failed batch is retried and the finished one is not redone
+        self.assertEqual([tasks[0][1][0][0] for tasks in batches[2:]], [self.tags[1].id, self.tags[2].id])
+        self.assertEqual((state['last_id'], state['encoded'], state['failed']), (self.tags[2].id, 3, 0))
+        self.assertEqual(models.FaceTag.objects.filter(staged_encoding_version=2).count(), 3)
+        self.assertEqual(models.FaceTag.objects.filter(encoding_version=1).count(), 3)
+
+    def test_swap_promotes_staged_encodings_and_rebuilds_people(self):
+        staged = face_encoding(9)
+        models.FaceTag.objects.filter(pk=self.tags[0].pk).update(
+            staged_encoding=pack_encoding(staged), staged_encoding_version=2
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            swapped = face_reencoding.swap_staged_encodings(2)
+
+        tag = models.FaceTag.objects.get(pk=self.tags[0].pk)
+        self.person.refresh_from_db()
+
+        self.assertEqual(swapped, 1)
+        np.testing.assert_array_equal(tag.encoding, staged)
+        self.assertEqual((tag.encoding_version, tag.staged_encoding), (2, None))
+        self.assertEqual((self.person.encoding_count, self.person.encoding_version), (1, 2))
+        np.testing.assert_allclose(self.person.encoding, staged, atol=1e-6)
+        self.assertEqual(face_reencoding.swap_staged_encodings(2), 0)
+
+    def test_queued_job_encodes_in_thread(self):
+        with mock.patch.object(face_reencoding, 'ProcessPoolExecutor') as pool, \
+                self.captureOnCommitCallbacks(execute=True):
+            state = face_reencoding.run_reencode_job(self.job)
+
+        pool.assert_not_called()
+        self.assertEqual(state['swapped'], 3)
+        self.assertFalse(models.FaceTag.objects.exclude(encoding_version=2).exists())
+
+
+class StoredDetectionTests(FaceDataMixin, TestCase):
+    """Detections stored as unassigned tags without duplicating existing faces"""
+
+    def setUp(self):
+        super().setUp()
+        self.image = self.create_image()
+
+    def face(self, x, y, size=0.2, seed=1):
+        return {'x': x, 'y': y, 'width': size, 'height': size, 'confidence': 0.9,
+                'encoding': face_encoding(seed).tolist()}
+
+    def store(self, faces):
+        with self.captureOnCommitCallbacks(execute=True):
+            return store_detected_faces(self.image, faces)
+
+    def test_faces_overlapping_an_existing_tag_are_skipped(self):
+        existing = self.create_tag(self.image, models.Person.objects.create(name='Alex'))
+
+        # IoU 0.81 with the existing 0.25-0.75 box, then a face elsewhere
+        created = self.store([self.face(0.3, 0.3, size=0.45), self.face(0.7, 0.7, seed=2)])
+
+        self.assertEqual([(tag.face_x, tag.face_y) for tag in created], [(0.7, 0.7)])
+        self.assertEqual(created[0].status, 'unassigned')
+        self.assertTrue(created[0].is_auto_generated)
+        self.assertTrue(created[0].face_crop)
+        np.testing.assert_allclose(created[0].encoding, face_encoding(2), atol=1e-6)
+        self.assertTrue(models.FaceTag.objects.filter(pk=existing.pk).exists())
+
+    def test_detecting_again_replaces_unassigned_faces_only(self):
+        first = self.store([self.face(0.0, 0.0), self.face(0.7, 0.7)])
+        models.FaceTag.objects.filter(pk=first[0].pk).update(
+            person=models.Person.objects.create(name='Alex'), status='pending'
+        )
+
+        second = self.store([self.face(0.0, 0.0), self.face(0.7, 0.7)])
+
+        self.assertEqual([(tag.face_x, tag.face_y) for tag in second], [(0.7, 0.7)])
+        self.assertEqual(
+            set(models.FaceTag.objects.filter(image=self.image).values_list('id', flat=True)),
+            {first[0].id, second[0].id}
+        )
+        self.image.refresh_from_db()
+        self.assertIsNotNone(self.image.faces_detected_at)
+
+
+class FaceCropTests(FaceDataMixin, TestCase):
+    """Face crop rendering and the person avatars chosen from them"""
+
+    def setUp(self):
+        super().setUp()
+        self.person = models.Person.objects.create(name='Alex')
+        self.image = self.create_image()
+
+    def test_crop_is_a_square_jpeg_and_becomes_the_avatar(self):
+        tag = self.create_tag(self.image, self.person)
+
+        with override_settings(FACE_CROP_SIZE=32):
+            tag.generate_face_crop()
+
+        self.person.refresh_from_db()
+        with tag.face_crop.open('rb') as crop_file, PILImage.open(crop_file) as crop:
+            self.assertEqual((crop.format, crop.size), ('JPEG', (32, 32)))
+        self.assertEqual(self.person.avatar_url, tag.face_crop.url)
+
+    def test_crops_for_one_photo_decode_it_once(self):
+        tags = [self.create_tag(self.image, self.person, status=status) for status in ('approved', 'pending')]
+
+        with mock.patch.object(storage, 'local_file_path', wraps=storage.local_file_path) as opened, \
+                self.assertNumQueries(2):  # the bulk crop update and the avatar refresh
+            models.FaceTag.generate_face_crops(tags)
+
+        opened.assert_called_once()
+        self.assertTrue(all(tag.face_crop for tag in models.FaceTag.objects.filter(image=self.image)))
+
+    def test_avatar_is_the_most_confident_approved_crop(self):
+        self.assertIsNone(self.person.avatar_url)
+        low, high, pending = (
+            self.create_tag(self.image, self.person, confidence_score=0.5),
+            self.create_tag(self.image, self.person, confidence_score=0.9),
+            self.create_tag(self.image, self.person, status='pending', confidence_score=1.0),
+        )
+        models.FaceTag.generate_face_crops([low, high, pending])
+
+        self.person.refresh_from_db()
+        self.assertEqual(self.person.avatar_tag_id, high.id)
+
+        high.delete()
+        models.Person.refresh_avatars([self.person.id])
+        self.person.refresh_from_db()
+        self.assertEqual(self.person.avatar_tag_id, low.id)
+
+
+class FaceTaggingApiTests(FaceDataMixin, TestCase):
+    """Owner-or-staff edits of people and tags, and the batch tags-per-image endpoint"""
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('other', password='x')
+        self.person = models.Person.objects.create(name='Alex', created_by=self.user)
+        self.image = self.create_image()
+        self.tag = self.create_tag(self.image, self.person, tagged_by=self.user)
+
+    def person_detail(self, method, user, data=None):
+        return self.api(face_views.PersonDetailView.as_view(), method, user, data, pk=self.person.pk)
+
+    def tag_detail(self, method, user, data=None):
+        return self.api(face_views.FaceTagDetailView.as_view(), method, user, data, pk=self.tag.pk)
+
+    def test_person_is_edited_by_its_creator_or_staff_only(self):
+        self.assertEqual(self.person_detail('get', self.other).status_code, 200)
+        self.assertEqual(self.person_detail('patch', self.other, {'name': 'Sam'}).status_code, 403)
+        self.assertEqual(self.person_detail('delete', self.other).status_code, 403)
+        self.assertEqual(self.person_detail('patch', self.user, {'name': 'Alexandra'}).status_code, 200)
+        self.assertEqual(self.person_detail('patch', self.staff, {'name': 'Alex'}).status_code, 200)
+        self.assertEqual(self.person_detail('delete', self.staff).status_code, 204)
+
+    def test_tag_is_edited_by_its_tagger_or_staff_only(self):
+        self.assertEqual(self.tag_detail('get', self.other).status_code, 200)
+        self.assertEqual(self.tag_detail('patch', self.other, {'face_x': 0.1}).status_code, 403)
+        self.assertEqual(self.tag_detail('delete', self.other).status_code, 403)
+        self.assertEqual(self.tag_detail('patch', self.user, {'face_x': 0.1}).status_code, 200)
+        self.assertEqual(self.tag_detail('patch', self.staff, {'face_x': 0.2}).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.tag_detail('delete', self.staff).status_code, 204)
+        self.assertFalse(models.FaceTag.objects.filter(pk=self.tag.pk).exists())
+
+    def approved_with_encoding(self):
+        models.FaceTag.objects.filter(pk=self.tag.pk).update(
+            face_encoding=pack_encoding(face_encoding(1)), encoding_version=1
+        )
+        models.Person.rebuild_face_encodings([self.person.id])
+        self.tag.refresh_from_db()
+        self.person.refresh_from_db()
+        self.assertEqual(self.person.encoding_count, 1)
+
+    def test_moving_an_approved_tag_sends_it_back_for_review(self):
+        self.approved_with_encoding()
+        sam = models.Person.objects.create(name='Sam', created_by=self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.tag_detail('patch', self.user, {'person': sam.id})
+
+        self.assertEqual((response.status_code, response.data['status']), (200, 'pending'))
+        self.person.refresh_from_db()
+        self.assertEqual((self.person.encoding_count, self.person.face_encoding), (0, None))
+
+    def test_editing_an_approved_tag_box_keeps_it_approved(self):
+        response = self.tag_detail('patch', self.user, {'face_x': 0.1})
+
+        self.assertEqual(response.data['status'], 'approved')
+
+    def test_deleting_an_approved_tag_rebuilds_the_person(self):
+        self.approved_with_encoding()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.tag_detail('delete', self.user).status_code, 204)
+
+        self.person.refresh_from_db()
+        self.assertEqual((self.person.encoding_count, self.person.avatar_tag_id), (0, None))
+
+    def apply_suggestion(self, user, face_tag, person):
+        return self.api(face_views.apply_auto_tag_suggestion, 'post', user,
+                        {'face_tag_id': face_tag.id, 'person_id': person.id, 'confidence': 0.8})
+
+    def test_suggestions_cannot_take_over_other_users_tags(self):
+        sam = models.Person.objects.create(name='Sam')
+
+        self.assertEqual(self.apply_suggestion(self.other, self.tag, sam).status_code, 403)
+        self.tag.refresh_from_db()
+        self.assertEqual((self.tag.person_id, self.tag.status), (self.person.id, 'approved'))
+
+    def test_suggestion_claims_an_unassigned_detection(self):
+        detection = self.create_tag(self.image, status='unassigned')
+
+        response = self.apply_suggestion(self.other, detection, self.person)
+
+        detection.refresh_from_db()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((detection.person_id, detection.status, detection.tagged_by_id),
+                         (self.person.id, 'pending', self.other.id))
+
+    def test_suggestion_on_an_approved_tag_rebuilds_the_old_person(self):
+        self.approved_with_encoding()
+        sam = models.Person.objects.create(name='Sam')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.apply_suggestion(self.staff, self.tag, sam).status_code, 200)
+
+        self.person.refresh_from_db()
+        self.assertEqual(self.person.encoding_count, 0)
+
+    def test_missing_objects_are_404(self):
+        response = self.api(face_views.PersonDetailView.as_view(), 'patch', self.user, {'name': 'x'}, pk=0)
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_batch_returns_approved_tags_for_every_requested_image(self):
+        self.tag.generate_face_crop()
+        untagged = self.create_image(2)
+        self.create_tag(untagged, self.person, status='pending')
+
+        with self.assertNumQueries(1):
+            response = self.api(face_views.face_tags_for_images,
+                                data={'image_ids': f'{self.image.id},{untagged.id}'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][str(untagged.id)], [])
+        [tag] = response.data['results'][str(self.image.id)]
+        self.assertEqual((tag['id'], tag['person_name']), (self.tag.id, 'Alex'))
+        self.assertEqual(tag['face_location'], {'x': 0.25, 'y': 0.25, 'width': 0.5, 'height': 0.5})
+        self.tag.refresh_from_db()
+        self.assertEqual(tag['face_crop_url'], self.tag.face_crop.url)
+
+    def test_batch_validates_image_ids(self):
+        with override_settings(FACE_TAG_BATCH_MAX_IMAGES=2):
+            for image_ids in ('', '1,x', '1,2,3'):
+                response = self.api(face_views.face_tags_for_images, data={'image_ids': image_ids})
+                self.assertEqual(response.status_code, 400, image_ids)
+
+
+class RangeHeaderParsingTests(SimpleTestCase):
+    """Range header edge cases from RFC 9110"""
+
+    def test_single_open_and_suffix_ranges(self):
+        self.assertEqual(parse_range_header('bytes=0-99', 1000), [(0, 99)])
+        self.assertEqual(parse_range_header('bytes=900-', 1000), [(900, 999)])
+        self.assertEqual(parse_range_header('bytes=-100', 1000), [(900, 999)])
+        self.assertEqual(parse_range_header('bytes=990-2000', 1000), [(990, 999)])
+
+    def test_overlapping_ranges_are_merged(self):
+        self.assertEqual(parse_range_header('bytes=50-99, 0-60, 200-210', 1000), [(0, 99), (200, 210)])
+
+    def test_malformed_headers_mean_whole_file(self):
+        for header in (None, '', 'items=0-1', 'bytes=abc', 'bytes=5-1', 'bytes=1'):
+            self.assertIsNone(parse_range_header(header, 1000), header)
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header('bytes=1000-', 1000)
+
+    def test_any_range_of_an_empty_file_is_unsatisfiable(self):
+        for header in ('bytes=-10', 'bytes=0-', 'bytes=0-0'):
+            with self.assertRaises(RangeNotSatisfiable):
+                parse_range_header(header, 0)
+
+    def test_empty_file_range_response(self):
+        request = RequestFactory().get('/', HTTP_RANGE='bytes=-10')
+
+        response = ranged_response(request, 0, 'text/plain', read_range=lambda start, end: iter(()))
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+
+
+class RangeResponseTestsMixin:
+    """Shared 200/206/416 and If-Range checks; subclasses provide get()"""
+
+    content = bytes(range(256)) * 40  # 10240 bytes
+
+    def read(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_response_advertises_ranges(self):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(self.read(response), self.content)
+
+    def test_single_range(self):
+        response = self.get(HTTP_RANGE='bytes=100-4099')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-4099/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '4000')
+        self.assertEqual(self.read(response), self.content[100:4100])
+
+    def test_multiple_ranges(self):
+        response = self.get(HTTP_RANGE='bytes=0-9, -10')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = self.read(response)
+        self.assertEqual(response['Content-Length'], str(len(body)))
+        self.assertIn(f'Content-Range: bytes 0-9/{len(self.content)}'.encode(), body)
+        self.assertIn(self.content[:10], body)
+        self.assertIn(self.content[-10:], body)
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE=f'bytes={len(self.content)}-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range_with_current_validator_returns_range(self):
+        etag = self.get()['ETag']
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+
+        self.assertEqual(response.status_code, 206)
+
+    def test_if_range_with_stale_validator_returns_whole_file(self):
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.read(response), self.content)
+
+    def test_if_range_date(self):
+        last_modified = self.get()['Last-Modified']
+
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=last_modified).status_code, 206)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=http_date(0)).status_code, 200)
+
+
+class MediaRangeTests(RangeResponseTestsMixin, SimpleTestCase):
+    """Local media files served by serve_media"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with open(os.path.join(tmp.name, 'clip.mp4'), 'wb') as f:
+            f.write(self.content)
+        settings_override = override_settings(MEDIA_ROOT=tmp.name, FILE_STREAM_CHUNK_SIZE=1000)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get(self, **headers):
+        return views.serve_media(RequestFactory().get('/media/clip.mp4', **headers), 'clip.mp4')
+
+
+class MediaCacheMiddlewareTests(SimpleTestCase):
+    """Media validators come from stat; 304s are decided before the view runs"""
+
+    content = b'x' * 5000
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.name = 'originals/ab/cd/' + 'abcd' * 16 + '.jpg'
+        os.makedirs(os.path.join(media_root.name, 'originals', 'ab', 'cd'))
+        with open(os.path.join(media_root.name, self.name), 'wb') as f:
+            f.write(self.content)
+
+        self.view = mock.Mock(side_effect=lambda request: views.serve_media(request, self.name))
+        self.middleware = MediaCacheMiddleware(self.view)
+
+    def get(self, **headers):
+        return self.middleware(RequestFactory().get('/media/' + self.name, **headers))
+
+    def test_streamed_response_passes_through_with_validators(self):
+        response = self.get()
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['ETag'], '"' + 'abcd' * 16 + '"')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_matching_etag_is_answered_without_calling_the_view(self):
+        etag = self.get()['ETag']
+        self.view.reset_mock()
+
+        response = self.get(HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.view.assert_not_called()
+
+    def test_if_modified_since_is_answered_without_calling_the_view(self):
+        last_modified = self.get()['Last-Modified']
+        self.view.reset_mock()
+
+        response = self.get(HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, 304)
+        self.view.assert_not_called()
+
+
+class FakeBlob:
+    """Stand-in for a google.cloud.storage Blob backed by bytes"""
+
+    def __init__(self, content):
+        self.content = content
+        self.size = len(content)
+        self.generation = 3
+        self.etag = 'CKih16GjycICEAE='
+        self.content_type = 'video/mp4'
+        self.updated = datetime.datetime(2026, 6, 1, 12, 0, tzinfo=datetime.timezone.utc)
+        self.name = 'public/clip.mp4'
+        self.metadata = {'custom:aclPolicy': json.dumps({'owner': '1', 'visibility': 'public'})}
+        self.reloads = 0
+
+    def reload(self):
+        self.reloads += 1
+
+    def patch(self):
+        pass
+
+    def download_as_bytes(self, start, end, checksum=None, if_generation_match=None):
+        assert if_generation_match == self.generation
+        return self.content[start:end + 1]
+
+
+class FakeStorageClient:
+    def __init__(self, blob):
+        self._blob = blob
+
+    def bucket(self, name):
+        return self
+
+    def blob(self, name, generation=None):
+        return self._blob
+
+    def list_blobs(self, bucket_name, prefix=''):
+        return [self._blob] if self._blob.name.startswith(prefix) else []
+
+
+class StandInObjectStoreMixin:
+    """Serves self.content from serve_protected_file through FakeBlob"""
+
+    content = RangeResponseTestsMixin.content
+    # Without the StoredObject index every lookup falls through to storage
+    use_object_index = False
+
+    def setUp(self):
+        settings_override = override_settings(USE_CLOUD_STORAGE=True, FILE_STREAM_CHUNK_SIZE=1000)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        cache.clear()
+        self.blob = FakeBlob(self.content)
+        for patcher in (
+            mock.patch.object(storage, 'get_storage_client', return_value=FakeStorageClient(self.blob)),
+            mock.patch.object(views.FileAccessControl, 'can_access_file', return_value=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        if not self.use_object_index:
+            for module in (storage, views):
+                patcher = mock.patch.object(module, 'get_object_metadata', side_effect=storage.get_blob_metadata)
+                patcher.start()
+                self.addCleanup(patcher.stop)
+
+    def get(self, **headers):
+        request = RequestFactory().get('/api/files/public/clip.mp4', **headers)
+        return views.serve_protected_file(request, 'public/clip.mp4')
+
+    def read(self, response):
+        return b''.join(response.streaming_content)
+
+
+class ProtectedFileRangeTests(StandInObjectStoreMixin, RangeResponseTestsMixin, SimpleTestCase):
+    """Cloud objects served by serve_protected_file, against a stand-in object store"""
+
+
+class ProtectedFileStreamingTests(StandInObjectStoreMixin, SimpleTestCase):
+    """Protected files are streamed in bounded ranged reads with full validators"""
+
+    def setUp(self):
+        super().setUp()
+        self.reads = []
+        download = self.blob.download_as_bytes
+
+        def recording_download(start, end, **kwargs):
+            self.reads.append((start, end))
+            return download(start, end, **kwargs)
+
+        self.blob.download_as_bytes = recording_download
+
+    def test_headers_describe_the_object(self):
+        response = self.get()
+
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['ETag'], '"CKih16GjycICEAE="')
+        self.assertEqual(response['Last-Modified'], http_date(self.blob.updated.timestamp()))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+
+    def test_body_is_read_lazily_one_chunk_at_a_time(self):
+        response = self.get()
+        self.assertEqual(self.reads, [])
+
+        chunks = list(response.streaming_content)
+
+        self.assertEqual(b''.join(chunks), self.content)
+        self.assertEqual(len(chunks), 11)
+        self.assertEqual(max(len(chunk) for chunk in chunks), 1000)
+        self.assertEqual(self.reads[:2], [(0, 999), (1000, 1999)])
+        self.assertEqual(self.reads[-1], (10000, 10239))
+
+    def test_ranges_are_read_in_chunks_too(self):
+        self.assertEqual(self.read(self.get(HTTP_RANGE='bytes=500-2499')), self.content[500:2500])
+        self.assertEqual(self.reads, [(500, 1499), (1500, 2499)])
+
+
+class ProtectedFileOffloadTests(StandInObjectStoreMixin, SimpleTestCase):
+    """With PROTECTED_FILE_OFFLOAD set, authorized downloads are handed to the proxy"""
+
+    signed_url = 'https://storage.googleapis.com/default-bucket/public/clip%20one.mp4?X-Goog-Signature=abc'
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(views.ReplitAppStorage, '_get_presigned_download_url',
+                                    return_value=self.signed_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(PROTECTED_FILE_OFFLOAD='x-accel-redirect')
+    def test_x_accel_redirect_hands_off_signed_url(self):
+        response = self.get()
+
+        self.assertEqual(response['X-Accel-Redirect'], '/_protected/remote/')
+        self.assertEqual(response['X-Offload-Url'], self.signed_url)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(PROTECTED_FILE_OFFLOAD_ROOT='/srv/cache')
+    def test_local_redirect_paths_are_percent_encoded(self):
+        response = offload_response('x-accel-redirect', 'image/jpeg', local_path='/srv/cache/lru/été #1?.jpg')
+
+        self.assertEqual(response['X-Accel-Redirect'], '/_protected/local/lru/%C3%A9t%C3%A9%20%231%3F.jpg')
+        self.assertFalse(response.has_header('X-Accel-Buffering'))
+        self.assertIsNone(offload_response('x-accel-redirect', 'image/jpeg', local_path='/elsewhere/a.jpg'))
+
+    @override_settings(PROTECTED_FILE_OFFLOAD='x-sendfile')
+    def test_x_sendfile_streams_remote_objects(self):
+        response = self.get(HTTP_RANGE='bytes=0-9')
+
+        self.assertFalse(response.has_header('X-Sendfile'))
+        self.assertEqual(self.read(response), self.content[:10])
+
+
+class BlobMetadataCacheTests(StandInObjectStoreMixin, SimpleTestCase):
+    """Metadata and ACL lookups are cached until the ACL changes"""
+
+    def test_repeat_downloads_reuse_cached_metadata(self):
+        for _ in range(3):
+            self.read(self.get())
+
+        self.assertEqual(self.blob.reloads, 1)
+
+    def test_acl_change_refreshes_cached_metadata(self):
+        self.get()
+
+        storage.ReplitAppStorage()._set_object_acl_policy('default-bucket', 'public/clip.mp4', '2', is_public=False)
+
+        self.assertEqual(storage.FileAccessControl.get_file_acl_policy('default-bucket', 'public/clip.mp4'),
+                         {'owner': '2', 'visibility': 'private', 'aclRules': []})
+        # patch() returns the updated object, so no reload is needed
+        self.assertEqual(self.blob.reloads, 1)
+
+
+class ProtectedFileRevalidationTests(StandInObjectStoreMixin, SimpleTestCase):
+    """Conditional GETs for cloud files are answered from metadata alone"""
+
+    def test_matching_etag_returns_304_without_reading_the_object(self):
+        etag = self.get()['ETag']
+        self.blob.download_as_bytes = mock.Mock()
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.blob.download_as_bytes.assert_not_called()
+
+
+class StoredObjectIndexTests(StandInObjectStoreMixin, TestCase):
+    """ACL checks and file listings read the StoredObject table, not storage"""
+
+    use_object_index = True
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('guest', password='x')
+        self.blob.metadata = {'custom:aclPolicy': json.dumps({'owner': str(self.user.pk), 'visibility': 'public'})}
+
+    def api(self, view, method='get', path='/', **data):
+        request = getattr(APIRequestFactory(), method)(path, data, format='json' if method == 'post' else None)
+        force_authenticate(request, user=self.user)
+        return view(request)
+
+    def set_acl(self, object_path):
+        return self.api(views.set_file_acl, 'post', upload_url=(
+            f'https://storage.googleapis.com{object_path}?X-Goog-Signature=abc'
+        ))
+
+    def test_set_file_acl_records_object(self):
+        object_name = f'private/users/{self.user.pk}/5f0c/clip.mp4'
+
+        response = self.set_acl(f'/default-bucket/{object_name}')
+
+        self.assertEqual(response.status_code, 200)
+        stored = StoredObject.objects.get(bucket='default-bucket', object_name=object_name)
+        self.assertEqual((stored.owner, stored.visibility, stored.size, stored.generation),
+                         (self.user, 'private', len(self.content), 3))
+
+    def test_set_file_acl_rejects_objects_outside_the_users_uploads(self):
+        other = User.objects.create_user('other', password='x')
+
+        with mock.patch.object(storage.ReplitAppStorage, '_set_object_acl_policy') as set_policy:
+            for object_path in (
+                '/default-bucket/public/clip.mp4',
+                f'/default-bucket/private/users/{other.pk}/5f0c/clip.mp4',
+                f'/default-bucket/private/users/{self.user.pk}/../{other.pk}/5f0c/clip.mp4',
+                f'/other-bucket/private/users/{self.user.pk}/5f0c/clip.mp4',
+            ):
+                self.assertEqual(self.set_acl(object_path).status_code, 403, object_path)
+
+        set_policy.assert_not_called()
+        self.assertFalse(StoredObject.objects.exists())
+
+    def test_download_reads_acl_from_index(self):
+        StoredObject.record('default-bucket', 'public/clip.mp4', storage.blob_metadata(self.blob))
+        cache.clear()
+
+        with self.assertNumQueries(1):
+            response = self.get()
+        self.assertEqual(self.read(response), self.content)
+        self.assertEqual(self.blob.reloads, 0)
+
+    @override_settings(STORED_OBJECT_METADATA_FALLBACK=False)
+    def test_unindexed_object_is_not_looked_up_in_storage(self):
+        self.assertEqual(self.get().status_code, 404)
+        self.assertEqual(self.blob.reloads, 0)
+
+    def test_list_user_files_pages_newest_first(self):
+        metadata = storage.blob_metadata(self.blob)
+        for n in range(3):
+            StoredObject.record('default-bucket', f'private/users/{self.user.pk}/{n}/photo.jpg', metadata)
+        StoredObject.objects.create(bucket='default-bucket', object_name='private/other.jpg')
+
+        first = self.api(views.list_user_files, page_size=2).data
+        second = self.api(views.list_user_files, page_size=2, cursor=first['next_cursor']).data
+
+        paths = [f['object_path'] for f in first['files'] + second['files']]
+        self.assertEqual(paths, [f'/objects/private/users/{self.user.pk}/{n}/photo.jpg' for n in (2, 1, 0)])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_reconcile_upserts_and_prunes(self):
+        StoredObject.objects.create(bucket='default-bucket', object_name='public/gone.mp4')
+        StoredObject.objects.create(bucket='default-bucket', object_name='public/clip.mp4', size=1)
+
+        call_command('reconcile_stored_objects', prefix=['/default-bucket/public'], prune=True, stdout=StringIO())
+
+        stored = StoredObject.objects.get()
+        self.assertEqual((stored.object_name, stored.owner, stored.size),
+                         ('public/clip.mp4', self.user, len(self.content)))
+
+
+class ObjectDiskCacheTests(SimpleTestCase):
+    """Read-through disk cache: hits, LRU eviction and pinning"""
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        cache.clear()
+
+        self.blobs = {}
+        client = mock.Mock()
+        client.bucket.return_value.blob.side_effect = lambda name, generation=None: self.blobs[name]
+        patcher = mock.patch.object(storage, 'get_storage_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.cache = ObjectDiskCache(root.name, max_bytes=2500, max_object_size=2000,
+                                     pinned_patterns=['*/thumbnails/*'])
+
+    def put(self, name, size=1000):
+        blob = FakeBlob(bytes([len(self.blobs)]) * size)
+        self.blobs[name] = blob
+        return self.cache.get_or_fetch('default-bucket', name, storage.blob_metadata(blob))
+
+    def test_miss_then_hit(self):
+        path = self.put('a.jpg')
+        metadata = storage.blob_metadata(self.blobs['a.jpg'])
+        self.assertEqual(self.cache.get_or_fetch('default-bucket', 'a.jpg', metadata), path)
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.blobs['a.jpg'].content)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['bytes_used']), (1, 1, 1000))
+
+    def test_least_recently_used_is_evicted(self):
+        first, second = self.put('a.jpg'), self.put('b.jpg')
+        os.utime(first, (1, 1))
+        os.utime(second, (2, 2))
+        self.cache.get('default-bucket', 'a.jpg', 3)
+
+        self.put('c.jpg')
+
+        self.assertTrue(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_pinned_objects_are_evicted_last(self):
+        pinned = self.put('media/thumbnails/a.jpg')
+        os.utime(pinned, (1, 1))
+        self.put('b.jpg')
+
+        self.put('c.jpg')
+
+        self.assertTrue(os.path.exists(pinned))
+        self.assertEqual(self.cache.stats()['pinned_bytes'], 1000)
+
+    def test_large_objects_are_not_cached(self):
+        self.assertIsNone(self.put('video.mp4', size=5000))
+
+    def test_concurrent_misses_download_once(self):
+        blob = self.blobs['a.jpg'] = FakeBlob(b'a' * 1000)
+        started, release = threading.Event(), threading.Event()
+        downloads = []
+        download = blob.download_as_bytes
+
+        def slow_download(*args, **kwargs):
+            downloads.append(args)
+            started.set()
+            release.wait(5)
+            return download(*args, **kwargs)
+
+        blob.download_as_bytes = slow_download
+        metadata = storage.blob_metadata(blob)
+        paths = []
+        threads = [threading.Thread(target=lambda: paths.append(
+            self.cache.get_or_fetch('default-bucket', 'a.jpg', metadata)
+        )) for _ in range(3)]
+
+        # The others miss while the first download is still running
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(downloads), 1)
+        self.assertEqual(len(set(paths)), 1)
+        self.assertEqual(self.cache.used_bytes(), 1000)
+
+    def test_size_is_a_running_total(self):
+        self.put('a.jpg')
+
+        with mock.patch.object(self.cache, '_entries', side_effect=AssertionError('rescanned')):
+            self.put('b.jpg')
+            self.put('c.jpg', size=100)
+            self.assertEqual(self.cache.used_bytes(), 2100)
+
+        reopened = ObjectDiskCache(self.cache.root, max_bytes=2500, max_object_size=2000)
+        self.assertEqual(reopened.used_bytes(), 2100)
+
+    def test_worker_processes_share_one_budget(self):
+        other_worker = ObjectDiskCache(self.cache.root, max_bytes=2500, max_object_size=2000)
+        self.put('a.jpg')
+        self.blobs['b.jpg'] = FakeBlob(b'b' * 1000)
+        other_worker.get_or_fetch('default-bucket', 'b.jpg', storage.blob_metadata(self.blobs['b.jpg']))
+
+        self.put('c.jpg')
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['evictions'], stats['bytes_used']), (1, 2000))
+        self.assertEqual(other_worker.used_bytes(), 2000)
+
+    def test_eviction_measures_the_disk_without_blocking_lookups(self):
+        self.put('a.jpg')
+        self.put('b.jpg')
+        # A file removed behind the cache's back
+        os.remove(self.cache.get('default-bucket', 'a.jpg', 3))
+        scan = self.cache._entries
+
+        def unlocked_scan():
+            self.assertFalse(self.cache._lock.locked())
+            return scan()
+
+        with mock.patch.object(self.cache, '_entries', side_effect=unlocked_scan):
+            self.assertEqual(self.cache.evict(), 0)
+
+        self.assertEqual(self.cache.used_bytes(), 1000)
+
+
+class CachedProtectedFileTests(StandInObjectStoreMixin, SimpleTestCase):
+    """serve_protected_file reads repeat downloads from the disk cache"""
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings_override = override_settings(OBJECT_CACHE_DIR=root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.downloads = 0
+        download = self.blob.download_as_bytes
+
+        def counting_download(*args, **kwargs):
+            self.downloads += 1
+            return download(*args, **kwargs)
+        self.blob.download_as_bytes = counting_download
+
+    def test_repeat_downloads_are_served_locally(self):
+        self.assertEqual(self.read(self.get()), self.content)
+        downloads = self.downloads
+
+        response = self.get(HTTP_RANGE='bytes=100-199')
+
+        self.assertEqual(self.read(response), self.content[100:200])
+        self.assertEqual(self.downloads, downloads)
+
+    def cached_files(self):
+        return [filename for _, _, filenames in os.walk(os.path.join(settings.OBJECT_CACHE_DIR, 'lru'))
+                for filename in filenames]
+
+    def test_miss_is_streamed_while_filling_the_cache(self):
+        chunks = iter(self.get().streaming_content)
+
+        self.assertEqual(next(chunks), self.content[:1000])
+        self.assertEqual(self.downloads, 1)
+        self.assertEqual(self.cached_files(), [])
+
+        self.assertEqual(self.content[1000:], b''.join(chunks))
+        self.assertEqual(len(self.cached_files()), 1)
+        self.assertEqual(self.downloads, 11)
+
+    def test_abandoned_download_is_not_cached(self):
+        response = self.get()
+        chunks = iter(response.streaming_content)
+        next(chunks)
+
+        response.close()
+
+        self.assertEqual(self.cached_files(), [])
+        self.assertEqual(os.listdir(os.path.join(settings.OBJECT_CACHE_DIR, 'tmp')), [])
+        self.assertEqual(self.read(self.get()), self.content)
+        self.assertEqual(len(self.cached_files()), 1)
+
+    def test_partial_miss_fills_the_cache_in_the_background(self):
+        with mock.patch('images.processing.submit_task') as submit:
+            self.assertEqual(self.read(self.get(HTTP_RANGE='bytes=100-199')), self.content[100:200])
+
+        func, *args = submit.call_args.args
+        func(*args)
+
+        self.assertEqual(len(self.cached_files()), 1)
+        downloads = self.downloads
+        self.read(self.get(HTTP_RANGE='bytes=100-199'))
+        self.assertEqual(self.downloads, downloads)
+
+    @override_settings(PROTECTED_FILE_OFFLOAD='x-sendfile')
+    def test_cached_file_is_sent_by_the_proxy(self):
+        self.read(self.get())
+
+        response = self.get()
+
+        self.assertTrue(os.path.isfile(response['X-Sendfile']))
+
+
+class CloudStorageEmulatorTests(TestCase):
+    """ReplitAppStorage saving and reading files through the local storage emulator"""
+
+    content = bytes(range(256)) * 4000
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings_override = override_settings(
+            CLOUD_STORAGE_EMULATOR_ROOT=root.name, USE_CLOUD_STORAGE=True,
+            FILE_STREAM_CHUNK_SIZE=64 * 1024, CLOUD_STORAGE_UPLOAD_CHUNK_SIZE=256 * 1024
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        patcher = mock.patch.object(storage, '_storage_client', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+        self.storage = storage.ReplitAppStorage()
+        self.name = self.storage.save('images/photo.jpg', ContentFile(self.content))
+
+    def test_save_and_open_round_trip(self):
+        with self.storage.open(self.name) as f:
+            self.assertEqual(f.size, len(self.content))
+            self.assertEqual(b''.join(f.chunks()), self.content)
+
+        stored = StoredObject.objects.get()
+        self.assertEqual((stored.bucket, stored.object_name, stored.visibility, stored.content_type),
+                         ('default-bucket', 'private/media/images/photo.jpg', 'private', 'image/jpeg'))
+        self.assertEqual(self.storage.url(self.name), '/api/files/private/media/images/photo.jpg')
+
+    def test_existing_names_are_not_overwritten(self):
+        second = self.storage.save('images/photo.jpg', ContentFile(b'other'))
+
+        self.assertNotEqual(second, self.name)
+        self.assertEqual(self.storage.size(self.name), len(self.content))
+
+    def test_saved_file_is_served_to_guests(self):
+        request = APIRequestFactory().get('/', HTTP_RANGE='bytes=1000-1999')
+        force_authenticate(request, user=User.objects.create_user('guest', password='x'))
+
+        response = views.serve_protected_file(request, 'private/media/images/photo.jpg')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[1000:2000])
+
+    def test_local_file_path_copies_to_a_temporary_file(self):
+        with storage.local_file_path(self.name, self.storage) as path:
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), self.content)
+
+        self.assertFalse(os.path.exists(path))
+
+    def test_delete_removes_object_and_index_row(self):
+        self.assertTrue(self.storage.delete(self.name))
+
+        self.assertFalse(self.storage.exists(self.name))
+        self.assertFalse(StoredObject.objects.exists())
+
+
+class ContentDeduplicationTests(TestCase):
+    """Identical uploads share one stored original, thumbnail and face detections"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        patcher = mock.patch.object(models, 'submit_task')
+        self.submit_task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user('guest', password='x')
+        self.photo = self.jpeg(seed=1)
+
+    @staticmethod
+    def jpeg(seed):
+        import cv2
+        image, _ = synthesize_face_image(64, 48, face_count=1, seed=seed)
+        return cv2.imencode('.jpg', image)[1].tobytes()
+
+    def upload(self, data=None, name='IMG_0001.jpg'):
+        return models.Image.objects.create(
+            title=name, uploader=self.user, image_file=SimpleUploadedFile(name, data or self.photo)
+        )
+
+    def test_duplicate_upload_reuses_stored_original(self):
+        first = self.upload()
+        second = self.upload(name='copy.jpg')
+
+        self.assertEqual(second.image_file.name, first.image_file.name)
+        self.assertTrue(first.image_file.name.startswith('originals/'))
+        self.assertEqual(models.ContentBlob.objects.get().ref_count, 2)
+
+    def test_duplicate_of_processed_photo_skips_detection(self):
+        first = self.upload()
+        first._store_thumbnail('thumb.jpg', b'thumbnail')
+        models.Image.objects.filter(pk=first.pk).update(faces_detected_at=timezone.now())
+
+        second = self.upload()
+
+        self.assertEqual(second.thumbnail.name, first.thumbnail.name)
+        task = self.submit_task.call_args[0]
+        self.assertEqual((task[0].__name__, task[1]), ('_copy_face_detections', first))
+
+    def test_shared_files_are_deleted_with_the_last_reference(self):
+        first, second = self.upload(), self.upload()
+        path = first.image_file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(models.ContentBlob.objects.exists())
+
+    def test_different_photos_are_stored_separately(self):
+        first = self.upload()
+        second = self.upload(self.jpeg(seed=2))
+
+        self.assertNotEqual(first.image_file.name, second.image_file.name)
+        self.assertEqual(models.ContentBlob.objects.count(), 2)
+
+    def test_unshared_thumbnail_of_processed_copy_is_not_reused(self):
+        first = self.upload()
+        models.Image.objects.filter(pk=first.pk).update(
+            thumbnail='thumbnails/own.jpg', faces_detected_at=timezone.now()
+        )
+
+        second = self.upload()
+
+        self.assertFalse(second.thumbnail)
+        self.assertEqual(self.submit_task.call_args[0][0].__name__, '_copy_face_detections')
+
+    def test_replacing_the_file_releases_the_old_content(self):
+        image = self.upload()
+        old_path = image.image_file.path
+        image._store_thumbnail('thumb.jpg', b'thumbnail')
+        old_thumbnail = image.thumbnail.path
+
+        image.image_file = SimpleUploadedFile('new.jpg', self.jpeg(seed=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+
+        self.assertFalse(os.path.exists(old_path))
+        self.assertFalse(os.path.exists(old_thumbnail))
+        self.assertFalse(image.thumbnail)
+        self.assertEqual(models.ContentBlob.objects.get().pk, image.content_id)
+
+    def test_replacing_a_file_without_content_deletes_it(self):
+        image = self.upload()
+        models.ContentBlob.objects.all().delete()
+        image.refresh_from_db()
+        old_path = image.image_file.path
+
+        image.image_file = SimpleUploadedFile('new.jpg', self.jpeg(seed=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(image.image_file.path))
+
+
+class DirectUploadTests(TestCase):
+    """Presigned direct-to-storage uploads completed against the local storage emulator"""
+
+    photo = bytes(range(256)) * 300
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings_override = override_settings(
+            CLOUD_STORAGE_EMULATOR_ROOT=root.name, USE_CLOUD_STORAGE=True, FILE_STREAM_CHUNK_SIZE=16 * 1024,
+            STORAGES={**settings.STORAGES, 'default': {'BACKEND': 'images.storage.ReplitAppStorage'}}
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        for patcher in (mock.patch.object(storage, '_storage_client', None), mock.patch.object(models, 'submit_task')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cache.clear()
+
+        self.user = User.objects.create_user('guest', password='x')
+
+    def start(self, data=None, **fields):
+        data = data or self.photo
+        request = APIRequestFactory().post('/api/uploads/', {
+            'filename': 'IMG_0001.jpg', 'size': len(data), 'content_type': 'image/jpeg',
+            'sha256': hashlib.sha256(data).hexdigest(), **fields
+        }, format='json')
+        force_authenticate(request, user=self.user)
+        return views.create_direct_upload(request)
+
+    def put(self, upload_url, data):
+        token = upload_url.rsplit('/', 1)[1]
+        request = RequestFactory().put(upload_url, data=data, content_type='image/jpeg')
+        return views.storage_emulator_upload(request, token)
+
+    def complete(self, upload_id):
+        request = APIRequestFactory().post(f'/api/uploads/{upload_id}/complete/')
+        force_authenticate(request, user=self.user)
+        return views.complete_direct_upload(request, upload_id)
+
+    def verify(self, upload_id):
+        """Complete an upload and run its verification job in this thread"""
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 202)
+        job = models.ProcessingJob.objects.get(pk=response.data['job_id'])
+        job.run()
+        return job
+
+    def test_completion_queues_verification_and_creates_image(self):
+        started = self.start(title='First dance')
+        self.assertEqual(started.status_code, 201)
+        self.assertEqual(self.put(started.data['upload_url'], self.photo).status_code, 200)
+
+        response = self.complete(started.data['upload_id'])
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status_url'], f"/api/jobs/{response.data['job_id']}/")
+        self.assertEqual(models.UploadSession.objects.get().status, 'verifying')
+        self.assertFalse(models.Image.objects.exists())
+
+        # Completing again while verifying points at the same job
+        self.assertEqual(self.complete(started.data['upload_id']).data['job_id'], response.data['job_id'])
+
+        job = models.ProcessingJob.objects.get(pk=response.data['job_id'])
+        job.run()
+
+        self.assertEqual((job.kind, job.status), ('verify_upload', 'completed'))
+        image = models.Image.objects.get(pk=job.result['image_id'])
+        session = models.UploadSession.objects.get()
+        self.assertEqual((image.title, image.image_file.name), ('First dance', session.file_name))
+        self.assertEqual(image.content.sha256, hashlib.sha256(self.photo).hexdigest())
+        self.assertEqual((session.status, session.image_id), ('completed', image.pk))
+        self.assertEqual(StoredObject.objects.get().size, len(self.photo))
+        self.assertEqual(models.submit_task.call_args[0][0].__name__, '_async_detect_and_store_face_coordinates')
+
+        # Retrying the completion does not create a second Image
+        self.assertEqual(self.complete(session.pk).data['image_id'], image.pk)
+        self.assertEqual(models.Image.objects.count(), 1)
+
+    def test_upload_not_matching_declared_hash_is_rejected(self):
+        started = self.start()
+        self.put(started.data['upload_url'], self.photo[::-1])
+
+        job = self.verify(started.data['upload_id'])
+
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('SHA-256', job.error)
+        session = models.UploadSession.objects.get()
+        self.assertEqual(session.status, 'failed')
+        self.assertFalse(storage.ReplitAppStorage().exists(session.file_name))
+        self.assertFalse(models.Image.objects.exists())
+
+    def test_upload_of_wrong_size_is_rejected_without_a_job(self):
+        started = self.start()
+        self.put(started.data['upload_url'], self.photo[:-1])
+
+        response = self.complete(started.data['upload_id'])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(models.UploadSession.objects.get().status, 'failed')
+        self.assertFalse(models.ProcessingJob.objects.exists())
+
+    def test_failed_verification_returns_session_to_pending(self):
+        started = self.start()
+        self.put(started.data['upload_url'], self.photo)
+
+        with mock.patch.object(direct_uploads, 'iter_blob_chunks', side_effect=OSError('connection reset')):
+            job = self.verify(started.data['upload_id'])
+
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(models.UploadSession.objects.get().status, 'pending')
+        self.assertEqual(self.verify(started.data['upload_id']).status, 'completed')
+
+    def test_completion_before_upload_leaves_session_pending(self):
+        started = self.start()
+
+        response = self.complete(started.data['upload_id'])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(models.UploadSession.objects.get().status, 'pending')
+
+    def test_upload_of_stored_photo_is_linked_to_existing_copy(self):
+        first = models.Image.objects.create(
+            title='first', uploader=self.user, image_file=SimpleUploadedFile('IMG_0001.jpg', self.photo)
+        )
+        started = self.start()
+        self.put(started.data['upload_url'], self.photo)
+
+        image = models.Image.objects.get(pk=self.verify(started.data['upload_id']).result['image_id'])
+
+        self.assertEqual(image.image_file.name, first.image_file.name)
+        self.assertEqual(models.ContentBlob.objects.get().ref_count, 2)
+        self.assertFalse(storage.ReplitAppStorage().exists(models.UploadSession.objects.get().file_name))
+
+    def test_expired_sessions_are_cleaned_up(self):
+        started = self.start()
+        self.put(started.data['upload_url'], self.photo)
+        models.UploadSession.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+
+        call_command('expire_upload_sessions', stdout=StringIO())
+
+        session = models.UploadSession.objects.get()
+        self.assertEqual(session.status, 'expired')
+        self.assertFalse(storage.ReplitAppStorage().exists(session.file_name))
+        self.assertEqual(self.complete(session.pk).status_code, 410)
+
+    def test_invalid_upload_tokens_are_refused(self):
+        started = self.start()
+
+        response = self.put(started.data['upload_url'] + 'x', self.photo)
+
+        self.assertEqual(response.status_code, 403)
+
+
+@unittest.skipUnless(os.environ.get('FACE_BENCHMARK'), 'set FACE_BENCHMARK=1 to run the face pipeline benchmarks')
+class FacePipelineBenchmarkTests(SimpleTestCase):
+    """Full benchmark run compared against the saved baseline"""
+
+    def test_no_regressions_against_baseline(self):
+        baseline = load_baseline(settings.FACE_BENCHMARK_BASELINE)
+        if baseline is None:
+            self.skipTest(f'no baseline at {settings.FACE_BENCHMARK_BASELINE}; '
+                          'run python manage.py benchmark_faces --save-baseline')
+
+        results = run_face_benchmarks(repeat=int(os.environ.get('FACE_BENCHMARK_REPEAT', 5)))
+        regressions = find_regressions(
+            results, baseline, threshold=settings.FACE_BENCHMARK_REGRESSION_THRESHOLD
+        )
+
+        self.assertEqual(regressions, [], '\n'.join(
+            f"{r['name']}: {r['baseline']:.2f} ms -> {r['current']:.2f} ms (+{r['change']:.0%})"
+            for r in regressions
+        ))
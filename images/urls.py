@@ -1,5 +1,6 @@
 from django.urls import path, re_path
 from . import views
+from . import face_views
 from django.views.generic import TemplateView
 from django.conf import settings
 import os
@@ -18,6 +19,34 @@ urlpatterns = [
     path('api/images/<int:image_id>/like/', views.toggle_like, name='toggle-like'),
     path('api/auth/liked-images/', views.user_liked_images, name='user-liked-images'),
     
+    # Face detection endpoints (detection runs as a background job)
+    path('api/images/<int:image_id>/detect-faces/', face_views.detect_faces_in_image, name='detect-faces'),
+    path('api/jobs/<uuid:job_id>/', face_views.processing_job_detail, name='processing-job-detail'),
+    
+    # People and face tag endpoints
+    path('api/people/', face_views.PersonListCreateView.as_view(), name='person-list-create'),
+    path('api/people/<int:pk>/', face_views.PersonDetailView.as_view(), name='person-detail'),
+    path('api/people/<int:person_id>/images/', face_views.person_images, name='person-images'),
+    path('api/images/<int:image_id>/face-tags/', face_views.FaceTagListCreateView.as_view(), name='face-tag-list-create'),
+    path('api/face-tags/batch/', face_views.face_tags_for_images, name='face-tags-batch'),
+    path('api/face-tags/<int:pk>/', face_views.FaceTagDetailView.as_view(), name='face-tag-detail'),
+    path('api/images/<int:image_id>/suggest-tags/', face_views.suggest_auto_tags, name='suggest-auto-tags'),
+    path('api/apply-auto-tag/', face_views.apply_auto_tag_suggestion, name='apply-auto-tag'),
+    
+    # Face tag moderation endpoints
+    path('api/admin/pending-tags/', face_views.pending_tags_list, name='pending-tags'),
+    path('api/admin/moderation-queue/', face_views.moderation_queue, name='moderation-queue'),
+    path('api/admin/face-tags/<int:tag_id>/approve/', face_views.approve_face_tag, name='approve-face-tag'),
+    path('api/admin/face-tags/<int:tag_id>/reject/', face_views.reject_face_tag, name='reject-face-tag'),
+    path('api/admin/bulk-approve-tags/', face_views.bulk_approve_tags, name='bulk-approve-tags'),
+    path('api/admin/bulk-reject-tags/', face_views.bulk_reject_tags, name='bulk-reject-tags'),
+    
+    # Face clustering admin endpoints
+    path('api/admin/face-clusters/', face_views.face_cluster_list, name='face-cluster-list'),
+    path('api/admin/face-clusters/run/', face_views.run_face_clustering, name='face-cluster-run'),
+    path('api/admin/face-clusters/<int:cluster_id>/assign/', face_views.assign_face_cluster, name='face-cluster-assign'),
+    path('api/admin/face-clusters/<int:cluster_id>/dismiss/', face_views.dismiss_face_cluster, name='face-cluster-dismiss'),
+    
     # Image stats endpoints
     path('api/images/count/', views.get_image_count, name='image-count'),
     path('api/auth/upload-count/', views.get_user_upload_count, name='user-upload-count'),
@@ -42,6 +71,10 @@ urlpatterns = [
     path('api/cloud/set-acl/', views.set_file_acl, name='set-file-acl'),
     path('api/cloud/files/', views.list_user_files, name='list-user-files'),
     path('api/files/<path:file_path>', views.serve_protected_file, name='serve-protected-file'),
+    path('api/uploads/', views.create_direct_upload, name='create-direct-upload'),
+    path('api/uploads/<uuid:upload_id>/complete/', views.complete_direct_upload, name='complete-direct-upload'),
+    path('api/storage-emulator/upload/<str:token>', views.storage_emulator_upload, name='storage-emulator-upload'),
+    path('api/admin/object-cache/', views.object_cache_stats, name='object-cache-stats'),
     
     # Serve React frontend for all non-API and non-media routes
     re_path(r'^(?!(api/|media/|admin/)).*$', views.serve_frontend, name='frontend'),
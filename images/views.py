@@ -4,21 +4,43 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.pagination import PageNumberPagination
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.db.models import Q
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.cache import cache_page
 from django.utils.decorators import method_decorator
 from django.core.cache import cache
-from django.http import JsonResponse, HttpResponse, Http404
+from django.http import (
+    JsonResponse, HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed, HttpResponseNotModified, Http404
+)
+from django.core import signing
+from django.urls import reverse
+from django.utils.text import get_valid_filename
+from django.utils._os import safe_join
+from django.utils.http import quote_etag
 from django.conf import settings
 import json
+import re
 import uuid
 import requests
 import os
+import mimetypes
+import posixpath
+from pathlib import Path
+from datetime import timedelta
 from django.utils import timezone
-from .models import Image, Comment, Tag, UserProfile, InvitationCode, Like, EmailVerificationToken, PasswordResetToken
+from .models import (
+    Image, Comment, Tag, UserProfile, InvitationCode, Like, EmailVerificationToken, PasswordResetToken,
+    StoredObject, UploadSession, ProcessingJob
+)
 from .serializers import ImageSerializer, ImageCreateSerializer, CommentSerializer, UserSerializer, TagSerializer
-from .storage import ReplitAppStorage, FileAccessControl
+from .storage import (
+    ReplitAppStorage, FileAccessControl, get_blob_metadata, get_object_metadata, get_storage_client,
+    invalidate_blob_metadata, iter_blob_chunks
+)
+from .file_serving import ranged_response, is_not_modified, iter_file_chunks, media_file_etag, offload_response
+from .object_cache import get_object_cache
+from .processing import enqueue_processing_job
 
 
 class ImagePagination(PageNumberPagination):
@@ -184,6 +206,11 @@ class ImageDetailView(generics.RetrieveUpdateDestroyAPIView):
         return super().partial_update(request, *args, **kwargs)
     
     def perform_destroy(self, instance):
+        # Deduplicated originals are shared; the post_delete signal releases
+        # them and deletes the files once no image uses them
+        if instance.content_id:
+            return super().perform_destroy(instance)
+        
         # Delete the physical files when deleting the database record
         if instance.image_file:
             try:
@@ -733,21 +760,34 @@ def set_file_acl(request):
                 'error': 'Invalid upload URL format'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        # Users may only claim objects under the upload prefix get_upload_url
+        # gave them; anything else would let them take over other files
+        own_bucket, own_prefix = storage._get_bucket_and_object_name(
+            f"{storage.private_object_dir}/users/{request.user.pk}/"
+        )
+        if bucket_name != own_bucket or not object_name.startswith(own_prefix) or '..' in object_name.split('/'):
+            return Response({
+                'error': 'You can only set permissions on your own uploads'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
         # Set ACL policy for the file
-        storage._set_object_acl_policy(
+        metadata = storage._set_object_acl_policy(
             bucket_name, 
             object_name, 
             str(request.user.pk), 
             is_public
         )
         
+        # Mirror it in the object index used for access checks and listings
+        StoredObject.record(bucket_name, object_name, metadata)
+        
         # Generate normalized object path for client use
         normalized_path = f"/objects/{object_name}"
         
         return Response({
             'success': True,
             'object_path': normalized_path,
-            'access_url': storage.url(normalized_path)
+            'access_url': storage.url(f"/{bucket_name}/{object_name}")
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -760,6 +800,214 @@ def set_file_acl(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+SHA256_HEX = re.compile(r'^[0-9a-f]{64}$')
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def create_direct_upload(request):
+    """
+    Start a direct-to-storage upload of an original photo.
+    
+    Body: filename, size, sha256 (hex digest of the file), content_type and
+    optionally title and description. Returns a presigned URL the client
+    PUTs the file to, so large originals never pass through an app worker,
+    then the client calls complete_url.
+    """
+    try:
+        if not getattr(settings, 'USE_CLOUD_STORAGE', False):
+            return Response({
+                'error': 'Cloud storage is not enabled'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        
+        user = request.user
+        if not hasattr(user, 'profile'):
+            UserProfile.objects.create(user=user)
+        
+        if not user.profile.can_upload_images:
+            return Response({
+                'error': "You don't have permission to upload images."
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        filename = get_valid_filename(os.path.basename(str(request.data.get('filename', ''))))
+        content_type = str(request.data.get('content_type', ''))
+        sha256 = str(request.data.get('sha256', '')).lower()
+        max_size = getattr(settings, 'DIRECT_UPLOAD_MAX_SIZE', 200 * 1024 * 1024)
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            size = 0
+        
+        if not filename:
+            return Response({'error': 'filename is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not content_type.startswith('image/'):
+            return Response({'error': 'Only images can be uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < size <= max_size:
+            return Response({
+                'error': f'size must be between 1 and {max_size} bytes'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if not SHA256_HEX.match(sha256):
+            return Response({'error': 'sha256 must be a hex SHA-256 digest'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        upload_id = uuid.uuid4()
+        now = timezone.now()
+        url_ttl = getattr(settings, 'DIRECT_UPLOAD_URL_TTL', 900)
+        session = UploadSession.objects.create(
+            id=upload_id,
+            user=user,
+            file_name=f"uploads/{user.pk}/{upload_id.hex}/{filename}",
+            original_filename=filename,
+            content_type=content_type,
+            expected_size=size,
+            expected_sha256=sha256,
+            title=str(request.data.get('title', ''))[:200],
+            description=str(request.data.get('description', '')),
+            expires_at=now + timedelta(seconds=getattr(settings, 'DIRECT_UPLOAD_SESSION_TTL', 3600))
+        )
+        
+        storage = ReplitAppStorage()
+        bucket_name, object_name = storage._get_bucket_and_object_name(storage._object_path(session.file_name))
+        upload_url = storage._get_presigned_upload_url(bucket_name, object_name, url_ttl)
+        
+        return Response({
+            'upload_id': str(session.id),
+            'upload_url': upload_url,
+            'method': 'PUT',
+            'headers': {'Content-Type': content_type},
+            'expires_at': (now + timedelta(seconds=url_ttl)).isoformat(),
+            'complete_url': f"/api/uploads/{session.id}/complete/"
+        }, status=status.HTTP_201_CREATED)
+        
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f'Failed to start direct upload for user {request.user.pk}: {str(e)}')
+        
+        return Response({
+            'error': 'Failed to start upload. Please try again.'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _verification_accepted(session, job):
+    """202 response pointing at the job verifying a direct upload"""
+    return Response({
+        'upload_id': str(session.id),
+        'status': 'verifying',
+        'job_id': str(job.id),
+        'status_url': reverse('processing-job-detail', args=[job.id])
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def complete_direct_upload(request, upload_id):
+    """
+    Finish a direct upload: check the stored object against the declared
+    size, then queue a 'verify_upload' job that checks its SHA-256 and
+    creates the Image on the processing pool.
+    
+    Returns 202 with a status_url (GET /api/jobs/{job_id}/) whose result
+    holds the image_id once verified. The session stays 'verifying' until
+    the job finishes; completing it again meanwhile returns the same job.
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    session = UploadSession.objects.filter(pk=upload_id, user=request.user).first()
+    if session is None:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if session.status == 'completed':
+        return Response({
+            'upload_id': str(session.id),
+            'status': session.status,
+            'image_id': session.image_id
+        }, status=status.HTTP_200_OK)
+    
+    if session.status == 'verifying':
+        job = ProcessingJob.objects.filter(kind='verify_upload', options={'upload_id': str(session.id)}).first()
+        if job is not None:
+            return _verification_accepted(session, job)
+    
+    storage = ReplitAppStorage()
+    bucket_name, object_name = storage._get_bucket_and_object_name(storage._object_path(session.file_name))
+    
+    if session.status == 'pending' and session.is_expired:
+        storage.delete(session.file_name)
+        session.fail('Upload session expired', status='expired')
+    if session.status != 'pending':
+        return Response({
+            'error': f'Upload is {session.get_status_display().lower()}'
+        }, status=status.HTTP_410_GONE if session.status == 'expired' else status.HTTP_409_CONFLICT)
+    
+    # Claim the session so a retried request cannot create a second Image
+    if not UploadSession.objects.filter(pk=session.pk, status='pending').update(status='verifying'):
+        return Response({'error': 'Upload is already being completed'}, status=status.HTTP_409_CONFLICT)
+    
+    try:
+        invalidate_blob_metadata(bucket_name, object_name)
+        metadata = get_blob_metadata(bucket_name, object_name)
+        if metadata is None:
+            UploadSession.objects.filter(pk=session.pk).update(status='pending')
+            return Response({
+                'error': 'The file has not been uploaded yet'
+            }, status=status.HTTP_409_CONFLICT)
+        
+        if metadata['size'] != session.expected_size:
+            error = f"Uploaded {metadata['size']} bytes, expected {session.expected_size}"
+            storage.delete(session.file_name)
+            session.fail(error)
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Hashing reads the whole object back from storage, so it runs on
+        # the processing pool instead of tying up this worker
+        with transaction.atomic():
+            job = ProcessingJob.objects.create(
+                kind='verify_upload',
+                options={'upload_id': str(session.id)},
+                requested_by=request.user
+            )
+            enqueue_processing_job(job)
+        
+        return _verification_accepted(session, job)
+        
+    except Exception as e:
+        logger.error(f'Failed to complete direct upload {session.pk}: {str(e)}')
+        UploadSession.objects.filter(pk=session.pk, status='verifying').update(status='pending')
+        
+        return Response({
+            'error': 'Failed to complete upload. Please try again.'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+def storage_emulator_upload(request, token):
+    """
+    PUT target of the storage emulator's presigned upload URLs, so direct
+    uploads work in development and tests. Not found unless
+    CLOUD_STORAGE_EMULATOR_ROOT is set.
+    """
+    if not getattr(settings, 'CLOUD_STORAGE_EMULATOR_ROOT', ''):
+        raise Http404("Storage emulator is not enabled")
+    if request.method != 'PUT':
+        return HttpResponseNotAllowed(['PUT'])
+    
+    from .storage_emulator import EmulatorClient
+    try:
+        bucket_name, object_name = EmulatorClient.unsign_upload_token(token)
+    except signing.BadSignature:
+        return HttpResponseForbidden('Invalid or expired upload URL')
+    
+    blob = get_storage_client().bucket(bucket_name).blob(object_name)
+    blob.upload_from_file(
+        request,
+        size=int(request.META.get('CONTENT_LENGTH') or 0),
+        content_type=request.content_type or None
+    )
+    invalidate_blob_metadata(bucket_name, object_name)
+    return HttpResponse(status=200)
+
+
 @api_view(['GET'])
 def serve_protected_file(request, file_path):
     """
@@ -772,15 +1020,16 @@ def serve_protected_file(request, file_path):
         
         storage = ReplitAppStorage()
         
-        # Get the file from cloud storage
+        # One indexed lookup in the object index gives existence, ACL policy,
+        # size, content type, etag and modification time
         full_path = f"/objects/{file_path}"
-        object_file = storage._storage_client.bucket('default-bucket').blob(file_path)
+        metadata = get_object_metadata('default-bucket', file_path)
         
-        if not object_file.exists():
+        if not metadata:
             raise Http404("File not found")
         
         # Get ACL policy and check access
-        acl_policy = FileAccessControl.get_file_acl_policy('default-bucket', file_path)
+        acl_policy = metadata['acl_policy']
         
         if not acl_policy:
             raise Http404("File not found")
@@ -795,22 +1044,68 @@ def serve_protected_file(request, file_path):
         if not can_access:
             return HttpResponse('Unauthorized', status=401)
         
-        # Stream the file to the client
-        response = HttpResponse(content_type='application/octet-stream')
-        
-        # Get file metadata for proper content type
-        object_file.reload()
-        if hasattr(object_file, 'content_type') and object_file.content_type:
-            response['Content-Type'] = object_file.content_type
-        
         # Set caching headers based on file visibility
         is_public = acl_policy.get('visibility') == 'public'
         cache_control = 'public, max-age=3600' if is_public else 'private, max-age=3600'
-        response['Cache-Control'] = cache_control
         
-        # Stream file content
-        for chunk in object_file.download_as_bytes(chunk_size=8192):
-            response.write(chunk)
+        # Revalidations are answered from the metadata, without touching the object
+        etag = quote_etag(metadata['etag']) if metadata['etag'] else None
+        if is_not_modified(request, etag, metadata['updated']):
+            response = HttpResponseNotModified()
+            if etag:
+                response['ETag'] = etag
+            response['Cache-Control'] = cache_control
+            return response
+        
+        content_type = metadata['content_type'] or 'application/octet-stream'
+        
+        # Hot objects are served from the local disk cache. Misses are
+        # streamed from the bucket, filling the cache as they go.
+        object_cache = get_object_cache()
+        local_path = object_cache.lookup('default-bucket', file_path, metadata) if object_cache else None
+        
+        # Hand the download to the front-end proxy so this worker is freed
+        # immediately; nginx sends the cached copy, or fetches the object
+        # through a short-lived signed URL
+        offload = getattr(settings, 'PROTECTED_FILE_OFFLOAD', '')
+        if offload:
+            response = None
+            if local_path:
+                response = offload_response(offload, content_type, local_path=local_path)
+            if response is None and offload == 'x-accel-redirect':
+                signed_url = storage._get_presigned_download_url(
+                    'default-bucket', file_path, getattr(settings, 'PROTECTED_FILE_SIGNED_URL_TTL', 300)
+                )
+                response = offload_response(offload, content_type, signed_url=signed_url)
+                if object_cache:
+                    object_cache.fetch_in_background('default-bucket', file_path, metadata)
+            if response is not None:
+                response['Cache-Control'] = cache_control
+                return response
+        
+        # Stream the file (or the requested byte ranges) to the client in
+        # fixed-size ranged reads, so worker memory stays at one chunk
+        # regardless of object size. Reads are pinned to the generation the
+        # headers describe.
+        if local_path:
+            read_range = lambda start, end: iter_file_chunks(local_path, start, end)
+        else:
+            object_file = storage.storage_client.bucket('default-bucket').blob(
+                file_path, generation=metadata['generation']
+            )
+            read_range = lambda start, end: iter_blob_chunks(object_file, start=start, end=end)
+            if object_cache:
+                read_range = object_cache.filling_reader('default-bucket', file_path, metadata, read_range)
+        
+        response = ranged_response(
+            request,
+            size=metadata['size'],
+            content_type=content_type,
+            read_range=read_range,
+            etag=etag,
+            last_modified=metadata['updated']
+        )
+        response['Cache-Control'] = cache_control
         
         return response
         
@@ -823,12 +1118,48 @@ def serve_protected_file(request, file_path):
         raise Http404("File not found")
 
 
+def serve_media(request, path):
+    """
+    Serve a local media file with byte-range support.
+    Used in place of django.views.static.serve when DEBUG is on, so seeking
+    in videos and resumed downloads work locally as they do from the cloud.
+    """
+    fullpath = Path(safe_join(settings.MEDIA_ROOT, posixpath.normpath(path).lstrip('/')))
+    if not fullpath.is_file():
+        raise Http404("File not found")
+    
+    statobj = fullpath.stat()
+    etag = media_file_etag(path, statobj)
+    if is_not_modified(request, etag, statobj.st_mtime):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    
+    content_type, encoding = mimetypes.guess_type(str(fullpath))
+    response = ranged_response(
+        request,
+        size=statobj.st_size,
+        content_type=content_type or 'application/octet-stream',
+        read_range=lambda start, end: iter_file_chunks(str(fullpath), start, end),
+        etag=etag,
+        last_modified=statobj.st_mtime
+    )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def list_user_files(request):
     """
     List files uploaded by the authenticated user.
     Provides a way for users to see their uploaded files.
+    
+    GET /api/cloud/files/?cursor=<next_cursor>&page_size=50
+    
+    Newest first, keyset-paginated from the (owner, id) index of the
+    object table.
     """
     try:
         if not getattr(settings, 'USE_CLOUD_STORAGE', False):
@@ -836,12 +1167,42 @@ def list_user_files(request):
                 'files': []
             }, status=status.HTTP_200_OK)
         
-        # This would need to be implemented based on your specific
-        # file tracking mechanism (e.g., database records of uploads)
+        try:
+            page_size = min(max(int(request.GET.get('page_size', 50)), 1), 200)
+            cursor = int(request.GET['cursor']) if request.GET.get('cursor') else None
+        except ValueError:
+            return Response({
+                'error': 'cursor and page_size must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        stored_objects = StoredObject.objects.filter(owner=request.user)
+        if cursor is not None:
+            stored_objects = stored_objects.filter(id__lt=cursor)
+        rows = list(stored_objects.order_by('-id').values(
+            'id', 'bucket', 'object_name', 'visibility', 'size', 'content_type', 'created_at'
+        )[:page_size + 1])
+        
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        
+        storage = ReplitAppStorage()
+        files = []
+        for row in rows:
+            object_path = f"/objects/{row['object_name']}"
+            files.append({
+                'object_path': object_path,
+                'access_url': storage.url(f"/{row['bucket']}/{row['object_name']}"),
+                'filename': posixpath.basename(row['object_name']),
+                'visibility': row['visibility'],
+                'size': row['size'],
+                'content_type': row['content_type'],
+                'created_at': row['created_at'],
+            })
         
         return Response({
-            'files': [],
-            'message': 'File listing feature coming soon'
+            'files': files,
+            'page_size': page_size,
+            'next_cursor': str(rows[-1]['id']) if has_next else None
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -854,6 +1215,25 @@ def list_user_files(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def object_cache_stats(request):
+    """
+    Hit/miss counters and disk usage of the local object cache on this server.
+    Admin only.
+    """
+    object_cache = get_object_cache()
+    if object_cache is None:
+        return Response({
+            'enabled': False
+        }, status=status.HTTP_200_OK)
+    
+    return Response({
+        'enabled': True,
+        **object_cache.stats()
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def send_verification_email(request):